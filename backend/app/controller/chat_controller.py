@@ -1,15 +1,15 @@
-import asyncio
 import os
 import re
 from pathlib import Path
 from dotenv import load_dotenv
-from fastapi import APIRouter, Request, Response
+from fastapi import APIRouter, Header, Response
 from fastapi.responses import StreamingResponse
 from loguru import logger
 from app.utils import traceroot_wrapper as traceroot
 from app.component import code
 from app.exception.exception import UserException
 from app.model.chat import Chat, HumanReply, McpServers, Status, SupplementChat
+from app.service.artifacts import ArtifactStore
 from app.service.chat_service import step_solve
 from app.service.task import (
     Action,
@@ -20,7 +20,7 @@ from app.service.task import (
     create_task_lock,
     get_task_lock,
 )
-from app.component.environment import set_user_env_path
+from app.component.environment import env, set_user_env_path
 
 
 router = APIRouter(tags=["chat"])
@@ -31,7 +31,7 @@ chat_logger = traceroot.get_logger('chat_controller')
 
 @router.post("/chat", name="start chat")
 @traceroot.trace()
-async def post(data: Chat, request: Request):
+async def post(data: Chat):
     chat_logger.info(f"Starting new chat session for task_id: {data.task_id}, user: {data.email}")
     task_lock = create_task_lock(data.task_id)
     
@@ -53,63 +53,80 @@ async def post(data: Chat, request: Request):
 
     os.environ["CAMEL_LOG_DIR"] = str(camel_log)
 
+    if int(env("tool_artifact_chars", "0")) > 0:
+        task_lock.artifacts = ArtifactStore(
+            Path(data.file_save_path()) / ".artifacts",
+            int(env("tool_artifact_chars")),
+            int(env("tool_artifact_preview_chars", "1000")),
+        )
+
     if data.is_cloud():
         os.environ["cloud_api_key"] = data.api_key
     
     chat_logger.info(f"Chat session initialized, starting streaming response for task_id: {data.task_id}")
-    return StreamingResponse(step_solve(data, request, task_lock), media_type="text/event-stream")
+    # The workforce keeps running if the client disconnects, it can reattach via GET /chat/{id}/stream
+    task_lock.start_stream(step_solve(data, task_lock))
+    return StreamingResponse(task_lock.subscribe(), media_type="text/event-stream")
+
+
+@router.get("/chat/{id}/stream", name="reattach chat stream")
+@traceroot.trace()
+async def stream(id: str, last_event_id: int = Header(0, alias="Last-Event-ID")):
+    chat_logger.info(f"Reattaching to task_id: {id} after event {last_event_id}")
+    task_lock = get_task_lock(id)
+    return StreamingResponse(task_lock.subscribe(last_event_id), media_type="text/event-stream")
 
 
 @router.post("/chat/{id}", name="improve chat")
 @traceroot.trace()
-def improve(id: str, data: SupplementChat):
+async def improve(id: str, data: SupplementChat):
     chat_logger.info(f"Improving chat for task_id: {id} with question: {data.question}")
     task_lock = get_task_lock(id)
     if task_lock.status == Status.done:
         raise UserException(code.error, "Task was done")
-    asyncio.run(task_lock.put_queue(ActionImproveData(data=data.question)))
+    await task_lock.put_queue(ActionImproveData(data=data.question))
     chat_logger.info(f"Improvement request queued for task_id: {id}")
     return Response(status_code=201)
 
 
 @router.put("/chat/{id}", name="supplement task")
 @traceroot.trace()
-def supplement(id: str, data: SupplementChat):
+async def supplement(id: str, data: SupplementChat):
     chat_logger.info(f"Supplementing task_id: {id} with additional data")
     task_lock = get_task_lock(id)
     if task_lock.status != Status.done:
         raise UserException(code.error, "Please wait task done")
-    asyncio.run(task_lock.put_queue(ActionSupplementData(data=data)))
+    await task_lock.put_queue(ActionSupplementData(data=data))
     chat_logger.info(f"Supplement data queued for task_id: {id}")
     return Response(status_code=201)
 
 
 @router.delete("/chat/{id}", name="stop chat")
 @traceroot.trace()
-def stop(id: str):
+async def stop(id: str):
     """stop the task"""
     chat_logger.warning(f"Stopping chat session for task_id: {id}")
     task_lock = get_task_lock(id)
-    asyncio.run(task_lock.put_queue(ActionStopData(action=Action.stop)))
+    await task_lock.put_queue(ActionStopData(action=Action.stop))
     chat_logger.info(f"Stop signal sent for task_id: {id}")
     return Response(status_code=204)
 
 
 @router.post("/chat/{id}/human-reply")
 @traceroot.trace()
-def human_reply(id: str, data: HumanReply):
+async def human_reply(id: str, data: HumanReply):
     chat_logger.info(f"Human reply received for task_id: {id}, agent: {data.agent}")
     task_lock = get_task_lock(id)
-    asyncio.run(task_lock.put_human_input(data.agent, data.reply))
+    await task_lock.put_human_input(data.agent, data.reply)
     chat_logger.info(f"Human reply processed for task_id: {id}")
     return Response(status_code=201)
 
 
 @router.post("/chat/{id}/install-mcp")
 @traceroot.trace()
-def install_mcp(id: str, data: McpServers):
+async def install_mcp(id: str, data: McpServers):
     chat_logger.info(f"Installing MCP servers for task_id: {id}, servers count: {len(data.get('mcpServers', {}))}")
     task_lock = get_task_lock(id)
-    asyncio.run(task_lock.put_queue(ActionInstallMcpData(action=Action.install_mcp, data=data)))
+    await task_lock.put_queue(ActionInstallMcpData(action=Action.install_mcp, data=data))
     chat_logger.info(f"MCP installation queued for task_id: {id}")
     return Response(status_code=201)
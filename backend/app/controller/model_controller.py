@@ -1,6 +1,9 @@
 from fastapi import APIRouter
 from pydantic import BaseModel, Field
 from app.component.model_validation import create_agent
+from app.utils.model_pool import model_pool
+from app.utils.model_router import model_router_stats
+from app.utils.response_cache import response_cache_stats
 
 
 router = APIRouter(tags=["model"])
@@ -21,6 +24,21 @@ class ValidateModelResponse(BaseModel):
     message: str = Field(..., description="Message")
 
 
+@router.get("/model/pool", name="model backend pool stats")
+async def pool_stats():
+    return model_pool.stats()
+
+
+@router.get("/model/cache", name="model response cache stats")
+async def cache_stats():
+    return response_cache_stats()
+
+
+@router.get("/model/routes", name="model endpoint routing stats")
+async def route_stats():
+    return model_router_stats()
+
+
 @router.post("/model/validate")
 async def validate_model(request: ValidateModelRequest):
     try:
@@ -13,8 +13,9 @@ from app.service.task import (
     ActionUpdateTaskData,
     get_task_lock,
     task_locks,
+    task_reaper,
 )
-import asyncio
+from app.service.workforce_template import workforce_templates
 from app.component.environment import set_user_env_path
 
 
@@ -22,18 +23,44 @@ router = APIRouter(tags=["task"])
 
 
 @router.post("/task/{id}/start", name="start task")
-def start(id: str):
+async def start(id: str):
     task_lock = get_task_lock(id)
     logger.debug(f"start task {id}")
-    asyncio.run(task_lock.put_queue(ActionStartData(action=Action.start)))
+    await task_lock.put_queue(ActionStartData(action=Action.start))
     logger.debug(f"start task {id} success")
     return Response(status_code=201)
 
 
+@router.get("/task/locks", name="live task locks")
+async def locks():
+    items = [task_lock.lock_stats() for task_lock in list(task_locks.values())]
+    return {
+        "count": len(items),
+        "retained_bytes": sum(item["retained_bytes"] for item in items),
+        "reaper": task_reaper.stats(),
+        "locks": items,
+    }
+
+
+@router.get("/task/templates", name="workforce template stats")
+async def templates():
+    return workforce_templates.stats()
+
+
+@router.get("/task/{id}/queue", name="task queue stats")
+async def queue_stats(id: str):
+    return get_task_lock(id).queue_stats()
+
+
+@router.get("/task/{id}/metrics", name="task token and latency metrics")
+async def metrics(id: str):
+    return get_task_lock(id).metrics.summary()
+
+
 @router.put("/task/{id}", name="update task")
-def put(id: str, data: UpdateData):
+async def put(id: str, data: UpdateData):
     task_lock = get_task_lock(id)
-    asyncio.run(task_lock.put_queue(ActionUpdateTaskData(action=Action.update_task, data=data)))
+    await task_lock.put_queue(ActionUpdateTaskData(action=Action.update_task, data=data))
     return Response(status_code=201)
 
 
@@ -42,23 +69,23 @@ class TakeControl(BaseModel):
 
 
 @router.put("/task/{id}/take-control", name="take control pause or resume")
-def take_control(id: str, data: TakeControl):
+async def take_control(id: str, data: TakeControl):
     task_lock = get_task_lock(id)
-    asyncio.run(task_lock.put_queue(ActionTakeControl(action=data.action)))
+    await task_lock.put_queue(ActionTakeControl(action=data.action))
     return Response(status_code=204)
 
 
 @router.post("/task/{id}/add-agent", name="add new agent")
-def add_agent(id: str, data: NewAgent):
+async def add_agent(id: str, data: NewAgent):
     # Set user-specific environment path for this thread
     set_user_env_path(data.env_path)
     load_dotenv(dotenv_path=data.env_path)
-    asyncio.run(get_task_lock(id).put_queue(ActionNewAgent(**data.model_dump())))
+    await get_task_lock(id).put_queue(ActionNewAgent(**data.model_dump()))
     return Response(status_code=204)
 
 
 @router.delete("/task/stop-all", name="stop all tasks")
-def stop_all():
-    for task_lock in task_locks.values():
-        asyncio.run(task_lock.put_queue(ActionStopData()))
+async def stop_all():
+    for task_lock in list(task_locks.values()):
+        await task_lock.put_queue(ActionStopData())
     return Response(status_code=204)
@@ -1,11 +1,17 @@
 from fastapi import APIRouter
 
 from app.utils.toolkit.notion_mcp_toolkit import NotionMCPToolkit
+from app.utils import tool_schema_cache
 
 
 router = APIRouter(tags=["task"])
 
 
+@router.get("/tool/schema/cache", name="tool schema cache stats")
+async def schema_cache_stats():
+    return tool_schema_cache.cache_stats()
+
+
 @router.post("/install/tool/{tool}", name="install tool")
 async def install_tool(tool: str):
     if tool == "notion":
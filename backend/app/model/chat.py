@@ -50,6 +50,8 @@ class Chat(BaseModel):
     )
     new_agents: list["NewAgent"] = []
     extra_params: dict | None = None  # For provider-specific parameters like Azure
+    # Further endpoints of an equivalent model, requests are routed to the fastest healthy one
+    extra_models: list["ModelEndpoint"] = []
 
     @field_validator("model_type")
     @classmethod
@@ -98,6 +100,14 @@ class UpdateData(BaseModel):
     task: list[TaskContent]
 
 
+class ModelEndpoint(BaseModel):
+    model_platform: str
+    model_type: str
+    api_key: str
+    api_url: str | None = None
+    extra_params: dict | None = None
+
+
 class NewAgent(BaseModel):
     name: str
     description: str
@@ -106,6 +116,23 @@ class NewAgent(BaseModel):
     env_path: str | None = None
 
 
-def sse_json(step: str, data):
-    res_format = {"step": step, "data": data}
-    return f"data: {json.dumps(res_format, ensure_ascii=False)}\n\n"
+class SseMessage(str):
+    r"""SSE text that keeps the JSON payload of each frame, so it is not parsed again for server sync"""
+
+    payloads: list[str]
+
+    def __new__(cls, text: str, payloads: list[str]):
+        message = super().__new__(cls, text)
+        message.payloads = payloads
+        return message
+
+    def __add__(self, other):
+        if isinstance(other, SseMessage):
+            return SseMessage(str(self) + str(other), self.payloads + other.payloads)
+        return str(self) + other
+
+
+def sse_json(step: str, data, **fields):
+    res_format = {"step": step, "data": data, **fields}
+    payload = json.dumps(res_format, ensure_ascii=False)
+    return SseMessage(f"data: {payload}\n\n", [payload])
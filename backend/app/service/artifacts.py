@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any
+
+PAGING_TOOL = "read_artifact"
+"""The tool agents page artifacts back with, its slices are never offloaded again"""
+HANDLE = re.compile(r"\[\S+ returned \d+ chars, stored as artifact [0-9a-f]{16}\.")
+"""Start of the text an offloaded result is replaced with, a handle is never offloaded itself"""
+
+
+def result_text(result: Any) -> str:
+    r"""The text a tool result is stored as, and shown as in toolkit events"""
+    return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+
+
+class ArtifactStore:
+    r"""Large tool results of a task, stored under its file_save_path by content hash.
+
+    Agent memory and toolkit events get a short handle with a preview instead of the whole result, the
+    agent reads further slices with the read_artifact tool. Identical results share one file, so the
+    event and the memory record of a call point at the same artifact.
+    """
+
+    def __init__(self, directory: str | Path, threshold: int, preview_chars: int = 1000) -> None:
+        self.directory = Path(directory)
+        self.threshold = threshold
+        self.preview_chars = preview_chars
+
+    def path(self, artifact_id: str) -> Path:
+        if not re.fullmatch(r"[0-9a-f]{16}", artifact_id):
+            raise ValueError(f"Invalid artifact id: {artifact_id!r}")
+        return self.directory / f"{artifact_id}.txt"
+
+    def put(self, content: str) -> str:
+        artifact_id = hashlib.sha256(content.encode()).hexdigest()[:16]
+        path = self.path(artifact_id)
+        if not path.exists():
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(content, encoding="utf-8")
+            tmp.replace(path)
+        return artifact_id
+
+    def read(self, artifact_id: str, offset: int = 0, length: int = 4000) -> str:
+        content = self.path(artifact_id).read_text(encoding="utf-8")
+        end = min(offset + length, len(content))
+        chunk = content[offset:end]
+        if end < len(content):
+            chunk += f"\n[chars {offset}-{end} of {len(content)}, continue with offset={end}]"
+        return chunk
+
+    def offload(self, tool_name: str, result: Any) -> Any:
+        r"""The result itself when it is small, otherwise a handle to where it is stored"""
+        if tool_name == PAGING_TOOL or result is None:
+            return result
+        content = result_text(result)
+        if len(content) <= self.threshold or HANDLE.match(content):
+            return result
+        artifact_id = self.put(content)
+        return (
+            f"[{tool_name} returned {len(content)} chars, stored as artifact {artifact_id}. "
+            f'Read more with {PAGING_TOOL}(artifact_id="{artifact_id}", offset={self.preview_chars})]\n'
+            f"{content[: self.preview_chars]}"
+        )
@@ -1,9 +1,9 @@
 import asyncio
-import datetime
+import inspect
 from pathlib import Path
-import platform
-from typing import Literal
-from fastapi import Request
+from threading import Event
+import time
+from typing import Any, Awaitable, Callable, Literal
 from inflection import titleize
 from pydash import chain
 from app.component.debug import dump_class
@@ -12,6 +12,9 @@ from app.service.task import (
     ActionImproveData,
     ActionInstallMcpData,
     ActionNewAgent,
+    ActionNoticeData,
+    EventCoalescer,
+    TaskIndex,
     TaskLock,
     delete_task_lock,
 )
@@ -24,10 +27,12 @@ from app.model.chat import Chat, NewAgent, Status, sse_json, TaskContent
 from camel.tasks import Task
 from app.utils.agent import (
     ListenChatAgent,
+    agent_build_abandoned,
     agent_model,
     get_mcp_tools,
     get_toolkits,
     mcp_agent,
+    operating_environment,
     developer_agent,
     document_agent,
     multi_modal_agent,
@@ -37,13 +42,14 @@ from app.utils.agent import (
     question_confirm_agent,
 )
 from app.service.task import Action, Agents
+from app.service.workforce_template import WorkforceTemplate, workforce_templates
 from app.utils.server.sync_step import sync_step
 from camel.types import ModelPlatformType
 from camel.models import ModelProcessingError
 
 
 @sync_step
-async def step_solve(options: Chat, request: Request, task_lock: TaskLock):
+async def step_solve(options: Chat, task_lock: TaskLock):
     # if True:
     #     import faulthandler
 
@@ -55,173 +61,206 @@ async def step_solve(options: Chat, request: Request, task_lock: TaskLock):
     question_agent = question_confirm_agent(options)
     camel_task = None
     workforce = None
-    while True:
-        if await request.is_disconnected():
-            if workforce is not None:
-                workforce.stop()
-            break
-        try:
-            item = await task_lock.get_queue()
-            # logger.info(f"item: {dump_class(item)}")
-        except Exception as e:
-            logger.error(f"Error getting item from queue: {e}")
-            break
-
-        try:
-            if item.action == Action.improve or start_event_loop:
-                # from viztracer import VizTracer
-
-                # tracer = VizTracer()
-                # tracer.start()
-                if start_event_loop is True:
-                    question = options.question
-                    start_event_loop = False
-                else:
-                    assert isinstance(item, ActionImproveData)
-                    question = item.data
-                if len(question) < 12 and len(options.attaches) == 0:
-                    confirm = await question_confirm(question_agent, question)
-                else:
-                    confirm = True
+    events = EventCoalescer(task_lock, int(env("event_coalesce_ms", "50")) / 1000)
+    template: WorkforceTemplate | None = None
+    # Connect the MCP servers of this chat while its question is confirmed
+    workforce_templates.prewarm(options)
+    try:
+        while True:
+            try:
+                item = await events.get()
+                # logger.info(f"item: {dump_class(item)}")
+            except Exception as e:
+                logger.error(f"Error getting item from queue: {e}")
+                break
 
-                if confirm is not True:
-                    yield confirm
-                else:
-                    yield sse_json("confirmed", "")
-                    (workforce, mcp) = await construct_workforce(options)
-                    for new_agent in options.new_agents:
-                        workforce.add_single_agent_worker(
-                            format_agent_description(new_agent), await new_agent_model(new_agent, options)
+            try:
+                if item.action == Action.improve or start_event_loop:
+                    # from viztracer import VizTracer
+
+                    # tracer = VizTracer()
+                    # tracer.start()
+                    if start_event_loop is True:
+                        question = options.question
+                        start_event_loop = False
+                    else:
+                        assert isinstance(item, ActionImproveData)
+                        question = item.data
+                    if len(question) < 12 and len(options.attaches) == 0:
+                        confirm = await question_confirm(question_agent, question)
+                    else:
+                        confirm = True
+
+                    if confirm is not True:
+                        yield confirm
+                    else:
+                        yield sse_json("confirmed", "")
+                        if template is not None:
+                            await workforce_templates.release(options, template)
+                        template = await workforce_templates.take(options)
+                        (workforce, mcp) = await construct_workforce(options, task_lock.startup_latency, template)
+                        task_lock.add_background_task(mcp)
+                        new_agents = await asyncio.gather(
+                            *(new_agent_model(new_agent, options) for new_agent in options.new_agents)
+                        )
+                        for new_agent, agent in zip(options.new_agents, new_agents):
+                            workforce.add_single_agent_worker(format_agent_description(new_agent), agent)
+                        summary_task_agent = task_summary_agent(options)
+                        task_lock.status = Status.confirmed
+                        question = question + options.summary_prompt
+                        camel_task = Task(content=question, id=options.task_id)
+                        if len(options.attaches) > 0:
+                            camel_task.additional_info = {Path(file_path).name: file_path for file_path in options.attaches}
+
+                        # The summary only needs the question, so it runs while the task is decomposed
+                        sub_tasks, summary_task_content = await asyncio.gather(
+                            asyncio.to_thread(workforce.eigent_make_sub_tasks, camel_task),
+                            summary_task(summary_task_agent, Task(content=camel_task.content, id=camel_task.id)),
                         )
-                    summary_task_agent = task_summary_agent(options)
-                    task_lock.status = Status.confirmed
-                    question = question + options.summary_prompt
-                    camel_task = Task(content=question, id=options.task_id)
-                    if len(options.attaches) > 0:
-                        camel_task.additional_info = {Path(file_path).name: file_path for file_path in options.attaches}
-
-                    sub_tasks = await asyncio.to_thread(workforce.eigent_make_sub_tasks, camel_task)
-                    summary_task_content = await summary_task(summary_task_agent, camel_task)
+                        task_lock.task_index.add(camel_task)
+                        for sub_task in sub_tasks:
+                            task_lock.task_index.add(sub_task, camel_task)
+                        yield to_sub_tasks(camel_task, summary_task_content)
+                        # tracer.stop()
+                        # tracer.save("trace.json")
+                        if env("debug") == "on":
+                            task_lock.status = Status.processing
+                            task = asyncio.create_task(workforce.eigent_start(sub_tasks))
+                            task_lock.add_background_task(task)
+
+                elif item.action == Action.update_task:
+                    assert camel_task is not None
+                    update_tasks = {item.id: item for item in item.data.task}
+                    sub_tasks = update_sub_tasks(sub_tasks, update_tasks, task_index=task_lock.task_index)
+                    add_sub_tasks(camel_task, item.data.task, task_lock.task_index)
                     yield to_sub_tasks(camel_task, summary_task_content)
-                    # tracer.stop()
-                    # tracer.save("trace.json")
-                    if env("debug") == "on":
-                        task_lock.status = Status.processing
-                        task = asyncio.create_task(workforce.eigent_start(sub_tasks))
-                        task_lock.add_background_task(task)
-
-            elif item.action == Action.update_task:
-                assert camel_task is not None
-                update_tasks = {item.id: item for item in item.data.task}
-                sub_tasks = update_sub_tasks(sub_tasks, update_tasks)
-                add_sub_tasks(camel_task, item.data.task)
-                yield to_sub_tasks(camel_task, summary_task_content)
-            elif item.action == Action.start:
-                task_lock.status = Status.processing
-                task = asyncio.create_task(workforce.eigent_start(sub_tasks))
-                task_lock.add_background_task(task)
-            elif item.action == Action.task_state:
-                yield sse_json("task_state", item.data)
-            elif item.action == Action.create_agent:
-                yield sse_json("create_agent", item.data)
-            elif item.action == Action.activate_agent:
-                yield sse_json("activate_agent", item.data)
-            elif item.action == Action.deactivate_agent:
-                yield sse_json("deactivate_agent", dict(item.data))
-            elif item.action == Action.assign_task:
-                yield sse_json("assign_task", item.data)
-            elif item.action == Action.activate_toolkit:
-                yield sse_json("activate_toolkit", item.data)
-            elif item.action == Action.deactivate_toolkit:
-                yield sse_json("deactivate_toolkit", item.data)
-            elif item.action == Action.write_file:
-                yield sse_json(
-                    "write_file",
-                    {"file_path": item.data, "process_task_id": item.process_task_id},
-                )
-            elif item.action == Action.ask:
-                yield sse_json("ask", item.data)
-            elif item.action == Action.notice:
-                yield sse_json(
-                    "notice",
-                    {"notice": item.data, "process_task_id": item.process_task_id},
-                )
-            elif item.action == Action.search_mcp:
-                yield sse_json("search_mcp", item.data)
-            elif item.action == Action.install_mcp:
-                task = asyncio.create_task(install_mcp(mcp, item))
-                task_lock.add_background_task(task)
-            elif item.action == Action.terminal:
-                yield sse_json(
-                    "terminal",
-                    {"output": item.data, "process_task_id": item.process_task_id},
-                )
-            elif item.action == Action.pause:
-                if workforce is not None:
-                    workforce.pause()
-            elif item.action == Action.resume:
-                if workforce is not None:
-                    workforce.resume()
-            elif item.action == Action.new_agent:
-                if workforce is not None:
-                    workforce.pause()
-                    workforce.add_single_agent_worker(
-                        format_agent_description(item), await new_agent_model(item, options)
+                elif item.action == Action.start:
+                    task_lock.status = Status.processing
+                    task = asyncio.create_task(workforce.eigent_start(sub_tasks))
+                    task_lock.add_background_task(task)
+                elif item.action == Action.task_state:
+                    yield sse_json("task_state", item.data)
+                elif item.action == Action.create_agent:
+                    yield sse_json("create_agent", item.data)
+                elif item.action == Action.activate_agent:
+                    yield sse_json("activate_agent", item.data)
+                elif item.action == Action.deactivate_agent:
+                    yield sse_json("deactivate_agent", dict(item.data))
+                elif item.action == Action.agent_delta:
+                    yield sse_json("agent_delta", dict(item.data))
+                elif item.action == Action.assign_task:
+                    yield sse_json("assign_task", item.data)
+                elif item.action == Action.activate_toolkit:
+                    yield sse_json("activate_toolkit", item.data)
+                elif item.action == Action.deactivate_toolkit:
+                    yield sse_json("deactivate_toolkit", item.data)
+                elif item.action == Action.toolkit_call:
+                    # Short call: both frames go out in a single write
+                    yield sse_json("activate_toolkit", item.activate.data) + sse_json(
+                        "deactivate_toolkit", item.deactivate.data
                     )
-                    workforce.resume()
-            elif item.action == Action.end:
-                assert camel_task is not None
-                task_lock.status = Status.done
-                yield sse_json("end", str(camel_task.result))
-                if workforce is not None:
-                    workforce.stop_gracefully()
-                break
-            elif item.action == Action.supplement:
-                assert camel_task is not None
-                task_lock.status = Status.processing
-                camel_task.add_subtask(
-                    Task(
-                        content=item.data.question,
-                        id=f"{camel_task.id}.{len(camel_task.subtasks)}",
+                elif item.action == Action.write_file:
+                    yield sse_json(
+                        "write_file",
+                        {"file_path": item.data, "process_task_id": item.process_task_id},
                     )
-                )
-                task = asyncio.create_task(workforce.eigent_start(camel_task.subtasks))
-                task_lock.add_background_task(task)
-            elif item.action == Action.budget_not_enough:
-                if workforce is not None:
-                    workforce.pause()
-                yield sse_json(Action.budget_not_enough, {"message": "budget not enouth"})
-            elif item.action == Action.stop:
-                if workforce is not None:
-                    if workforce._running:
+                elif item.action == Action.ask:
+                    yield sse_json("ask", item.data)
+                elif item.action == Action.notice:
+                    yield sse_json(
+                        "notice",
+                        {"notice": item.data, "process_task_id": item.process_task_id},
+                    )
+                elif item.action == Action.search_mcp:
+                    yield sse_json("search_mcp", item.data)
+                elif item.action == Action.install_mcp:
+                    task = asyncio.create_task(install_mcp(mcp, item, task_lock))
+                    task_lock.add_background_task(task)
+                elif item.action == Action.terminal:
+                    yield sse_json(
+                        "terminal",
+                        {"output": item.data, "process_task_id": item.process_task_id},
+                    )
+                elif item.action == Action.pause:
+                    if workforce is not None:
+                        workforce.pause()
+                elif item.action == Action.resume:
+                    if workforce is not None:
+                        workforce.resume()
+                elif item.action == Action.new_agent:
+                    if workforce is not None:
+                        workforce.pause()
+                        workforce.add_single_agent_worker(
+                            format_agent_description(item), await new_agent_model(item, options)
+                        )
+                        workforce.resume()
+                elif item.action == Action.end:
+                    assert camel_task is not None
+                    task_lock.status = Status.done
+                    yield sse_json("end", str(camel_task.result), metrics=task_lock.metrics.summary())
+                    if workforce is not None:
+                        workforce.stop_gracefully()
+                    break
+                elif item.action == Action.supplement:
+                    assert camel_task is not None
+                    task_lock.status = Status.processing
+                    task_lock.task_index.add_subtask(
+                        camel_task,
+                        Task(
+                            content=item.data.question,
+                            id=f"{camel_task.id}.{len(camel_task.subtasks)}",
+                        ),
+                    )
+                    task = asyncio.create_task(workforce.eigent_start(camel_task.subtasks))
+                    task_lock.add_background_task(task)
+                elif item.action == Action.budget_not_enough:
+                    if workforce is not None:
+                        workforce.pause()
+                    yield sse_json(Action.budget_not_enough, {"message": "budget not enouth"})
+                elif item.action == Action.stop:
+                    if workforce is not None:
+                        if workforce._running:
+                            workforce.stop()
+                        workforce.stop_gracefully()
+                    await delete_task_lock(task_lock.id)
+                    break
+                else:
+                    logger.warning(f"Unknown action: {item.action}")
+            except ModelProcessingError as e:
+                if "Budget has been exceeded" in str(e):
+                    # workforce decompose task don't use ListenAgent, this need return sse
+                    if "workforce" in locals() and workforce is not None:
+                        workforce.pause()
+                    yield sse_json(Action.budget_not_enough, {"message": "budget not enouth"})
+                else:
+                    logger.error(f"Error processing action {item.action}: {e}")
+                    yield sse_json("error", {"message": str(e)})
+                    if "workforce" in locals() and workforce is not None and workforce._running:
                         workforce.stop()
-                    workforce.stop_gracefully()
-                await delete_task_lock(task_lock.id)
-                break
-            else:
-                logger.warning(f"Unknown action: {item.action}")
-        except ModelProcessingError as e:
-            if "Budget has been exceeded" in str(e):
-                # workforce decompose task don't use ListenAgent, this need return sse
-                if "workforce" in locals() and workforce is not None:
-                    workforce.pause()
-                yield sse_json(Action.budget_not_enough, {"message": "budget not enouth"})
-            else:
+            except Exception as e:
                 logger.error(f"Error processing action {item.action}: {e}")
                 yield sse_json("error", {"message": str(e)})
-                if "workforce" in locals() and workforce is not None and workforce._running:
-                    workforce.stop()
-        except Exception as e:
-            logger.error(f"Error processing action {item.action}: {e}")
-            yield sse_json("error", {"message": str(e)})
-            # Continue processing other items instead of breaking
+                # Continue processing other items instead of breaking
+    finally:
+        # Disconnect the MCP servers the task used and warm a template for the next one
+        await workforce_templates.release(options, template)
 
 
 async def install_mcp(
-    mcp: ListenChatAgent,
+    mcp: ListenChatAgent | asyncio.Future[ListenChatAgent],
     install_mcp: ActionInstallMcpData,
+    task_lock: TaskLock,
 ):
-    mcp.add_tools(await get_mcp_tools(install_mcp.data))
+    r"""Add the tools of newly installed MCP servers to the MCP agent, runs as a background task so
+    a failure is reported to the user instead of raised"""
+    try:
+        if isinstance(mcp, asyncio.Future):
+            # The MCP agent is still connecting its servers
+            mcp = await mcp
+        mcp.add_tools(await get_mcp_tools(install_mcp.data))
+    except Exception as e:
+        logger.error(f"Failed to install MCP servers for task {task_lock.id}: {e!r}")
+        task_lock.emit(ActionNoticeData(process_task_id="", data=f"Failed to install MCP servers: {e}"))
 
 
 def to_sub_tasks(task: Task, summary_task_content: str):
@@ -252,7 +291,12 @@ def tree_sub_tasks(sub_tasks: list[Task], depth: int = 0):
     )
 
 
-def update_sub_tasks(sub_tasks: list[Task], update_tasks: dict[str, TaskContent], depth: int = 0):
+def update_sub_tasks(
+    sub_tasks: list[Task],
+    update_tasks: dict[str, TaskContent],
+    depth: int = 0,
+    task_index: TaskIndex | None = None,
+):
     if depth > 5:  # limit the depth of the recursion
         return []
 
@@ -261,22 +305,26 @@ def update_sub_tasks(sub_tasks: list[Task], update_tasks: dict[str, TaskContent]
         item = sub_tasks[i]
         if item.id in update_tasks:
             item.content = update_tasks[item.id].content
-            update_sub_tasks(item.subtasks, update_tasks, depth + 1)
+            update_sub_tasks(item.subtasks, update_tasks, depth + 1, task_index)
             i += 1
         else:
+            if task_index is not None:
+                task_index.remove(item.id)
             sub_tasks.pop(i)
     return sub_tasks
 
 
-def add_sub_tasks(camel_task: Task, update_tasks: list[TaskContent]):
+def add_sub_tasks(camel_task: Task, update_tasks: list[TaskContent], task_index: TaskIndex | None = None):
     for item in update_tasks:
         if item.id == "":  #
-            camel_task.add_subtask(
-                Task(
-                    content=item.content,
-                    id=f"{camel_task.id}.{len(camel_task.subtasks) + 1}",
-                )
+            task = Task(
+                content=item.content,
+                id=f"{camel_task.id}.{len(camel_task.subtasks) + 1}",
             )
+            if task_index is None:
+                camel_task.add_subtask(task)
+            else:
+                task_index.add_subtask(camel_task, task)
 
 
 async def question_confirm(agent: ListenChatAgent, prompt: str) -> str | Literal[True]:
@@ -295,7 +343,7 @@ async def question_confirm(agent: ListenChatAgent, prompt: str) -> str | Literal
 >     * **For a Simple Query:** Provide a direct and helpful response.
 >     * **For a Complex Task:** Your *only* response should be "yes". This will trigger a specialized workforce to handle the task. Do not include any other text, punctuation, or pleasantries.
         """
-    resp = agent.step(prompt)
+    resp = await agent.astep(prompt)
     logger.info(f"resp: {agent.chat_history}")
     if resp.msgs[0].content.lower() != "yes":
         return sse_json("wait_confirm", {"content": resp.msgs[0].content})
@@ -316,75 +364,135 @@ Your instructions are:
 Example format: "Task Name|This is the summary of the task."
 Do not include any other text or formatting.
 """
-    res = agent.step(prompt)
+    res = await agent.astep(prompt)
     logger.info(f"summary_task: {res.msgs[0].content}")
     return res.msgs[0].content
 
 
-async def construct_workforce(options: Chat) -> tuple[Workforce, ListenChatAgent]:
+async def build_component(
+    name: str, build: Awaitable[Any] | Callable[[], Any], timeout: float, latency: dict[str, float]
+) -> Any:
+    r"""Build one workforce component within timeout and record how long it took,
+    sync builders run on a worker thread so they overlap with the async ones. A thread cannot be
+    cancelled, a builder still running when the build is given up creates no agent, see announce_agent"""
+    started = time.perf_counter()
+    abandoned = Event()
+    # The builder runs in a copy of this context, so it sees the event
+    token = agent_build_abandoned.set(abandoned)
+    try:
+        return await asyncio.wait_for(build if inspect.isawaitable(build) else asyncio.to_thread(build), timeout)
+    except BaseException:
+        abandoned.set()
+        raise
+    finally:
+        agent_build_abandoned.reset(token)
+        latency[name] = round(time.perf_counter() - started, 3)
+
+
+async def construct_workforce(
+    options: Chat, latency: dict[str, float] | None = None, template: WorkforceTemplate | None = None
+) -> tuple[Workforce, asyncio.Task[ListenChatAgent]]:
+    r"""Build the workforce agents concurrently.
+
+    The coordinator, task planner and new worker agents are required, a worker that fails or times out
+    is left out of the workforce. The MCP agent connects every installed MCP server, so it is built in
+    the background and returned as a task for the actions that need it. A warm template provides the
+    MCP connections instead.
+    """
     working_directory = options.file_save_path()
-    [coordinator_agent, task_agent] = [
-        agent_model(
+    latency = {} if latency is None else latency
+    timeout = float(env("agent_build_timeout", "60"))
+
+    def tool_agent(key: Agents, prompt: str, human_tools: bool = False):
+        return agent_model(
             key,
             prompt,
             options,
             [
+                *(HumanToolkit.get_can_use_tools(options.task_id, key) if human_tools else []),
                 *(
                     ToolkitMessageIntegration(
                         message_handler=HumanToolkit(options.task_id, key).send_message_to_user
                     ).register_toolkits(NoteTakingToolkit(options.task_id, working_directory=working_directory))
-                ).get_tools()
+                ).get_tools(),
             ],
         )
-        for key, prompt in {
-            Agents.coordinator_agent: f"""
-You are a helpful coordinator.
-- You are now working in system {platform.system()} with architecture
-{platform.machine()} at working directory `{working_directory}`. All local file operations must occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
-The current date is {datetime.date.today()}. For any date-related tasks, you MUST use this as the current date.
 
+    required = {
+        Agents.coordinator_agent: lambda: tool_agent(
+            Agents.coordinator_agent,
+            """
+You are a helpful coordinator.
 - If a task assigned to another agent fails, you should re-assign it to the 
 `Developer_Agent`. The `Developer_Agent` is a powerful agent with terminal 
 access and can resolve a wide range of issues. 
-            """,
-            Agents.task_agent: f"""
-You are a helpful task planner.
-- You are now working in system {platform.system()} with architecture
-{platform.machine()} at working directory `{working_directory}`. All local file operations must occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
-The current date is {datetime.date.today()}. For any date-related tasks, you MUST use this as the current date.
-        """,
-        }.items()
-    ]
-    new_worker_agent = agent_model(
-        Agents.new_worker_agent,
-        f"""
-        You are a helpful assistant.
-- You are now working in system {platform.system()} with architecture
-{platform.machine()} at working directory `{working_directory}`. All local file operations must occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
-The current date is {datetime.date.today()}. For any date-related tasks, you MUST use this as the current date.
-        """,
-        options,
-        [
-            *HumanToolkit.get_can_use_tools(options.task_id, Agents.new_worker_agent),
-            *(
-                ToolkitMessageIntegration(
-                    message_handler=HumanToolkit(options.task_id, Agents.new_worker_agent).send_message_to_user
-                ).register_toolkits(NoteTakingToolkit(options.task_id, working_directory=working_directory))
-            ).get_tools(),
-        ],
-    )
-    # msg_toolkit = AgentCommunicationToolkit(max_message_history=100)
-
-    searcher = search_agent(options)
-    developer = await developer_agent(options)
-    documenter = await document_agent(options)
-    multi_modaler = multi_modal_agent(options)
+"""
+            + operating_environment(working_directory),
+        ),
+        Agents.task_agent: lambda: tool_agent(
+            Agents.task_agent,
+            "You are a helpful task planner.\n" + operating_environment(working_directory),
+        ),
+        Agents.new_worker_agent: lambda: tool_agent(
+            Agents.new_worker_agent,
+            "You are a helpful assistant.\n" + operating_environment(working_directory),
+            human_tools=True,
+        ),
+    }
+    workers = {
+        Agents.developer_agent: (
+            developer_agent(options),
+            "Developer Agent: A master-level coding assistant with a powerful "
+            "terminal. It can write and execute code, manage files, automate "
+            "desktop tasks, and deploy web applications to solve complex "
+            "technical challenges.",
+        ),
+        Agents.search_agent: (
+            lambda: search_agent(options),
+            "Search Agent: Can search the web, extract webpage content, "
+            "simulate browser actions, and provide relevant information to "
+            "solve the given task.",
+        ),
+        Agents.document_agent: (
+            document_agent(options, template.gdrive_tools if template else None),
+            "Document Agent: A document processing assistant skilled in creating "
+            "and modifying a wide range of file formats. It can generate "
+            "text-based files/reports (Markdown, JSON, YAML, HTML), "
+            "office documents (Word, PDF), presentations (PowerPoint), and "
+            "data files (Excel, CSV).",
+        ),
+        Agents.multi_modal_agent: (
+            lambda: multi_modal_agent(options),
+            "Multi-Modal Agent: A specialist in media processing. It can "
+            "analyze images and audio, transcribe speech, download videos, and "
+            "generate new images from text prompts.",
+        ),
+        # Agents.social_medium_agent: (
+        #     social_medium_agent(options),
+        #     "Social Media Agent: A social media management assistant for "
+        #     "handling tasks related to WhatsApp, Twitter, LinkedIn, Reddit, "
+        #     "Notion, Slack, and other social platforms.",
+        # ),
+    }
+
+    async def optional_worker(key: Agents, build):
+        try:
+            return await build_component(key, build, timeout, latency)
+        except Exception as e:
+            logger.error(f"Failed to build {key.value} for task {options.task_id}, skipping it: {e!r}")
+            return None
 
-    # msg_toolkit.register_agent("Worker", new_worker_agent)
-    # msg_toolkit.register_agent("Search_Agent", searcher)
-    # msg_toolkit.register_agent("Developer_Agent", developer)
-    # msg_toolkit.register_agent("Document_Agent", documenter)
-    # msg_toolkit.register_agent("Multi_Modal_Agent", multi_modaler)
+    # msg_toolkit = AgentCommunicationToolkit(max_message_history=100)
+    builds = [
+        *(asyncio.create_task(build_component(key, build, timeout, latency)) for key, build in required.items()),
+        *(asyncio.create_task(optional_worker(key, build)) for key, (build, _) in workers.items()),
+    ]
+    try:
+        coordinator_agent, task_agent, new_worker_agent, *worker_agents = await asyncio.gather(*builds)
+    except BaseException:
+        for build in builds:
+            build.cancel()
+        raise
 
     # Convert string model_platform to enum for comparison
     try:
@@ -403,41 +511,20 @@ The current date is {datetime.date.today()}. For any date-related tasks, you MUS
         new_worker_agent=new_worker_agent,
         use_structured_output_handler=False if model_platform_enum == ModelPlatformType.OPENAI else True,
     )
-    workforce.add_single_agent_worker(
-        "Developer Agent: A master-level coding assistant with a powerful "
-        "terminal. It can write and execute code, manage files, automate "
-        "desktop tasks, and deploy web applications to solve complex "
-        "technical challenges.",
-        developer,
-    )
-    workforce.add_single_agent_worker(
-        "Search Agent: Can search the web, extract webpage content, "
-        "simulate browser actions, and provide relevant information to "
-        "solve the given task.",
-        searcher,
-    )
-    workforce.add_single_agent_worker(
-        "Document Agent: A document processing assistant skilled in creating "
-        "and modifying a wide range of file formats. It can generate "
-        "text-based files/reports (Markdown, JSON, YAML, HTML), "
-        "office documents (Word, PDF), presentations (PowerPoint), and "
-        "data files (Excel, CSV).",
-        documenter,
-    )
-    workforce.add_single_agent_worker(
-        "Multi-Modal Agent: A specialist in media processing. It can "
-        "analyze images and audio, transcribe speech, download videos, and "
-        "generate new images from text prompts.",
-        multi_modaler,
+    for (_, description), worker_agent in zip(workers.values(), worker_agents):
+        if worker_agent is not None:
+            workforce.add_single_agent_worker(description, worker_agent)
+    logger.info(f"Workforce for task {options.task_id} built, startup latency: {latency}")
+
+    mcp = asyncio.create_task(
+        build_component(
+            Agents.mcp_agent,
+            mcp_agent(options, template.mcp_tools if template else None),
+            float(env("mcp_agent_timeout", "60")),
+            latency,
+        )
     )
     # workforce.add_single_agent_worker(
-    #     "Social Media Agent: A social media management assistant for "
-    #     "handling tasks related to WhatsApp, Twitter, LinkedIn, Reddit, "
-    #     "Notion, Slack, and other social platforms.",
-    #     await social_medium_agent(options),
-    # )
-    mcp = await mcp_agent(options)
-    # workforce.add_single_agent_worker(
     #     "MCP Agent: A Model Context Protocol agent that provides access "
     #     "to external tools and services through MCP integrations.",
     #     mcp,
@@ -486,11 +573,6 @@ async def new_agent_model(data: NewAgent | ActionNewAgent, options: Chat):
     for item in tools:
         logger.debug(f"new agent function tool  ====== {item.func.__name__}")
     # Enhanced system message with platform information
-    enhanced_description = f"""{data.description}
-- You are now working in system {platform.system()} with architecture
-{platform.machine()} at working directory `{working_directory}`. All local file operations must occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
-The current date is {datetime.date.today()}. For any date-related tasks, you 
-MUST use this as the current date.
-"""
+    enhanced_description = f"{data.description}\n{operating_environment(working_directory)}"
 
     return agent_model(data.name, enhanced_description, options, tools, tool_names=tool_names)
@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+from typing import Any
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120)
+"""Upper bounds in seconds of the model call latency histogram, the last bucket is unbounded"""
+
+
+def cached_tokens(usage: dict[str, Any]) -> int:
+    r"""Prompt tokens the provider served from its prompt cache, as reported in the usage of a model call"""
+    details = usage.get("prompt_tokens_details") or {}
+    return (
+        details.get("cached_tokens")
+        # Anthropic and DeepSeek style usage
+        or usage.get("cache_read_input_tokens")
+        or usage.get("prompt_cache_hit_tokens")
+        or 0
+    )
+
+
+class AgentMetrics:
+    r"""Usage of one agent with one model within a task"""
+
+    def __init__(self) -> None:
+        self.steps = 0
+        self.failed_steps = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.model_calls = 0
+        self.model_prompt_tokens = 0
+        self.cached_tokens = 0
+        self.model_seconds = 0.0
+        self.max_model_seconds = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.tool_calls: dict[str, int] = {}
+        self.compactions = 0
+        self.compacted_tokens = 0
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "steps": self.steps,
+            "failed_steps": self.failed_steps,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "model_calls": self.model_calls,
+            "model_seconds": round(self.model_seconds, 3),
+            "avg_model_seconds": round(self.model_seconds / self.model_calls, 3) if self.model_calls else None,
+            "max_model_seconds": round(self.max_model_seconds, 3),
+            "cached_tokens": self.cached_tokens,
+            "cache_hit_rate": round(self.cached_tokens / self.model_prompt_tokens, 4) if self.model_prompt_tokens else None,
+            "latency_histogram": {
+                **{f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS, self.latency_histogram)},
+                "inf": self.latency_histogram[-1],
+            },
+            "tool_calls": dict(self.tool_calls),
+            "compactions": self.compactions,
+            "compacted_tokens": self.compacted_tokens,
+        }
+
+
+class PoolMetrics:
+    r"""Agent pool usage of one worker within a task"""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.clones = 0
+        self.spare_clones = 0
+        self.clone_seconds = 0.0
+        self.max_clone_seconds = 0.0
+        self.miss_clone_seconds = 0.0
+        self.shrunk = 0
+
+    def summary(self) -> dict[str, Any]:
+        borrows = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / borrows, 4) if borrows else None,
+            "clones": self.clones,
+            "spare_clones": self.spare_clones,
+            "avg_clone_seconds": round(self.clone_seconds / self.clones, 3) if self.clones else None,
+            "max_clone_seconds": round(self.max_clone_seconds, 3),
+            "miss_clone_seconds": round(self.miss_clone_seconds, 3),
+            "shrunk": self.shrunk,
+        }
+
+
+class TaskMetrics:
+    r"""Token, latency and tool usage of a task, keyed by agent and model.
+
+    Agents record from their worker threads as well as the event loop, so every update takes the lock.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self.agents: dict[tuple[str, str], AgentMetrics] = {}
+        self.retries: dict[str, int] = {}
+        self.pools: dict[str, PoolMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _agent(self, agent_name: str, model: str) -> AgentMetrics:
+        return self.agents.setdefault((agent_name, model), AgentMetrics())
+
+    def record_model_call(self, agent_name: str, model: str, seconds: float, usage: dict[str, Any] | None = None) -> None:
+        usage = usage or {}
+        with self._lock:
+            metrics = self._agent(agent_name, model)
+            metrics.model_calls += 1
+            metrics.model_prompt_tokens += usage.get("prompt_tokens") or 0
+            metrics.cached_tokens += cached_tokens(usage)
+            metrics.model_seconds += seconds
+            metrics.max_model_seconds = max(metrics.max_model_seconds, seconds)
+            metrics.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def record_step(
+        self,
+        agent_name: str,
+        model: str,
+        usage: dict[str, Any] | None,
+        tool_calls: list[str],
+        failed: bool = False,
+    ) -> None:
+        usage = usage or {}
+        with self._lock:
+            metrics = self._agent(agent_name, model)
+            metrics.steps += 1
+            metrics.failed_steps += failed
+            metrics.prompt_tokens += usage.get("prompt_tokens") or 0
+            metrics.completion_tokens += usage.get("completion_tokens") or 0
+            for tool_name in tool_calls:
+                metrics.tool_calls[tool_name] = metrics.tool_calls.get(tool_name, 0) + 1
+
+    def record_compaction(self, agent_name: str, model: str, before: int, after: int) -> None:
+        with self._lock:
+            metrics = self._agent(agent_name, model)
+            metrics.compactions += 1
+            metrics.compacted_tokens += max(before - after, 0)
+
+    def record_pool_borrow(self, worker: str, hit: bool) -> None:
+        with self._lock:
+            pool = self.pools.setdefault(worker, PoolMetrics())
+            if hit:
+                pool.hits += 1
+            else:
+                pool.misses += 1
+
+    def record_pool_clone(self, worker: str, seconds: float, spare: bool) -> None:
+        r"""A clone of the worker agent, a spare made ahead of demand or one a borrow waited for"""
+        with self._lock:
+            pool = self.pools.setdefault(worker, PoolMetrics())
+            pool.clones += 1
+            pool.spare_clones += spare
+            pool.clone_seconds += seconds
+            pool.max_clone_seconds = max(pool.max_clone_seconds, seconds)
+            if not spare:
+                pool.miss_clone_seconds += seconds
+
+    def record_pool_shrink(self, worker: str, count: int) -> None:
+        with self._lock:
+            self.pools.setdefault(worker, PoolMetrics()).shrunk += count
+
+    def record_retry(self, task_id: str) -> None:
+        r"""A subtask failed and the workforce is trying it again"""
+        with self._lock:
+            self.retries[task_id] = self.retries.get(task_id, 0) + 1
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            agents = [
+                {"agent_name": agent_name, "model": model, **metrics.summary()}
+                for (agent_name, model), metrics in self.agents.items()
+            ]
+            retries = dict(self.retries)
+            pools = {worker: pool.summary() for worker, pool in self.pools.items()}
+        return {
+            "elapsed_seconds": round(time.time() - self.started_at, 3),
+            "prompt_tokens": sum(agent["prompt_tokens"] for agent in agents),
+            "completion_tokens": sum(agent["completion_tokens"] for agent in agents),
+            "total_tokens": sum(agent["total_tokens"] for agent in agents),
+            "model_calls": sum(agent["model_calls"] for agent in agents),
+            "model_seconds": round(sum(agent["model_seconds"] for agent in agents), 3),
+            "cached_tokens": sum(agent["cached_tokens"] for agent in agents),
+            "tool_calls": sum(sum(agent["tool_calls"].values()) for agent in agents),
+            "retries": sum(retries.values()),
+            "retries_by_task": retries,
+            "agents": agents,
+            "agent_pools": pools,
+        }
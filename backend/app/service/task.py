@@ -1,14 +1,20 @@
 from typing_extensions import Any, Literal, TypedDict
 from pydantic import BaseModel
+from app.component.environment import env
 from app.exception.exception import ProgramException
-from app.model.chat import McpServers, Status, SupplementChat, Chat, UpdateData
+from app.service.artifacts import ArtifactStore
+from app.service.metering import TaskMetrics
+from app.service.tool_memo import ToolMemo
+from app.model.chat import McpServers, Status, SupplementChat, Chat, UpdateData, sse_json
 import asyncio
+import heapq
+from collections import deque
 from enum import Enum
+from typing import AsyncGenerator, AsyncIterator, Iterator
 from camel.tasks import Task
 from contextlib import contextmanager
 from contextvars import ContextVar
 from datetime import datetime, timedelta
-import weakref
 from loguru import logger
 
 
@@ -20,6 +26,7 @@ class Action(str, Enum):
     create_agent = "create_agent"  # backend -> user
     activate_agent = "activate_agent"  # backend -> user
     deactivate_agent = "deactivate_agent"  # backend -> user
+    agent_delta = "agent_delta"  # backend -> user  streamed model output of an active agent
     assign_task = "assign_task"  # backend -> user
     activate_toolkit = "activate_toolkit"  # backend -> user
     deactivate_toolkit = "deactivate_toolkit"  # backend -> user
@@ -29,6 +36,7 @@ class Action(str, Enum):
     search_mcp = "search_mcp"  # backend -> user
     install_mcp = "install_mcp"  # backend -> user
     terminal = "terminal"  # backend -> user
+    replay_gap = "replay_gap"  # backend -> user  frames after the client's last event id are no longer kept
     end = "end"  # backend -> user
     stop = "stop"  # user -> backend
     supplement = "supplement"  # user -> backend
@@ -36,6 +44,7 @@ class Action(str, Enum):
     resume = "resume"  # user -> backend  user take control
     new_agent = "new_agent"  # user -> backend
     budget_not_enough = "budget_not_enough"  # backend -> user
+    toolkit_call = "toolkit_call"  # backend internal, activate/deactivate toolkit pair of a short call
 
 
 class ActionImproveData(BaseModel):
@@ -91,6 +100,19 @@ class ActionDeactivateAgentData(BaseModel):
     data: DataDict
 
 
+class AgentDeltaDict(TypedDict):
+    agent_name: str
+    agent_id: str
+    process_task_id: str
+    delta: str
+    replace: bool
+
+
+class ActionAgentDeltaData(BaseModel):
+    action: Literal[Action.agent_delta] = Action.agent_delta
+    data: AgentDeltaDict
+
+
 class ActionAssignTaskData(BaseModel):
     action: Literal[Action.assign_task] = Action.assign_task
     data: dict[Literal["assignee_id", "task_id", "content", "state", "failure_count"], str | int]
@@ -107,8 +129,8 @@ class ActionActivateToolkitData(BaseModel):
 class ActionDeactivateToolkitData(BaseModel):
     action: Literal[Action.deactivate_toolkit] = Action.deactivate_toolkit
     data: dict[
-        Literal["agent_name", "toolkit_name", "process_task_id", "method_name", "message"],
-        str,
+        Literal["agent_name", "toolkit_name", "process_task_id", "method_name", "message", "memo_hits"],
+        str | int,
     ]
 
 
@@ -140,6 +162,12 @@ class ActionTerminalData(BaseModel):
     data: str
 
 
+class ActionToolkitCallData(BaseModel):
+    action: Literal[Action.toolkit_call] = Action.toolkit_call
+    activate: ActionActivateToolkitData
+    deactivate: ActionDeactivateToolkitData
+
+
 class ActionStopData(BaseModel):
     action: Literal[Action.stop] = Action.stop
 
@@ -178,6 +206,7 @@ ActionData = (
     | ActionCreateAgentData
     | ActionActivateAgentData
     | ActionDeactivateAgentData
+    | ActionAgentDeltaData
     | ActionAssignTaskData
     | ActionActivateToolkitData
     | ActionDeactivateToolkitData
@@ -186,6 +215,7 @@ ActionData = (
     | ActionSearchMcpData
     | ActionInstallMcpData
     | ActionTerminalData
+    | ActionToolkitCallData
     | ActionStopData
     | ActionEndData
     | ActionSupplementData
@@ -207,6 +237,246 @@ class Agents(str, Enum):
     mcp_agent = "mcp_agent"
 
 
+class QueuePolicy(str, Enum):
+    block = "block"  # producer waits until the consumer frees a slot
+    drop_oldest = "drop_oldest"  # evict the oldest low-priority event, agent deltas merge into the agent's pending one
+    coalesce = "coalesce"  # merge into the pending tail event, else evict the oldest low-priority event
+
+
+control_actions = frozenset({Action.stop, Action.pause, Action.resume, Action.end, Action.ask})
+"""Actions always accepted by the queue, even when it is full"""
+
+low_priority_actions = frozenset({Action.terminal, Action.notice})
+"""Actions that may be evicted when the queue is full"""
+
+
+class TaskQueue(asyncio.Queue):
+    r"""Bounded queue between task producers and the SSE consumer.
+
+    When the queue is full the overflow policy decides what happens to a new
+    event. Control actions bypass the capacity so they are never dropped or
+    stuck behind a burst of terminal output.
+    """
+
+    def __init__(self, maxsize: int = 0, policy: QueuePolicy = QueuePolicy.block) -> None:
+        super().__init__(maxsize)
+        self.policy = policy
+        self.peak_size = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked = 0
+
+    def put_nowait(self, item: ActionData) -> None:
+        if self.full() and item.action not in control_actions:
+            if self.policy == QueuePolicy.block:
+                raise asyncio.QueueFull
+            if self.policy == QueuePolicy.coalesce and self._coalesce(item):
+                return
+            if isinstance(item, ActionAgentDeltaData) and self._merge_delta(item):
+                return
+            if not self._drop_oldest():
+                if item.action not in low_priority_actions:
+                    raise asyncio.QueueFull
+                # The new event is the oldest low-priority event left
+                self.dropped += 1
+                return
+        # Same as asyncio.Queue.put_nowait, minus the capacity check
+        self._put(item)
+        self._unfinished_tasks += 1
+        self._finished.clear()
+        self._wakeup_next(self._getters)
+        self.peak_size = max(self.peak_size, self.qsize())
+
+    async def put(self, item: ActionData) -> None:
+        try:
+            self.put_nowait(item)
+        except asyncio.QueueFull:
+            self.blocked += 1
+            await super().put(item)
+
+    def _coalesce(self, item: ActionData) -> bool:
+        r"""Merge terminal output into the pending tail event of the same process task"""
+        if not isinstance(item, ActionTerminalData) or len(self._queue) == 0:
+            return False
+        tail = self._queue[-1]
+        if not isinstance(tail, ActionTerminalData) or tail.process_task_id != item.process_task_id:
+            return False
+        self._queue[-1] = ActionTerminalData(process_task_id=tail.process_task_id, data=tail.data + item.data)
+        self.coalesced += 1
+        return True
+
+    def _merge_delta(self, item: ActionAgentDeltaData) -> bool:
+        r"""Merge streamed output into the agent's latest pending event if that is a delta too"""
+        for index in range(len(self._queue) - 1, -1, -1):
+            data = getattr(self._queue[index], "data", None)
+            if not isinstance(data, dict) or not (
+                data.get("agent_id") == item.data["agent_id"]
+                or (
+                    data.get("agent_name") == item.data["agent_name"]
+                    and data.get("process_task_id") == item.data["process_task_id"]
+                )
+            ):
+                continue
+            if not isinstance(self._queue[index], ActionAgentDeltaData):
+                return False
+            self._queue[index] = merge_agent_deltas(self._queue[index], item)
+            self.coalesced += 1
+            return True
+        return False
+
+    def _drop_oldest(self) -> bool:
+        for index, queued in enumerate(self._queue):
+            if queued.action in low_priority_actions:
+                del self._queue[index]
+                self.dropped += 1
+                return True
+        return False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": self.qsize(),
+            "maxsize": self.maxsize,
+            "policy": self.policy.value,
+            "peak_size": self.peak_size,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "blocked": self.blocked,
+        }
+
+
+def merge_agent_deltas(first: ActionAgentDeltaData, second: ActionAgentDeltaData) -> ActionAgentDeltaData:
+    r"""One delta with the effect of `first` followed by `second` of the same agent"""
+    if second.data["replace"]:
+        return second
+    return ActionAgentDeltaData(data={**first.data, "delta": first.data["delta"] + second.data["delta"]})
+
+
+class EventCoalescer:
+    r"""Merges high-frequency events read from a task queue before they reach the SSE stream.
+
+    Consecutive terminal chunks of the same process task, and consecutive
+    streamed deltas of the same agent, arriving within the window are joined
+    into one event, and a toolkit activation followed by its deactivation
+    within the window is returned as a single toolkit call. Any
+    other event read while waiting is held back and returned next, so the
+    frame order is unchanged.
+    """
+
+    def __init__(self, task_lock: "TaskLock", window: float) -> None:
+        self.task_lock = task_lock
+        self.window = window
+        self.pending: ActionData | None = None
+
+    async def get(self) -> ActionData:
+        if self.pending is not None:
+            item, self.pending = self.pending, None
+        else:
+            item = await self.task_lock.get_queue()
+        if self.window <= 0:
+            return item
+        if isinstance(item, ActionTerminalData):
+            return await self._merge_terminal(item)
+        if isinstance(item, ActionAgentDeltaData):
+            return await self._merge_deltas(item)
+        if isinstance(item, ActionActivateToolkitData):
+            return await self._pair_toolkit(item)
+        return item
+
+    async def _next(self, deadline: float) -> ActionData | None:
+        timeout = deadline - asyncio.get_running_loop().time()
+        if timeout <= 0:
+            return None
+        try:
+            return await asyncio.wait_for(self.task_lock.get_queue(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _merge_terminal(self, item: ActionTerminalData) -> ActionData:
+        deadline = asyncio.get_running_loop().time() + self.window
+        chunks = [item.data]
+        while (following := await self._next(deadline)) is not None:
+            if isinstance(following, ActionTerminalData) and following.process_task_id == item.process_task_id:
+                chunks.append(following.data)
+            else:
+                self.pending = following
+                break
+        if len(chunks) == 1:
+            return item
+        return ActionTerminalData(process_task_id=item.process_task_id, data="".join(chunks))
+
+    async def _merge_deltas(self, item: ActionAgentDeltaData) -> ActionData:
+        deadline = asyncio.get_running_loop().time() + self.window
+        while (following := await self._next(deadline)) is not None:
+            if isinstance(following, ActionAgentDeltaData) and following.data["agent_id"] == item.data["agent_id"]:
+                item = merge_agent_deltas(item, following)
+            else:
+                self.pending = following
+                break
+        return item
+
+    async def _pair_toolkit(self, item: ActionActivateToolkitData) -> ActionData:
+        following = await self._next(asyncio.get_running_loop().time() + self.window)
+        if following is None:
+            return item
+        if isinstance(following, ActionDeactivateToolkitData) and all(
+            following.data.get(key) == item.data.get(key)
+            for key in ("agent_name", "toolkit_name", "process_task_id", "method_name")
+        ):
+            return ActionToolkitCallData(activate=item, deactivate=following)
+        self.pending = following
+        return item
+
+
+class TaskIndex:
+    r"""Index of a camel task tree by id, updated as subtasks are added and removed"""
+
+    def __init__(self) -> None:
+        self.tasks: dict[str, Task] = {}
+        self.parents: dict[str, str | None] = {}
+
+    def add(self, task: Task, parent: Task | None = None) -> None:
+        r"""Index `task` and its whole subtree under `parent`"""
+        stack = [(task, parent.id if parent else None)]
+        while stack:
+            item, parent_id = stack.pop()
+            self.tasks[item.id] = item
+            self.parents[item.id] = parent_id
+            stack.extend((sub, item.id) for sub in item.subtasks)
+
+    def add_subtask(self, parent: Task, task: Task) -> None:
+        parent.add_subtask(task)
+        self.add(task, parent)
+
+    def remove(self, id: str) -> None:
+        r"""Drop a task and its subtree from the index"""
+        for task in list(self.subtree(id)):
+            self.tasks.pop(task.id, None)
+            self.parents.pop(task.id, None)
+
+    def get(self, id: str) -> Task | None:
+        return self.tasks.get(id)
+
+    def parent(self, id: str) -> Task | None:
+        parent_id = self.parents.get(id)
+        return None if parent_id is None else self.tasks.get(parent_id)
+
+    def subtree(self, id: str) -> Iterator[Task]:
+        r"""Iterate over a task and its descendants, depth first"""
+        if id not in self.tasks:
+            return
+        stack = [self.tasks[id]]
+        while stack:
+            task = stack.pop()
+            yield task
+            stack.extend(reversed(task.subtasks))
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.tasks
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+
 class TaskLock:
     id: str
     status: Status = Status.confirming
@@ -220,25 +490,83 @@ class TaskLock:
     last_accessed: datetime
     background_tasks: set[asyncio.Task]
     """Track all background tasks for cleanup"""
-
-    def __init__(self, id: str, queue: asyncio.Queue, human_input: dict) -> None:
+    event_id: int
+    """Id of the last frame published to the SSE stream"""
+    replay: deque[tuple[int, str]]
+    """Recent frames kept for clients reattaching with Last-Event-ID"""
+    subscribers: int
+    """Number of clients currently attached to the SSE stream"""
+    stream_task: asyncio.Task | None
+    """Background task producing the SSE stream, independent of client connections"""
+    stream_closed: bool
+    loop: asyncio.AbstractEventLoop | None
+    """Event loop owning the queue, puts from other threads or loops are marshalled onto it"""
+    task_index: TaskIndex
+    """Camel tasks of this chat by id"""
+    metrics: TaskMetrics
+    """Token, latency and tool usage of the agents of this task"""
+
+    def __init__(self, id: str, queue: asyncio.Queue, human_input: dict, replay_size: int = 1000) -> None:
         self.id = id
         self.queue = queue
         self.human_input = human_input
         self.created_at = datetime.now()
         self.last_accessed = datetime.now()
         self.background_tasks = set()
+        self.event_id = 0
+        self.replay = deque(maxlen=replay_size)
+        self.subscribers = 0
+        self.stream_task = None
+        self.stream_closed = False
+        self._frame_event = asyncio.Event()
+        self._detached_count = 0
+        self.loop = _running_loop()
+        self.task_index = TaskIndex()
+        self.startup_latency: dict[str, float] = {}
+        self.metrics = TaskMetrics()
+        self.artifacts: ArtifactStore | None = None
+        memo_ttl = float(env("tool_memo_ttl", "300"))
+        self.tool_memo = ToolMemo(int(env("tool_memo_max_entries", "256")), memo_ttl) if memo_ttl > 0 else None
+
+    def _foreign_loop(self) -> asyncio.AbstractEventLoop | None:
+        r"""Return the owning loop when the caller runs outside of it"""
+        if self.loop is None or self.loop.is_closed() or self.loop is _running_loop():
+            return None
+        return self.loop
 
     async def put_queue(self, data: ActionData):
         self.last_accessed = datetime.now()
-        await self.queue.put(data)
+        loop = self._foreign_loop()
+        if loop is None:
+            await self.queue.put(data)
+        else:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.queue.put(data), loop))
+
+    def emit(self, data: ActionData) -> None:
+        r"""Enqueue an event without blocking, safe to call from any thread"""
+        loop = self._foreign_loop()
+        if loop is not None:
+            loop.call_soon_threadsafe(self._emit, data)
+        elif _running_loop() is not None:
+            self._emit(data)
+        else:
+            logger.warning(f"Task {self.id} has no running event loop, dropping {data.action}")
+
+    def _emit(self, data: ActionData):
+        self.add_background_task(asyncio.create_task(self.put_queue(data)))
 
     async def get_queue(self):
         self.last_accessed = datetime.now()
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
         return await self.queue.get()
 
     async def put_human_input(self, agent: str, data: Any = None):
-        await self.human_input[agent].put(data)
+        loop = self._foreign_loop()
+        if loop is None:
+            await self.human_input[agent].put(data)
+        else:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.human_input[agent].put(data), loop))
 
     async def get_human_input(self, agent: str):
         return await self.human_input[agent].get()
@@ -246,13 +574,111 @@ class TaskLock:
     def add_human_input_listen(self, agent: str):
         self.human_input[agent] = asyncio.Queue(1)
 
+    def queue_stats(self) -> dict[str, Any]:
+        r"""Return queue depth and overflow counters for this task"""
+        if isinstance(self.queue, TaskQueue):
+            return self.queue.stats()
+        return {"size": self.queue.qsize(), "maxsize": self.queue.maxsize}
+
+    def retained_bytes(self) -> int:
+        r"""Estimate the memory held by queued events and replay frames"""
+        queued = sum(len(item.model_dump_json()) for item in list(getattr(self.queue, "_queue", ())))
+        return queued + sum(len(frame) for _, frame in self.replay)
+
+    def lock_stats(self) -> dict[str, Any]:
+        r"""Summarize the lock for the admin endpoint"""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "last_accessed": self.last_accessed,
+            "queue": self.queue_stats(),
+            "subscribers": self.subscribers,
+            "background_tasks": len(self.background_tasks),
+            "replay_frames": len(self.replay),
+            "retained_bytes": self.retained_bytes(),
+            "startup_latency": self.startup_latency,
+        }
+
     def add_background_task(self, task: asyncio.Task) -> None:
         r"""Add a task to track and clean up weak references"""
         self.background_tasks.add(task)
         task.add_done_callback(lambda t: self.background_tasks.discard(t))
 
+    def start_stream(self, frames: AsyncIterator[str]) -> None:
+        r"""Produce the SSE stream in the background so it outlives client connections"""
+        self.stream_task = asyncio.create_task(self._run_stream(frames))
+
+    async def _run_stream(self, frames: AsyncIterator[str]):
+        try:
+            async for value in frames:
+                self.publish(value)
+        except Exception as e:
+            logger.error(f"Stream of task {self.id} stopped: {e}")
+        finally:
+            self.stream_closed = True
+            self._notify_subscribers()
+
+    def publish(self, value: str) -> str:
+        r"""Assign event ids to the frames of a write and keep them for replay"""
+        framed = []
+        for frame in value.split("\n\n"):
+            if not frame.strip():
+                continue
+            self.event_id += 1
+            frame = f"id: {self.event_id}\n{frame}\n\n"
+            self.replay.append((self.event_id, frame))
+            framed.append(frame)
+        self._notify_subscribers()
+        return "".join(framed)
+
+    def _notify_subscribers(self):
+        self._frame_event.set()
+        self._frame_event = asyncio.Event()
+
+    async def subscribe(self, last_event_id: int = 0) -> AsyncGenerator[str, None]:
+        r"""Yield frames after `last_event_id`, then follow the stream until it closes.
+
+        When frames the client has not seen already left the replay buffer, a replay_gap frame comes
+        first, so the client reloads the task state instead of silently missing events. That happens
+        when it reattaches late or falls more than the buffer behind, and when its id is from another
+        stream of the task.
+        """
+        self.subscribers += 1
+        try:
+            while True:
+                waiter = self._frame_event
+                closed = self.stream_closed
+                if self.replay and (self.replay[0][0] > last_event_id + 1 or last_event_id > self.event_id):
+                    gap = sse_json(
+                        Action.replay_gap, {"last_event_id": last_event_id, "next_event_id": self.replay[0][0]}
+                    )
+                    frames = [gap, *(frame for _, frame in self.replay)]
+                else:
+                    frames = [frame for event_id, frame in self.replay if event_id > last_event_id]
+                if frames:
+                    last_event_id = self.replay[-1][0]
+                    yield "".join(frames)
+                if closed:
+                    break
+                await waiter.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.stream_closed:
+                self._detached_count += 1
+                self.add_background_task(asyncio.create_task(self._stop_if_detached(self._detached_count)))
+
+    async def _stop_if_detached(self, detached_count: int):
+        r"""Stop the task when no client reattaches within the grace period"""
+        await asyncio.sleep(float(env("sse_reattach_timeout", "60")))
+        if self.subscribers == 0 and not self.stream_closed and detached_count == self._detached_count:
+            logger.warning(f"No client reattached to task {self.id}, stopping it")
+            await self.put_queue(ActionStopData())
+
     async def cleanup(self):
         r"""Cancel all background tasks and clean up resources"""
+        if self.stream_task is not None and self.stream_task is not asyncio.current_task():
+            self.stream_task.cancel()
         for task in list(self.background_tasks):
             if not task.done():
                 task.cancel()
@@ -263,10 +689,93 @@ class TaskLock:
         self.background_tasks.clear()
 
 
+def _running_loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class TaskReaper:
+    r"""Expire task locks not accessed for `ttl`, using a min-heap of deadlines.
+
+    Accessing a lock only moves its `last_accessed`, the heap entry is pushed back
+    to the new deadline lazily when it comes up, so touching a lock stays O(1).
+    """
+
+    def __init__(self, ttl: timedelta) -> None:
+        self.ttl = ttl
+        self.deadlines: list[tuple[datetime, str]] = []
+        self.scheduled: dict[str, datetime] = {}
+        """Deadline of the live heap entry per task, older entries are skipped"""
+        self.reaped = 0
+        self._wakeup: asyncio.Event | None = None
+
+    def schedule(self, task_lock: TaskLock, deadline: datetime | None = None) -> None:
+        deadline = deadline or task_lock.last_accessed + self.ttl
+        self.scheduled[task_lock.id] = deadline
+        heapq.heappush(self.deadlines, (deadline, task_lock.id))
+        if self._wakeup is not None and self.deadlines[0][1] == task_lock.id:
+            self._wakeup.set()
+
+    def discard(self, id: str) -> None:
+        r"""Forget a deleted task, its heap entry is skipped when it comes up"""
+        self.scheduled.pop(id, None)
+
+    def pop_expired(self, now: datetime) -> list[str]:
+        r"""Pop the tasks whose deadline passed, rescheduling the ones touched since"""
+        expired = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, id = heapq.heappop(self.deadlines)
+            if self.scheduled.get(id) != deadline:
+                continue
+            task_lock = task_locks.get(id)
+            if task_lock is None:
+                del self.scheduled[id]
+            elif task_lock.subscribers > 0:
+                # A client is still attached to the stream
+                self.schedule(task_lock, now + self.ttl)
+            elif task_lock.last_accessed + self.ttl > now:
+                self.schedule(task_lock)
+            else:
+                del self.scheduled[id]
+                expired.append(id)
+        return expired
+
+    def next_timeout(self, now: datetime) -> float | None:
+        if not self.deadlines:
+            return None
+        return max((self.deadlines[0][0] - now).total_seconds(), 0)
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.next_timeout(datetime.now()))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            for id in self.pop_expired(datetime.now()):
+                try:
+                    logger.warning(f"Cleaning up stale task lock: {id}")
+                    await delete_task_lock(id)
+                    self.reaped += 1
+                except Exception as e:
+                    logger.error(f"Error cleaning up stale task lock {id}: {e}")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "ttl": self.ttl.total_seconds(),
+            "scheduled": len(self.scheduled),
+            "reaped": self.reaped,
+            "next_expiry": self.deadlines[0][0] if self.deadlines else None,
+        }
+
+
 task_locks = dict[str, TaskLock]()
+task_reaper = TaskReaper(timedelta(seconds=float(env("task_lock_ttl", "7200"))))
 # Cleanup task for removing stale task locks
 _cleanup_task: asyncio.Task | None = None
-task_index: dict[str, weakref.ref[Task]] = {}
 
 
 def get_task_lock(id: str) -> TaskLock:
@@ -278,12 +787,20 @@ def get_task_lock(id: str) -> TaskLock:
 def create_task_lock(id: str) -> TaskLock:
     if id in task_locks:
         raise ProgramException("Task already exists")
-    task_locks[id] = TaskLock(id=id, queue=asyncio.Queue(), human_input={})
+    queue = TaskQueue(
+        maxsize=int(env("task_queue_size", "1000")),
+        policy=QueuePolicy(env("task_queue_policy", QueuePolicy.drop_oldest.value)),
+    )
+    task_locks[id] = TaskLock(
+        id=id, queue=queue, human_input={}, replay_size=int(env("sse_replay_size", "1000"))
+    )
 
     # Start cleanup task if not running
-    # global _cleanup_task
-    # if _cleanup_task is None or _cleanup_task.done():
-    #     _cleanup_task = asyncio.create_task(_periodic_cleanup())
+    global _cleanup_task
+    task_reaper.schedule(task_locks[id])
+    loop = _running_loop()
+    if loop is not None and (_cleanup_task is None or _cleanup_task.done() or _cleanup_task.get_loop() is not loop):
+        _cleanup_task = asyncio.create_task(_periodic_cleanup())
 
     return task_locks[id]
 
@@ -297,55 +814,16 @@ async def delete_task_lock(id: str):
     await task_lock.cleanup()
 
     del task_locks[id]
+    task_reaper.discard(id)
     logger.debug(f"Deleted task lock {id}, remaining locks: {len(task_locks)}")
 
 
-def get_camel_task(id: str, tasks: list[Task]) -> None | Task:
-    if id in task_index:
-        task_ref = task_index[id]
-        task = task_ref()
-        if task is not None:
-            return task
-        else:
-            # Weak reference died, remove from index
-            del task_index[id]
-
-    # Fallback to search and rebuild index
-    for item in tasks:
-        # Add to index
-        task_index[item.id] = weakref.ref(item)
-
-        if item.id == id:
-            return item
-        else:
-            task = get_camel_task(id, item.subtasks)
-            if task is not None:
-                return task
-    return None
-
-
 async def _periodic_cleanup():
-    r"""Periodically clean up stale task locks"""
-    while True:
-        try:
-            await asyncio.sleep(300)  # Run every 5 minutes
-
-            current_time = datetime.now()
-            stale_timeout = timedelta(hours=2)  # Consider tasks stale after 2 hours
-
-            stale_ids = []
-            for task_id, task_lock in task_locks.items():
-                if current_time - task_lock.last_accessed > stale_timeout:
-                    stale_ids.append(task_id)
-
-            for task_id in stale_ids:
-                logger.warning(f"Cleaning up stale task lock: {task_id}")
-                await delete_task_lock(task_id)
-
-        except asyncio.CancelledError:
-            break
-        except Exception as e:
-            logger.error(f"Error in periodic cleanup: {e}")
+    r"""Clean up stale task locks as their deadlines expire"""
+    try:
+        await task_reaper.run()
+    except asyncio.CancelledError:
+        pass
 
 
 process_task = ContextVar[str]("id")
@@ -0,0 +1,87 @@
+import copy
+import hashlib
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable
+
+
+class ToolMemo:
+    r"""Results of idempotent tool calls of a task, shared by all of its agents.
+
+    Tools opt in with listen_toolkit(memoize=True). Entries expire after ttl seconds and the least
+    recently used are dropped beyond max_entries. Agents run tools from worker threads as well as the
+    event loop, so every access takes the lock.
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(func: Callable[..., Any], args: tuple, kwargs: dict[str, Any]) -> str:
+        r"""Key of a call by tool, normalized arguments and the modification time of files they name"""
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        toolkit, *_ = bound.arguments.values()
+        arguments = {
+            name: value.strip() if isinstance(value, str) else value
+            for name, value in list(bound.arguments.items())[1:]
+        }
+        stamps = file_stamps(arguments.values(), getattr(toolkit, "working_directory", None))
+        payload = json.dumps([func.__qualname__, arguments, stamps], sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, tool_name: str, key: str) -> tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses[tool_name] = self.misses.get(tool_name, 0) + 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits[tool_name] = self.hits.get(tool_name, 0) + 1
+            return True, copy.deepcopy(entry[1])
+
+    def put(self, key: str, result: Any) -> None:
+        if reports_error(result):
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def reports_error(result: Any) -> bool:
+    r"""Tools report failures such as a search quota or a missing file in their result, those are not kept"""
+    if isinstance(result, list) and result:
+        result = result[0]
+    if isinstance(result, dict):
+        return "error" in result
+    return isinstance(result, str) and result.startswith(("Error", "Failed"))
+
+
+def file_stamps(values: Any, working_directory: str | None) -> list[tuple[str, int, int]]:
+    r"""Modification time and size of the existing files among string arguments, so edits invalidate entries"""
+    stamps = []
+    for value in values:
+        for candidate in value if isinstance(value, (list, tuple)) else [value]:
+            if not isinstance(candidate, str) or not candidate:
+                continue
+            path = Path(candidate).expanduser()
+            if not path.is_absolute() and working_directory:
+                path = Path(working_directory) / path
+            try:
+                stat = path.stat()
+            except (OSError, ValueError):
+                continue
+            stamps.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return stamps
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from camel.toolkits import FunctionTool, MCPToolkit
+from loguru import logger
+from app.component.environment import env
+from app.model.chat import Chat
+from app.utils.agent import agent_model_backend, connect_mcp_toolkit
+from app.utils.toolkit.google_drive_mcp_toolkit import GoogleDriveMCPToolkit
+
+
+class WorkforceTemplate:
+    r"""The task independent parts of a workforce, built before the task that uses them.
+
+    Agents and toolkits are bound to their task id and working directory, so they are still built per
+    task. What a template saves is the slow part that does not depend on the task: connecting the
+    installed MCP servers and the Google Drive MCP server, and creating the model backend.
+    """
+
+    def __init__(
+        self,
+        options: Chat,
+        mcp_toolkit: MCPToolkit | None,
+        gdrive_toolkit: GoogleDriveMCPToolkit | None,
+        build_seconds: float,
+    ):
+        self.options = options
+        self.mcp_toolkit = mcp_toolkit
+        self.gdrive_toolkit = gdrive_toolkit
+        self.mcp_tools: list[FunctionTool] = mcp_toolkit.get_tools() if mcp_toolkit is not None else []
+        self.gdrive_tools: list[FunctionTool] = gdrive_toolkit.get_tools() if gdrive_toolkit is not None else []
+        self.build_seconds = build_seconds
+
+    def bind(self, task_id: str) -> None:
+        r"""Hand the template to a task, the template was built with the id of an earlier one"""
+        self.options.task_id = task_id
+        if self.gdrive_toolkit is not None:
+            self.gdrive_toolkit.api_task_id = task_id
+
+    async def disconnect(self) -> None:
+        for toolkit in (self.mcp_toolkit, self.gdrive_toolkit):
+            if toolkit is None:
+                continue
+            try:
+                await toolkit.disconnect()
+            except Exception as e:
+                logger.warning(f"Failed to disconnect workforce template toolkit: {e!r}")
+
+
+class WorkforceTemplateCache:
+    r"""Keep one template warm per (model config, installed MCP set, enabled toolkits).
+
+    A template is handed to a single task, since MCP sessions are not shared between tasks, and a
+    replacement starts building as soon as one is taken, so the next task with the same settings finds
+    one ready. A chat prewarms its key when it opens, while its question is still being confirmed.
+    Templates are disconnected when their task ends, when they are evicted and on shutdown.
+    """
+
+    def __init__(self, max_keys: int = 4, wait_timeout: float = 30) -> None:
+        self.max_keys = max_keys
+        self.wait_timeout = wait_timeout
+        self.templates: OrderedDict[tuple, asyncio.Task[WorkforceTemplate]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._discarding: set[asyncio.Task] = set()
+
+    @staticmethod
+    def key(options: Chat) -> tuple:
+        return (
+            options.model_platform,
+            options.model_type,
+            hashlib.sha256(options.api_key.encode()).hexdigest()[:16] if options.api_key else None,
+            options.api_url,
+            json.dumps(options.extra_params, sort_keys=True, default=str),
+            json.dumps(options.installed_mcp, sort_keys=True, default=str),
+            env("GDRIVE_CREDENTIALS_PATH"),
+            json.dumps(options.get_bun_env(), sort_keys=True),
+        )
+
+    def prewarm(self, options: Chat) -> None:
+        r"""Start building a template for these settings unless one is warm or building already"""
+        if env("workforce_template", "on") != "on":
+            return
+        key = self.key(options)
+        if key in self.templates:
+            self.templates.move_to_end(key)
+            return
+        self._store(key, asyncio.create_task(self.build(options.model_copy(deep=True))))
+
+    async def take(self, options: Chat) -> WorkforceTemplate | None:
+        r"""The warm template for these settings, None when there is none yet"""
+        if env("workforce_template", "on") != "on":
+            return None
+        key = self.key(options)
+        building = self.templates.pop(key, None)
+        template = None
+        if building is not None:
+            try:
+                # A template still being built is at least ahead of building from scratch, unless it hangs
+                template = await asyncio.wait_for(asyncio.shield(building), self.wait_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Workforce template is still building, building the workforce from scratch")
+                self._store(key, building)
+            except asyncio.CancelledError:
+                self._store(key, building)
+                raise
+            except Exception as e:
+                logger.warning(f"Workforce template failed to build, building the workforce from scratch: {e!r}")
+        # Keep one warm for the next task with these settings
+        self.prewarm(options)
+        if template is None:
+            self.misses += 1
+            return None
+        template.bind(options.task_id)
+        self.hits += 1
+        return template
+
+    async def release(self, options: Chat, template: WorkforceTemplate | None) -> None:
+        r"""The task is done with its template, disconnect it and make sure one is warm for the next task"""
+        if template is not None:
+            await template.disconnect()
+        self.prewarm(options)
+
+    def _store(self, key: tuple, building: asyncio.Task[WorkforceTemplate]) -> None:
+        if key in self.templates:
+            self._discard(building)
+            return
+        self.templates[key] = building
+        while len(self.templates) > self.max_keys:
+            _, evicted = self.templates.popitem(last=False)
+            self._discard(evicted)
+
+    def _discard(self, building: asyncio.Task[WorkforceTemplate]) -> None:
+        # Cancelling a build halfway through connecting could leave MCP processes behind, so the build
+        # is let finish and its template disconnected
+        task = asyncio.create_task(self._disconnect(building))
+        self._discarding.add(task)
+        task.add_done_callback(self._discarding.discard)
+
+    @staticmethod
+    async def _disconnect(building: asyncio.Task[WorkforceTemplate]) -> None:
+        try:
+            template = await building
+        except BaseException:
+            return
+        await template.disconnect()
+
+    async def close(self) -> None:
+        r"""Disconnect every template on shutdown"""
+        while self.templates:
+            _, building = self.templates.popitem()
+            self._discard(building)
+        await asyncio.gather(*self._discarding, return_exceptions=True)
+
+    @staticmethod
+    async def build(options: Chat) -> WorkforceTemplate:
+        started = time.perf_counter()
+        agent_model_backend(options)
+        mcp_toolkit, gdrive_toolkit = await asyncio.gather(
+            connect_mcp_toolkit(options.installed_mcp),
+            GoogleDriveMCPToolkit.connect_can_use(options.task_id, options.get_bun_env()),
+            return_exceptions=True,
+        )
+        errors = [result for result in (mcp_toolkit, gdrive_toolkit) if isinstance(result, BaseException)]
+        if errors:
+            # Do not leave the half that did connect running
+            for toolkit in (mcp_toolkit, gdrive_toolkit):
+                if toolkit is not None and not isinstance(toolkit, BaseException):
+                    await toolkit.disconnect()
+            raise errors[0]
+        return WorkforceTemplate(options, mcp_toolkit, gdrive_toolkit, round(time.perf_counter() - started, 3))
+
+    def stats(self) -> dict:
+        return {
+            "templates": len(self.templates),
+            "ready": sum(
+                1 for task in self.templates.values() if task.done() and not task.cancelled() and not task.exception()
+            ),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+workforce_templates = WorkforceTemplateCache(
+    int(env("workforce_template_keys", "4")), float(env("workforce_template_wait_timeout", "30"))
+)
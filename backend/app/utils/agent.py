@@ -1,24 +1,39 @@
 import asyncio
+import contextlib
 import json
 import os
 import platform
+import time
 from threading import Event
 import traceback
+from contextvars import ContextVar
 from typing import Any, Callable, Dict, List, Tuple
 import uuid
 from app.utils import traceroot_wrapper as traceroot
 from camel.agents import ChatAgent
 from camel.agents.chat_agent import StreamingChatAgentResponse, AsyncStreamingChatAgentResponse
 from camel.agents._types import ToolCallRequest
+from camel.agents._utils import safe_model_dump
 from camel.memories import AgentMemory
-from camel.messages import BaseMessage
-from camel.models import BaseModelBackend, ModelFactory, ModelManager, OpenAIAudioModels, ModelProcessingError
+from camel.messages import BaseMessage, FunctionCallingMessage
+from camel.models import BaseModelBackend, ModelManager, OpenAIAudioModels, ModelProcessingError
 from camel.responses import ChatAgentResponse
 from camel.terminators import ResponseTerminator
 from camel.toolkits import FunctionTool, RegisteredAgentToolkit
 from camel.types.agents import ToolCallingRecord
 from app.component.environment import env
+from app.service.artifacts import result_text
+from app.utils.model_pool import model_pool
+from app.utils.model_router import RoutedModelBackend
+from app.utils.response_cache import (
+    cached_agents,
+    get_response_cache,
+    message_content,
+    with_task_id,
+    without_task_id,
+)
 from app.utils.toolkit.abstract_toolkit import AbstractToolkit
+from app.utils.toolkit.artifact_toolkit import ArtifactToolkit
 from app.utils.toolkit.hybrid_browser_toolkit import HybridBrowserToolkit
 from app.utils.toolkit.excel_toolkit import ExcelToolkit
 from app.utils.toolkit.file_write_toolkit import FileToolkit
@@ -46,7 +61,7 @@ from app.utils.toolkit.twitter_toolkit import TwitterToolkit
 from app.utils.toolkit.linkedin_toolkit import LinkedInToolkit
 from app.utils.toolkit.reddit_toolkit import RedditToolkit
 from app.utils.toolkit.slack_toolkit import SlackToolkit
-from camel.types import ModelPlatformType, ModelType
+from camel.types import ModelPlatformType, ModelType, OpenAIBackendRole
 from camel.toolkits import MCPToolkit, ToolkitMessageIntegration
 import datetime
 from pydantic import BaseModel
@@ -59,16 +74,49 @@ from app.service.task import (
     Action,
     ActionActivateAgentData,
     ActionActivateToolkitData,
+    ActionAgentDeltaData,
     ActionBudgetNotEnough,
     ActionCreateAgentData,
     ActionDeactivateAgentData,
     ActionDeactivateToolkitData,
+    AgentDataDict,
     Agents,
+    TaskLock,
     get_task_lock,
 )
 from app.service.task import set_process_task
 
 
+class MeteredStream:
+    r"""The chunks of a streamed model call, noting when the model finished and the usage it reported"""
+
+    def __init__(self, stream: Any) -> None:
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.finished_at: float | None = None
+        self.usage: Dict[str, int] | None = None
+
+    def _see(self, chunk: Any) -> None:
+        if getattr(chunk, "usage", None):
+            self.usage = safe_model_dump(chunk.usage)
+        if self.finished_at is None and chunk.choices and chunk.choices[0].finish_reason:
+            self.finished_at = time.perf_counter()
+
+    def seconds(self) -> float:
+        # Tools of the turn run before camel reads past the finishing chunk, they are not model time
+        return (self.finished_at or time.perf_counter()) - self.started
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self._see(chunk)
+            yield chunk
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self._see(chunk)
+            yield chunk
+
+
 class ListenChatAgent(ChatAgent):
     @traceroot.trace()
     def __init__(
@@ -127,26 +175,93 @@ class ListenChatAgent(ChatAgent):
         )
         self.api_task_id = api_task_id
         self.agent_name = agent_name
+        self._started_tool_calls: Dict[str, asyncio.Task] = {}
+        self._tool_semaphore: asyncio.Semaphore | None = None
+        self._toolkit_locks: Dict[int, asyncio.Lock] = {}
 
     process_task_id: str = ""
+    # Running estimate of the context size and the estimate at which it is counted exactly again
+    _context_estimate: int | None = None
+    _context_next_check: int = 0
+
+    def _response_cache_key(self, input_message: BaseMessage | str, response_format: type[BaseModel] | None) -> str | None:
+        r"""Cache key of this step, None when this agent's responses are not cached.
+
+        The task id is taken out of the prompts, it is in task descriptions and working directories,
+        so the same request in another task is a hit.
+        """
+        if response_format is not None or self.agent_name not in cached_agents():
+            return None
+        config = {k: v for k, v in self.model_backend.model_config_dict.items() if k not in ("user", "stream")}
+        messages = [
+            (
+                str(record.memory_record.role_at_backend),
+                without_task_id(record.memory_record.message.content, self.api_task_id),
+            )
+            for record in self.memory.retrieve()
+        ]
+        messages.append(("user", without_task_id(message_content(input_message), self.api_task_id)))
+        return get_response_cache().key(
+            {"model_type": str(self.model_backend.model_type), "config": config},
+            messages,
+            sorted([*self._internal_tools, *self._external_tool_schemas]),
+        )
+
+    def _cache_lookup(self, key: str | None) -> str | None:
+        if key is None:
+            return None
+        content = get_response_cache().get(self.agent_name, key)
+        return None if content is None else with_task_id(content, self.api_task_id)
+
+    def _cached_response(self, content: str | None, input_message: BaseMessage | str) -> ChatAgentResponse | None:
+        if content is None:
+            return None
+        if not isinstance(input_message, BaseMessage):
+            input_message = BaseMessage.make_user_message(role_name="User", content=input_message)
+        # Keep memory as it would be after a real step so follow up prompts still see the exchange
+        self.update_memory(input_message, OpenAIBackendRole.USER)
+        message = BaseMessage.make_assistant_message(role_name=self.role_name, content=content)
+        self.record_message(message)
+        return ChatAgentResponse(
+            msgs=[message],
+            terminated=False,
+            info={
+                "id": None,
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                "termination_reasons": ["stop"],
+                "num_tokens": 0,
+                "tool_calls": [],
+                "external_tool_call_requests": None,
+                "cached": True,
+            },
+        )
+
+    def _cache_response(self, key: str | None, res: ChatAgentResponse) -> None:
+        # Only plain final answers are replayable, tool calls have side effects
+        if key is None or res.terminated or len(res.msgs) != 1 or res.info.get("tool_calls"):
+            return
+        get_response_cache().put(
+            self.agent_name,
+            key,
+            without_task_id(res.msgs[0].content, self.api_task_id),
+            res.info["usage"]["total_tokens"],
+        )
 
     @traceroot.trace()
     def step(
         self,
         input_message: BaseMessage | str,
         response_format: type[BaseModel] | None = None,
-    ) -> ChatAgentResponse | StreamingChatAgentResponse:
+    ) -> ChatAgentResponse:
         task_lock = get_task_lock(self.api_task_id)
-        asyncio.create_task(
-            task_lock.put_queue(
-                ActionActivateAgentData(
-                    data={
-                        "agent_name": self.agent_name,
-                        "process_task_id": self.process_task_id,
-                        "agent_id": self.agent_id,
-                        "message": input_message.content if isinstance(input_message, BaseMessage) else input_message,
-                    },
-                )
+        task_lock.emit(
+            ActionActivateAgentData(
+                data={
+                    "agent_name": self.agent_name,
+                    "process_task_id": self.process_task_id,
+                    "agent_id": self.agent_id,
+                    "message": input_message.content if isinstance(input_message, BaseMessage) else input_message,
+                },
             )
         )
         error_info = None
@@ -156,14 +271,20 @@ class ListenChatAgent(ChatAgent):
             f"Agent {self.agent_name} starting step with message: {input_message.content if isinstance(input_message, BaseMessage) else input_message}"
         )
         try:
-            res = super().step(input_message, response_format)
+            cache_key = self._response_cache_key(input_message, response_format)
+            res = self._cached_response(self._cache_lookup(cache_key), input_message)
+            if res is None:
+                res = super().step(input_message, response_format)
+                if isinstance(res, StreamingChatAgentResponse):
+                    res = self._stream_deltas_sync(res)
+                self._cache_response(cache_key, res)
         except ModelProcessingError as e:
             res = None
             error_info = e
             if "Budget has been exceeded" in str(e):
                 message = "Budget has been exceeded"
                 traceroot_logger.warning(f"Agent {self.agent_name} budget exceeded")
-                asyncio.create_task(task_lock.put_queue(ActionBudgetNotEnough()))
+                task_lock.emit(ActionBudgetNotEnough())
             else:
                 message = str(e)
                 traceroot_logger.error(f"Agent {self.agent_name} model processing error: {e}")
@@ -180,20 +301,19 @@ class ListenChatAgent(ChatAgent):
             message = res.msg.content if res.msg else ""
             total_tokens = res.info["usage"]["total_tokens"]
             traceroot_logger.info(f"Agent {self.agent_name} completed step, tokens used: {total_tokens}")
+        self._record_step(task_lock, res)
 
         assert message is not None
 
-        asyncio.create_task(
-            task_lock.put_queue(
-                ActionDeactivateAgentData(
-                    data={
-                        "agent_name": self.agent_name,
-                        "process_task_id": self.process_task_id,
-                        "agent_id": self.agent_id,
-                        "message": message,
-                        "tokens": total_tokens,
-                    },
-                )
+        task_lock.emit(
+            ActionDeactivateAgentData(
+                data={
+                    "agent_name": self.agent_name,
+                    "process_task_id": self.process_task_id,
+                    "agent_id": self.agent_id,
+                    "message": message,
+                    "tokens": total_tokens,
+                },
             )
         )
 
@@ -229,9 +349,16 @@ class ListenChatAgent(ChatAgent):
         )
 
         try:
-            res = await super().astep(input_message, response_format)
-            if isinstance(res, AsyncStreamingChatAgentResponse):
-                res = await res._get_final_response()
+            cache_key = self._response_cache_key(input_message, response_format)
+            # The cache is sqlite on disk, keep its reads and writes off the event loop
+            content = await asyncio.to_thread(self._cache_lookup, cache_key) if cache_key else None
+            res = self._cached_response(content, input_message)
+            if res is None:
+                res = await super().astep(input_message, response_format)
+                if isinstance(res, AsyncStreamingChatAgentResponse):
+                    res = await self._stream_deltas(res)
+                if cache_key:
+                    await asyncio.to_thread(self._cache_response, cache_key, res)
         except ModelProcessingError as e:
             res = None
             error_info = e
@@ -250,11 +377,15 @@ class ListenChatAgent(ChatAgent):
             traceroot_logger.error(f"Agent {self.agent_name} unexpected error in step: {e}", exc_info=True)
             message = f"Error processing message: {e!s}"
             total_tokens = 0
+        finally:
+            # A stop or error can end the step before camel awaited every call of the last turn
+            await self._cancel_started_tool_calls()
 
         if res is not None:
             message = res.msg.content if res.msg else ""
             total_tokens = res.info["usage"]["total_tokens"]
             traceroot_logger.info(f"Agent {self.agent_name} completed step, tokens used: {total_tokens}")
+        self._record_step(task_lock, res)
 
         assert message is not None
 
@@ -277,6 +408,244 @@ class ListenChatAgent(ChatAgent):
         assert res is not None
         return res
 
+    def update_memory(
+        self,
+        message: BaseMessage,
+        role: OpenAIBackendRole,
+        timestamp: float | None = None,
+    ) -> None:
+        super().update_memory(message, role, timestamp)
+        budget = int(env("agent_context_budget", "0"))
+        if budget <= 0:
+            return
+        # Counting the whole context on every write is quadratic over a task, so writes only add their
+        # own tokens to an estimate and the context is counted exactly once the estimate crosses the budget
+        if self._context_estimate is not None:
+            try:
+                self._context_estimate += self.model_backend.token_counter.count_tokens_from_messages(
+                    [message.to_openai_message(role)]
+                )
+            except Exception:
+                self._context_estimate = None
+        # Tool results and new inputs are what grow the context, check the budget after those
+        if role in (OpenAIBackendRole.FUNCTION, OpenAIBackendRole.USER) and (
+            self._context_estimate is None or self._context_estimate > max(budget, self._context_next_check)
+        ):
+            self.compact_memory(budget)
+
+    def _counted_context(self, tokens: int, budget: int) -> None:
+        self._context_estimate = tokens
+        # Still over budget with nothing left to compact, wait for a tenth of the budget more before counting again
+        self._context_next_check = tokens + budget // 10 if tokens > budget else budget
+
+    def _context_tokens(self) -> int:
+        try:
+            return self.memory.get_context()[1]
+        except RuntimeError:
+            # The context no longer fits the model, which is over any budget
+            return self.model_backend.token_limit + 1
+
+    def compact_memory(self, budget: int) -> bool:
+        r"""Shrink old tool results once the context is over budget tokens.
+
+        The latest agent_context_keep records stay verbatim. Older tool results are replaced by a short
+        stub holding the start of the output, which is usually enough for the agent to remember what
+        the call found. Returns whether anything was compacted.
+        """
+        before = self._context_tokens()
+        self._counted_context(before, budget)
+        if before <= budget:
+            return False
+        keep = int(env("agent_context_keep", "8"))
+        head = int(env("agent_context_stub_chars", "300"))
+        records = [context.memory_record for context in self.memory.retrieve()]
+        compacted = False
+        for i, record in enumerate(records[: max(len(records) - keep, 0)]):
+            message = record.message
+            if not (isinstance(message, FunctionCallingMessage) and message.result is not None):
+                continue
+            result = message.result if isinstance(message.result, str) else repr(message.result)
+            if len(result) <= head or (message.meta_dict or {}).get("compacted"):
+                continue
+            stub = FunctionCallingMessage(
+                role_name=message.role_name,
+                role_type=message.role_type,
+                meta_dict={**(message.meta_dict or {}), "compacted": True},
+                content=message.content,
+                func_name=message.func_name,
+                args=message.args,
+                result=f"[{message.func_name} result compacted, {len(result)} chars, beginning with:]\n{result[:head]}",
+                tool_call_id=message.tool_call_id,
+            )
+            records[i] = record.model_copy(update={"message": stub})
+            compacted = True
+        if not compacted:
+            return False
+        self.memory.clear()
+        self.memory.write_records(records)
+        after = self._context_tokens()
+        self._counted_context(after, budget)
+        get_task_lock(self.api_task_id).metrics.record_compaction(
+            self.agent_name, str(self.model_backend.model_type), before, after
+        )
+        traceroot_logger.info(f"Agent {self.agent_name} compacted its context from {before} to {after} tokens")
+        return True
+
+    def _record_step(self, task_lock: TaskLock, res: ChatAgentResponse | None) -> None:
+        task_lock.metrics.record_step(
+            self.agent_name,
+            str(self.model_backend.model_type),
+            res.info.get("usage") if res is not None else None,
+            [record.tool_name for record in res.info.get("tool_calls") or []] if res is not None else [],
+            failed=res is None,
+        )
+
+    def _record_model_call(self, seconds: float, usage: Dict[str, int] | None) -> None:
+        get_task_lock(self.api_task_id).metrics.record_model_call(
+            self.agent_name, str(self.model_backend.model_type), seconds, usage
+        )
+
+    def _get_model_response(self, *args, **kwargs):
+        started = time.perf_counter()
+        response = None
+        try:
+            response = super()._get_model_response(*args, **kwargs)
+            return response
+        finally:
+            self._record_model_call(time.perf_counter() - started, response.usage_dict if response is not None else None)
+
+    async def _aget_model_response(self, *args, **kwargs):
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await super()._aget_model_response(*args, **kwargs)
+            self._start_tool_calls(response.tool_call_requests)
+            return response
+        finally:
+            self._record_model_call(time.perf_counter() - started, response.usage_dict if response is not None else None)
+
+    # With agent_stream on camel calls the model and the tools on its streaming path, which bypasses
+    # the methods above. The overrides below meter those calls and run their tools the same way.
+
+    def _process_stream_chunks_with_accumulator(self, stream, *args, **kwargs):
+        metered = MeteredStream(stream)
+        try:
+            result = yield from super()._process_stream_chunks_with_accumulator(metered, *args, **kwargs)
+        except Exception:
+            self._record_model_call(metered.seconds(), None)
+            raise
+        self._record_model_call(metered.seconds(), metered.usage)
+        return result
+
+    async def _aprocess_stream_chunks_with_accumulator(self, stream, *args, **kwargs):
+        metered = MeteredStream(stream)
+        try:
+            async for item in super()._aprocess_stream_chunks_with_accumulator(metered, *args, **kwargs):
+                if isinstance(item, tuple):
+                    # The last item, camel stops iterating once it has it
+                    self._record_model_call(metered.seconds(), metered.usage)
+                yield item
+        except Exception:
+            self._record_model_call(metered.seconds(), None)
+            raise
+
+    async def _execute_tools_async_with_status_accumulator(self, accumulated_tool_calls, *args, **kwargs):
+        requests = [self._stream_tool_request(data) for data in accumulated_tool_calls.values() if data.get("complete")]
+        self._start_tool_calls([request for request in requests if request is not None])
+        async for response in super()._execute_tools_async_with_status_accumulator(
+            accumulated_tool_calls, *args, **kwargs
+        ):
+            yield response
+
+    def _execute_tool_from_stream_data(self, tool_call_data: Dict[str, Any]) -> ToolCallingRecord | None:
+        request = self._stream_tool_request(tool_call_data)
+        if request is None or request.tool_name not in self._internal_tools:
+            return super()._execute_tool_from_stream_data(tool_call_data)
+        return self._execute_tool(request)
+
+    async def _aexecute_tool_from_stream_data(self, tool_call_data: Dict[str, Any]) -> ToolCallingRecord | None:
+        request = self._stream_tool_request(tool_call_data)
+        if request is None or request.tool_name not in self._internal_tools:
+            return await super()._aexecute_tool_from_stream_data(tool_call_data)
+        return await self._aexecute_tool(request)
+
+    @staticmethod
+    def _stream_tool_request(tool_call_data: Dict[str, Any]) -> ToolCallRequest | None:
+        try:
+            args = json.loads(tool_call_data["function"]["arguments"])
+        except (json.JSONDecodeError, KeyError, TypeError):
+            # camel reports the malformed call
+            return None
+        return ToolCallRequest(tool_name=tool_call_data["function"]["name"], args=args, tool_call_id=tool_call_data["id"])
+
+    async def _stream_deltas(self, res: AsyncStreamingChatAgentResponse) -> ChatAgentResponse:
+        r"""Consume a streaming response, forwarding its new content as coalesced agent_delta frames.
+
+        Each chunk carries the full content so far, tool calls included as status lines, so the
+        delta is what the client has not seen yet. Content that no longer extends what was sent is
+        sent whole with replace set.
+        """
+        task_lock = get_task_lock(self.api_task_id)
+        interval = float(env("agent_delta_interval", "0.1"))
+        max_chars = int(env("agent_delta_chars", "200"))
+        sent = ""
+        flushed_at = time.monotonic()
+
+        async def flush(content: str):
+            nonlocal sent, flushed_at
+            flushed_at = time.monotonic()
+            delta = self._agent_delta(sent, content)
+            sent = content
+            if delta is not None:
+                await task_lock.put_queue(delta)
+
+        async for chunk in res:
+            content = chunk.msg.content if chunk.msg else ""
+            if time.monotonic() - flushed_at >= interval or len(content) - len(sent) >= max_chars:
+                await flush(content)
+        final = await res._get_final_response()
+        content = final.msg.content if final.msg else ""
+        if content != sent:
+            await flush(content)
+        return final
+
+    def _stream_deltas_sync(self, res: StreamingChatAgentResponse) -> ChatAgentResponse:
+        r"""The blocking counterpart of _stream_deltas for step"""
+        task_lock = get_task_lock(self.api_task_id)
+        interval = float(env("agent_delta_interval", "0.1"))
+        max_chars = int(env("agent_delta_chars", "200"))
+        sent = ""
+        flushed_at = time.monotonic()
+        final = ChatAgentResponse(msgs=[], terminated=False, info={})
+        for final in res:
+            content = final.msg.content if final.msg else ""
+            if content != sent and (time.monotonic() - flushed_at >= interval or len(content) - len(sent) >= max_chars):
+                flushed_at = time.monotonic()
+                delta, sent = self._agent_delta(sent, content), content
+                if delta is not None:
+                    task_lock.emit(delta)
+        content = final.msg.content if final.msg else ""
+        if content != sent:
+            delta = self._agent_delta(sent, content)
+            if delta is not None:
+                task_lock.emit(delta)
+        return final
+
+    def _agent_delta(self, sent: str, content: str) -> ActionAgentDeltaData | None:
+        replace = not content.startswith(sent)
+        delta = content if replace else content[len(sent) :]
+        if not (delta or replace):
+            return None
+        return ActionAgentDeltaData(
+            data={
+                "agent_name": self.agent_name,
+                "process_task_id": self.process_task_id,
+                "agent_id": self.agent_id,
+                "delta": delta,
+                "replace": replace,
+            },
+        )
+
     @traceroot.trace()
     def _execute_tool(self, tool_call_request: ToolCallRequest) -> ToolCallingRecord:
         func_name = tool_call_request.tool_name
@@ -298,17 +667,15 @@ class ListenChatAgent(ChatAgent):
                 traceroot_logger.debug(
                     f"Agent {self.agent_name} executing tool: {func_name} from toolkit: {toolkit_name} with args: {json.dumps(args, ensure_ascii=False)}"
                 )
-                asyncio.create_task(
-                    task_lock.put_queue(
-                        ActionActivateToolkitData(
-                            data={
-                                "agent_name": self.agent_name,
-                                "process_task_id": self.process_task_id,
-                                "toolkit_name": toolkit_name,
-                                "method_name": func_name,
-                                "message": json.dumps(args, ensure_ascii=False),
-                            },
-                        )
+                task_lock.emit(
+                    ActionActivateToolkitData(
+                        data={
+                            "agent_name": self.agent_name,
+                            "process_task_id": self.process_task_id,
+                            "toolkit_name": toolkit_name,
+                            "method_name": func_name,
+                            "message": json.dumps(args, ensure_ascii=False),
+                        },
                     )
                 )
                 raw_result = tool(**args)
@@ -323,19 +690,22 @@ class ListenChatAgent(ChatAgent):
                 else:
                     result = raw_result
                     mask_flag = False
-                asyncio.create_task(
-                    task_lock.put_queue(
-                        ActionDeactivateToolkitData(
-                            data={
-                                "agent_name": self.agent_name,
-                                "process_task_id": self.process_task_id,
-                                "toolkit_name": toolkit_name,
-                                "method_name": func_name,
-                                "message": result if isinstance(result, str) else repr(result),
-                            },
-                        )
+                text = result_text(result)
+                message = self._offload(func_name, text)
+                task_lock.emit(
+                    ActionDeactivateToolkitData(
+                        data={
+                            "agent_name": self.agent_name,
+                            "process_task_id": self.process_task_id,
+                            "toolkit_name": toolkit_name,
+                            "method_name": func_name,
+                            "message": message,
+                        },
                     )
                 )
+                if message is not text:
+                    # Memory records the handle of the artifact the event points at
+                    result = message
             except Exception as e:
                 # Capture the error message to prevent framework crash
                 error_msg = f"Error executing tool '{func_name}': {e!s}"
@@ -347,78 +717,141 @@ class ListenChatAgent(ChatAgent):
 
         return self._record_tool_calling(func_name, args, result, tool_call_id, mask_output=mask_flag)
 
+    def _offload(self, func_name: str, result: Any) -> Any:
+        store = get_task_lock(self.api_task_id).artifacts
+        return result if store is None else store.offload(func_name, result)
+
+    def _record_tool_calling(
+        self,
+        func_name: str,
+        args: Dict[str, Any],
+        result: Any,
+        tool_call_id: str,
+        mask_output: bool = False,
+    ) -> ToolCallingRecord:
+        r"""Large results go to the artifact store of the task, memory keeps a handle and a preview"""
+        return super()._record_tool_calling(
+            func_name, args, self._offload(func_name, result), tool_call_id, mask_output=mask_output
+        )
+
     @traceroot.trace()
     async def _aexecute_tool(self, tool_call_request: ToolCallRequest) -> ToolCallingRecord:
+        started = self._started_tool_calls.pop(tool_call_request.tool_call_id, None)
+        result = await started if started is not None else await self._arun_tool(tool_call_request)
+        return self._record_tool_calling(
+            tool_call_request.tool_name, tool_call_request.args, result, tool_call_request.tool_call_id
+        )
+
+    def _start_tool_calls(self, tool_call_requests: List[ToolCallRequest] | None) -> None:
+        r"""Start the tool calls of one model turn together when agent_parallel_tools is on.
+
+        camel still awaits them one by one through _aexecute_tool, so results reach memory in the order
+        the model asked for them.
+        """
+        if env("agent_parallel_tools", "off") != "on" or (self.stop_event and self.stop_event.is_set()):
+            return
+        requests = [request for request in tool_call_requests or [] if request.tool_name in self._internal_tools]
+        if len(requests) < 2:
+            return
+        if self._tool_semaphore is None:
+            self._tool_semaphore = asyncio.Semaphore(int(env("agent_tool_concurrency", "4")))
+        for request in requests:
+            self._started_tool_calls[request.tool_call_id] = asyncio.create_task(self._arun_parallel_tool(request))
+
+    async def _cancel_started_tool_calls(self) -> None:
+        r"""Cancel the tool calls started for a turn that the step returned before awaiting"""
+        started, self._started_tool_calls = self._started_tool_calls, {}
+        for task in started.values():
+            task.cancel()
+        await asyncio.gather(*started.values(), return_exceptions=True)
+
+    async def _arun_parallel_tool(self, tool_call_request: ToolCallRequest) -> Any:
+        if self.pause_event is not None and not self.pause_event.is_set():
+            await self.pause_event.wait()
+        toolkit = getattr(self._internal_tools[tool_call_request.tool_name].func, "__self__", None)
+        if getattr(toolkit, "serialize_tool_calls", False):
+            # Calls into a terminal or browser share its session, run them one at a time
+            toolkit_lock = self._toolkit_locks.setdefault(id(toolkit), asyncio.Lock())
+        else:
+            toolkit_lock = contextlib.nullcontext()
+        async with toolkit_lock, self._tool_semaphore:
+            return await self._arun_tool(tool_call_request)
+
+    async def _arun_tool(self, tool_call_request: ToolCallRequest) -> Any:
         func_name = tool_call_request.tool_name
+        args = tool_call_request.args
         tool: FunctionTool = self._internal_tools[func_name]
         if hasattr(tool.func, "__wrapped__"):
+            # listen_toolkit emits the activate and deactivate events itself
             with set_process_task(self.process_task_id):
-                return await super()._aexecute_tool(tool_call_request)
-        else:
-            args = tool_call_request.args
-            tool_call_id = tool_call_request.tool_call_id
-            task_lock = get_task_lock(self.api_task_id)
+                try:
+                    return await self._ainvoke_tool(tool, args)
+                except Exception as e:
+                    error_msg = f"Error executing async tool '{func_name}': {e!s}"
+                    logger.warning(error_msg)
+                    return f"Tool execution failed: {error_msg}"
 
-            toolkit_name = getattr(tool, "_toolkit_name") if hasattr(tool, "_toolkit_name") else "mcp_toolkit"
-            traceroot_logger.info(
-                f"Agent {self.agent_name} executing async tool: {func_name} from toolkit: {toolkit_name} with args: {json.dumps(args, ensure_ascii=False)}"
-            )
-            await task_lock.put_queue(
-                ActionActivateToolkitData(
-                    data={
-                        "agent_name": self.agent_name,
-                        "process_task_id": self.process_task_id,
-                        "toolkit_name": toolkit_name,
-                        "method_name": func_name,
-                        "message": json.dumps(args, ensure_ascii=False),
-                    },
-                )
+        task_lock = get_task_lock(self.api_task_id)
+        toolkit_name = getattr(tool, "_toolkit_name") if hasattr(tool, "_toolkit_name") else "mcp_toolkit"
+        traceroot_logger.info(
+            f"Agent {self.agent_name} executing async tool: {func_name} from toolkit: {toolkit_name} with args: {json.dumps(args, ensure_ascii=False)}"
+        )
+        await task_lock.put_queue(
+            ActionActivateToolkitData(
+                data={
+                    "agent_name": self.agent_name,
+                    "process_task_id": self.process_task_id,
+                    "toolkit_name": toolkit_name,
+                    "method_name": func_name,
+                    "message": json.dumps(args, ensure_ascii=False),
+                },
             )
-            try:
-                # Try different invocation paths in order of preference
-                if hasattr(tool, "func") and hasattr(tool.func, "async_call"):
-                    # Case: FunctionTool wrapping an MCP tool
-                    result = await tool.func.async_call(**args)
-
-                elif hasattr(tool, "async_call") and callable(tool.async_call):
-                    # Case: tool itself has async_call
-                    result = await tool.async_call(**args)
-
-                elif hasattr(tool, "func") and asyncio.iscoroutinefunction(tool.func):
-                    # Case: tool wraps a direct async function
-                    result = await tool.func(**args)
-
-                elif asyncio.iscoroutinefunction(tool):
-                    # Case: tool is itself a coroutine function
-                    result = await tool(**args)
-
-                else:
-                    # Fallback: synchronous call
-                    result = tool(**args)
-                    # Handle case where synchronous call returns a coroutine
-                    if asyncio.iscoroutine(result):
-                        result = await result
-
-            except Exception as e:
-                # Capture the error message to prevent framework crash
-                error_msg = f"Error executing async tool '{func_name}': {e!s}"
-                result = {"error": error_msg}
-                logger.warning(error_msg)
-                traceroot_logger.error(f"Async tool execution failed for {func_name}: {e}")
-                traceback.print_exc()
-
-            await task_lock.put_queue(
-                ActionDeactivateToolkitData(
-                    data={
-                        "agent_name": self.agent_name,
-                        "process_task_id": self.process_task_id,
-                        "toolkit_name": toolkit_name,
-                        "method_name": func_name,
-                        "message": result if isinstance(result, str) else repr(result),
-                    },
-                )
+        )
+        try:
+            result = await self._ainvoke_tool(tool, args)
+        except Exception as e:
+            # Capture the error message to prevent framework crash
+            error_msg = f"Error executing async tool '{func_name}': {e!s}"
+            result = {"error": error_msg}
+            logger.warning(error_msg)
+            traceroot_logger.error(f"Async tool execution failed for {func_name}: {e}")
+            traceback.print_exc()
+
+        text = result_text(result)
+        message = self._offload(func_name, text)
+        await task_lock.put_queue(
+            ActionDeactivateToolkitData(
+                data={
+                    "agent_name": self.agent_name,
+                    "process_task_id": self.process_task_id,
+                    "toolkit_name": toolkit_name,
+                    "method_name": func_name,
+                    "message": message,
+                },
             )
-        return self._record_tool_calling(func_name, args, result, tool_call_id)
+        )
+        # Memory records the handle of the artifact the event points at, the result is serialized once
+        return result if message is text else message
+
+    @staticmethod
+    async def _ainvoke_tool(tool: FunctionTool, args: Dict[str, Any]) -> Any:
+        # Try different invocation paths in order of preference
+        if hasattr(tool, "func") and hasattr(tool.func, "async_call"):
+            # Case: FunctionTool wrapping an MCP tool
+            return await tool.func.async_call(**args)
+        elif hasattr(tool, "func") and asyncio.iscoroutinefunction(tool.func):
+            # Case: tool wraps a direct async function
+            return await tool.async_call(**args) if hasattr(tool, "async_call") else await tool.func(**args)
+        elif asyncio.iscoroutinefunction(tool):
+            # Case: tool is itself a coroutine function
+            return await tool(**args)
+        # Fallback: synchronous call, most toolkit methods are. It runs in a thread, which copies the
+        # process_task context, so it neither blocks the event loop nor the other tool calls of the turn
+        result = await asyncio.to_thread(tool, **args)
+        # Handle case where synchronous call returns a coroutine
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
 
     @traceroot.trace()
     def clone(self, with_memory: bool = False) -> ChatAgent:
@@ -464,6 +897,47 @@ class ListenChatAgent(ChatAgent):
         return new_agent
 
 
+def agent_model_backend(options: Chat) -> BaseModelBackend:
+    r"""The pooled model backend for the agents of a chat, routed across its extra_models if it has any"""
+    # Streamed replies are forwarded to the client as agent_delta frames
+    model_config_dict = {"stream": True} if env("agent_stream", "off") == "on" else None
+    endpoints = [
+        model_pool.get(
+            model_platform=endpoint.model_platform,
+            model_type=endpoint.model_type,
+            api_key=endpoint.api_key,
+            url=endpoint.api_url,
+            model_config_dict=model_config_dict,
+            **{
+                k: v
+                for k, v in (endpoint.extra_params or {}).items()
+                if k not in ["model_platform", "model_type", "api_key", "url"]
+            },
+        )
+        for endpoint in [options, *options.extra_models]
+    ]
+    if options.is_cloud():
+        # The task id is sent as the user of each request, it is not part of the pool key
+        endpoints = [model_pool.for_user(endpoint, str(options.task_id)) for endpoint in endpoints]
+    return endpoints[0] if len(endpoints) == 1 else RoutedModelBackend(endpoints)
+
+
+agent_build_abandoned = ContextVar[Event | None]("agent_build_abandoned", default=None)
+"""Set once the workforce stopped waiting for the build running in this context, see build_component"""
+
+
+def announce_agent(task_lock: TaskLock, data: AgentDataDict) -> None:
+    r"""Emit create_agent for a new agent, unless its build was abandoned.
+
+    A builder on a worker thread cannot be cancelled and keeps running after its timeout, it is stopped
+    here so the client is not shown an agent the workforce left out.
+    """
+    abandoned = agent_build_abandoned.get()
+    if abandoned is not None and abandoned.is_set():
+        raise TimeoutError(f"Build of {data['agent_name']} was abandoned, not creating it")
+    task_lock.emit(ActionCreateAgentData(data=data))
+
+
 @traceroot.trace()
 def agent_model(
     agent_name: str,
@@ -476,33 +950,16 @@ def agent_model(
 ):
     task_lock = get_task_lock(options.task_id)
     agent_id = str(uuid.uuid4())
+    if tools and task_lock.artifacts is not None:
+        tools = [*tools, *ArtifactToolkit(options.task_id, agent_name).get_tools()]
     traceroot_logger.info(f"Creating agent: {agent_name} with id: {agent_id} for task: {options.task_id}")
-    asyncio.create_task(
-        task_lock.put_queue(
-            ActionCreateAgentData(data={"agent_name": agent_name, "agent_id": agent_id, "tools": tool_names or []})
-        )
-    )
+    announce_agent(task_lock, {"agent_name": agent_name, "agent_id": agent_id, "tools": tool_names or []})
 
     return ListenChatAgent(
         options.task_id,
         agent_name,
         system_message,
-        model=ModelFactory.create(
-            model_platform=options.model_platform,
-            model_type=options.model_type,
-            api_key=options.api_key,
-            url=options.api_url,
-            model_config_dict={
-                "user": str(options.task_id),
-            }
-            if options.is_cloud()
-            else None,
-            **{
-                k: v
-                for k, v in (options.extra_params or {}).items()
-                if k not in ["model_platform", "model_type", "api_key", "url"]
-            },
-        ),
+        model=agent_model_backend(options),
         # output_language=options.language,
         tools=tools,
         agent_id=agent_id,
@@ -511,6 +968,21 @@ def agent_model(
     )
 
 
+def operating_environment(working_directory: str) -> str:
+    r"""The per task part of a system message.
+
+    It goes after the static instructions of the agent role, so every task of a role sends the same
+    prompt prefix and providers can serve it from their prompt cache.
+    """
+    return f"""
+<operating_environment>
+- **System**: {platform.system()} ({platform.machine()})
+- **Working Directory**: `{working_directory}`. All local file operations must occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
+The current date is {datetime.date.today()}. For any date-related tasks, you MUST use this as the current date.
+</operating_environment>
+"""
+
+
 @traceroot.trace()
 def question_confirm_agent(options: Chat):
     return agent_model(
@@ -529,32 +1001,7 @@ def task_summary_agent(options: Chat):
     )
 
 
-@traceroot.trace()
-async def developer_agent(options: Chat):
-    working_directory = options.file_save_path()
-    traceroot_logger.info(f"Creating developer agent for task: {options.task_id} in directory: {working_directory}")
-    message_integration = ToolkitMessageIntegration(
-        message_handler=HumanToolkit(options.task_id, Agents.developer_agent).send_message_to_user
-    )
-    note_toolkit = NoteTakingToolkit(
-        api_task_id=options.task_id, agent_name=Agents.developer_agent, working_directory=working_directory
-    )
-    note_toolkit = message_integration.register_toolkits(note_toolkit)
-    web_deploy_toolkit = WebDeployToolkit(api_task_id=options.task_id)
-    web_deploy_toolkit = message_integration.register_toolkits(web_deploy_toolkit)
-    screenshot_toolkit = ScreenshotToolkit(options.task_id, working_directory=working_directory)
-    screenshot_toolkit = message_integration.register_toolkits(screenshot_toolkit)
-
-    terminal_toolkit = TerminalToolkit(options.task_id, Agents.document_agent, safe_mode=True, clone_current_env=False)
-    terminal_toolkit = message_integration.register_toolkits(terminal_toolkit)
-    tools = [
-        *HumanToolkit.get_can_use_tools(options.task_id, Agents.developer_agent),
-        *note_toolkit.get_tools(),
-        *web_deploy_toolkit.get_tools(),
-        *terminal_toolkit.get_tools(),
-        *screenshot_toolkit.get_tools(),
-    ]
-    system_message = f"""
+DEVELOPER_AGENT_PROMPT = """
 <role>
 You are a Lead Software Engineer, a master-level coding assistant with a 
 powerful and unrestricted terminal. Your primary role is to solve any 
@@ -573,13 +1020,6 @@ documents.
 and generation.
 </team_structure>
 
-<operating_environment>
-- **System**: {platform.system()} ({platform.machine()})
-- **Working Directory**: `{working_directory}`. All local file operations must 
-occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
-The current date is {datetime.date.today()}. For any date-related tasks, you MUST use this as the current date.
-</operating_environment>
-
 <mandatory_instructions>
 - You MUST use the `read_note` tool to read the notes from other agents.
 
@@ -683,6 +1123,34 @@ these tips to maximize your effectiveness:
 </collaboration_and_assistance>
 """
 
+
+@traceroot.trace()
+async def developer_agent(options: Chat):
+    working_directory = options.file_save_path()
+    traceroot_logger.info(f"Creating developer agent for task: {options.task_id} in directory: {working_directory}")
+    message_integration = ToolkitMessageIntegration(
+        message_handler=HumanToolkit(options.task_id, Agents.developer_agent).send_message_to_user
+    )
+    note_toolkit = NoteTakingToolkit(
+        api_task_id=options.task_id, agent_name=Agents.developer_agent, working_directory=working_directory
+    )
+    note_toolkit = message_integration.register_toolkits(note_toolkit)
+    web_deploy_toolkit = WebDeployToolkit(api_task_id=options.task_id)
+    web_deploy_toolkit = message_integration.register_toolkits(web_deploy_toolkit)
+    screenshot_toolkit = ScreenshotToolkit(options.task_id, working_directory=working_directory)
+    screenshot_toolkit = message_integration.register_toolkits(screenshot_toolkit)
+
+    terminal_toolkit = TerminalToolkit(options.task_id, Agents.document_agent, safe_mode=True, clone_current_env=False)
+    terminal_toolkit = message_integration.register_toolkits(terminal_toolkit)
+    tools = [
+        *HumanToolkit.get_can_use_tools(options.task_id, Agents.developer_agent),
+        *note_toolkit.get_tools(),
+        *web_deploy_toolkit.get_tools(),
+        *terminal_toolkit.get_tools(),
+        *screenshot_toolkit.get_tools(),
+    ]
+    system_message = DEVELOPER_AGENT_PROMPT + operating_environment(working_directory)
+
     return agent_model(
         Agents.developer_agent,
         BaseMessage.make_assistant_message(
@@ -700,80 +1168,24 @@ these tips to maximize your effectiveness:
     )
 
 
-@traceroot.trace()
-def search_agent(options: Chat):
-    working_directory = options.file_save_path()
-    traceroot_logger.info(f"Creating search agent for task: {options.task_id} in directory: {working_directory}")
-    message_integration = ToolkitMessageIntegration(
-        message_handler=HumanToolkit(options.task_id, Agents.search_agent).send_message_to_user
-    )
+SEARCH_AGENT_PROMPT = """
+<role>
+You are a Senior Research Analyst, a key member of a multi-agent team. Your
+primary responsibility is to conduct expert-level web research to gather,
+analyze, and document information required to solve the user's task. You
+operate with precision, efficiency, and a commitment to data quality.
+You must use the search/browser tools to get the information you need.
+</role>
 
-    web_toolkit_custom = HybridBrowserToolkit(
-        options.task_id,
-        headless=False,
-        browser_log_to_file=True,
-        stealth=True,
-        session_id=str(uuid.uuid4())[:8],
-        default_start_url="about:blank",
-        cdp_url=f"http://localhost:{env('browser_port', '9222')}",
-        enabled_tools=[
-            "browser_click",
-            "browser_type",
-            "browser_back",
-            "browser_forward",
-            "browser_switch_tab",
-            "browser_enter",
-            "browser_visit_page",
-            "browser_scroll",
-            # "browser_get_som_screenshot",
-        ],
-    )
-
-    web_toolkit_custom = message_integration.register_toolkits(web_toolkit_custom)
-    terminal_toolkit = TerminalToolkit(options.task_id, Agents.search_agent, safe_mode=True, clone_current_env=False)
-    terminal_toolkit = message_integration.register_functions([terminal_toolkit.shell_exec])
-    note_toolkit = NoteTakingToolkit(options.task_id, Agents.search_agent, working_directory=working_directory)
-    note_toolkit = message_integration.register_toolkits(note_toolkit)
-    search_tools = SearchToolkit.get_can_use_tools(options.task_id)
-    # Only register search tools if any are available
-    if search_tools:
-        search_tools = message_integration.register_functions(search_tools)
-    else:
-        search_tools = []
-
-    tools = [
-        *HumanToolkit.get_can_use_tools(options.task_id, Agents.search_agent),
-        *web_toolkit_custom.get_tools(),
-        *terminal_toolkit,
-        *note_toolkit.get_tools(),
-        *search_tools,
-    ]
-
-    system_message = f"""
-<role>
-You are a Senior Research Analyst, a key member of a multi-agent team. Your
-primary responsibility is to conduct expert-level web research to gather,
-analyze, and document information required to solve the user's task. You
-operate with precision, efficiency, and a commitment to data quality.
-You must use the search/browser tools to get the information you need.
-</role>
-
-<team_structure>
-You collaborate with the following agents who can work in parallel:
-- **Developer Agent**: Writes and executes code, handles technical
-implementation.
-- **Document Agent**: Creates and manages documents and presentations.
-- **Multi-Modal Agent**: Processes and generates images and audio.
-Your research is the foundation of the team's work. Provide them with
-comprehensive and well-documented information.
-</team_structure>
-
-<operating_environment>
-- **System**: {platform.system()} ({platform.machine()})
-- **Working Directory**: `{working_directory}`. All local file operations must
-occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
-The current date is {datetime.date.today()}. For any date-related tasks, you MUST use this as the current date.
-</operating_environment>
+<team_structure>
+You collaborate with the following agents who can work in parallel:
+- **Developer Agent**: Writes and executes code, handles technical
+implementation.
+- **Document Agent**: Creates and manages documents and presentations.
+- **Multi-Modal Agent**: Processes and generates images and audio.
+Your research is the foundation of the team's work. Provide them with
+comprehensive and well-documented information.
+</team_structure>
 
 <mandatory_instructions>
 - You MUST use the note-taking tools to record your findings. This is a
@@ -861,6 +1273,58 @@ Your approach depends on available search tools:
 </web_search_workflow>
     """
 
+
+@traceroot.trace()
+def search_agent(options: Chat):
+    working_directory = options.file_save_path()
+    traceroot_logger.info(f"Creating search agent for task: {options.task_id} in directory: {working_directory}")
+    message_integration = ToolkitMessageIntegration(
+        message_handler=HumanToolkit(options.task_id, Agents.search_agent).send_message_to_user
+    )
+
+    web_toolkit_custom = HybridBrowserToolkit(
+        options.task_id,
+        headless=False,
+        browser_log_to_file=True,
+        stealth=True,
+        session_id=str(uuid.uuid4())[:8],
+        default_start_url="about:blank",
+        cdp_url=f"http://localhost:{env('browser_port', '9222')}",
+        enabled_tools=[
+            "browser_click",
+            "browser_type",
+            "browser_back",
+            "browser_forward",
+            "browser_switch_tab",
+            "browser_enter",
+            "browser_visit_page",
+            "browser_scroll",
+            # "browser_get_som_screenshot",
+        ],
+    )
+
+    web_toolkit_custom = message_integration.register_toolkits(web_toolkit_custom)
+    terminal_toolkit = TerminalToolkit(options.task_id, Agents.search_agent, safe_mode=True, clone_current_env=False)
+    terminal_toolkit = message_integration.register_functions([terminal_toolkit.shell_exec])
+    note_toolkit = NoteTakingToolkit(options.task_id, Agents.search_agent, working_directory=working_directory)
+    note_toolkit = message_integration.register_toolkits(note_toolkit)
+    search_tools = SearchToolkit.get_can_use_tools(options.task_id)
+    # Only register search tools if any are available
+    if search_tools:
+        search_tools = message_integration.register_functions(search_tools)
+    else:
+        search_tools = []
+
+    tools = [
+        *HumanToolkit.get_can_use_tools(options.task_id, Agents.search_agent),
+        *web_toolkit_custom.get_tools(),
+        *terminal_toolkit,
+        *note_toolkit.get_tools(),
+        *search_tools,
+    ]
+
+    system_message = SEARCH_AGENT_PROMPT + operating_environment(working_directory)
+
     return agent_model(
         Agents.search_agent,
         BaseMessage.make_assistant_message(
@@ -880,39 +1344,7 @@ Your approach depends on available search tools:
     )
 
 
-@traceroot.trace()
-async def document_agent(options: Chat):
-    working_directory = options.file_save_path()
-    traceroot_logger.info(f"Creating document agent for task: {options.task_id} in directory: {working_directory}")
-    message_integration = ToolkitMessageIntegration(
-        message_handler=HumanToolkit(options.task_id, Agents.task_agent).send_message_to_user
-    )
-    file_write_toolkit = FileToolkit(options.task_id, working_directory=working_directory)
-    pptx_toolkit = PPTXToolkit(options.task_id, working_directory=working_directory)
-    pptx_toolkit = message_integration.register_toolkits(pptx_toolkit)
-    mark_it_down_toolkit = MarkItDownToolkit(options.task_id)
-    mark_it_down_toolkit = message_integration.register_toolkits(mark_it_down_toolkit)
-    excel_toolkit = ExcelToolkit(options.task_id, working_directory=working_directory)
-    excel_toolkit = message_integration.register_toolkits(excel_toolkit)
-    note_toolkit = NoteTakingToolkit(options.task_id, Agents.document_agent, working_directory=working_directory)
-    note_toolkit = message_integration.register_toolkits(note_toolkit)
-    terminal_toolkit = TerminalToolkit(options.task_id, Agents.document_agent, safe_mode=True, clone_current_env=False)
-    terminal_toolkit = message_integration.register_toolkits(terminal_toolkit)
-    tools = [
-        *file_write_toolkit.get_tools(),
-        *pptx_toolkit.get_tools(),
-        *HumanToolkit.get_can_use_tools(options.task_id, Agents.document_agent),
-        *mark_it_down_toolkit.get_tools(),
-        *excel_toolkit.get_tools(),
-        *note_toolkit.get_tools(),
-        *terminal_toolkit.get_tools(),
-        *await GoogleDriveMCPToolkit.get_can_use_tools(options.task_id, options.get_bun_env()),
-    ]
-    if env("EXA_API_KEY") or options.is_cloud():
-        search_toolkit = SearchToolkit(options.task_id, Agents.document_agent).search_exa
-        search_toolkit = message_integration.register_functions([search_toolkit])
-        tools.extend(search_toolkit)
-    system_message = f"""
+DOCUMENT_AGENT_PROMPT = """
 <role>
 You are a Documentation Specialist, responsible for creating, modifying, and 
 managing a wide range of documents. Your expertise lies in producing 
@@ -931,13 +1363,6 @@ be included in your documents.
 to be embedded in your work.
 </team_structure>
 
-<operating_environment>
-- **System**: {platform.system()} ({platform.machine()})
-- **Working Directory**: `{working_directory}`. All local file operations must 
-occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
-The current date is {datetime.date.today()}. For any date-related tasks, you MUST use this as the current date.
-</operating_environment>
-
 <mandatory_instructions>
 - Before creating any document, you MUST use the `read_note` tool to gather
     all information collected by other team members.
@@ -996,9 +1421,9 @@ Your capabilities include:
       ```python
       import json
       slides = [
-          {{"title": "Main Title", "subtitle": "Subtitle"}},
-          {{"heading": "Slide Title", "bullet_points": ["Point 1", "Point 2"]}},
-          {{"heading": "Data", "table": {{"headers": ["Col1", "Col2"], "rows": [["A", "B"]]}}}}
+          {"title": "Main Title", "subtitle": "Subtitle"},
+          {"heading": "Slide Title", "bullet_points": ["Point 1", "Point 2"]},
+          {"heading": "Data", "table": {"headers": ["Col1", "Col2"], "rows": [["A", "B"]]}}
       ]
       content_json = json.dumps(slides)
       create_presentation(content=content_json, filename="presentation.pptx")
@@ -1019,7 +1444,7 @@ Your capabilities include:
 
 - Terminal and File System:
     - You have access to a full suite of terminal tools to interact with
-    the file system within your working directory (`{working_directory}`).
+    the file system within your working directory.
     - You can execute shell commands (`shell_exec`), list files, and manage
     your workspace as needed to support your document creation tasks. To
     process and manipulate text and data for your documents, you can use
@@ -1060,6 +1485,45 @@ documents with professional quality and appropriate formatting across all
 supported formats including advanced spreadsheet functionality.
 """
 
+
+@traceroot.trace()
+async def document_agent(options: Chat, gdrive_tools: list[FunctionTool] | None = None):
+    working_directory = options.file_save_path()
+    traceroot_logger.info(f"Creating document agent for task: {options.task_id} in directory: {working_directory}")
+    message_integration = ToolkitMessageIntegration(
+        message_handler=HumanToolkit(options.task_id, Agents.task_agent).send_message_to_user
+    )
+    file_write_toolkit = FileToolkit(options.task_id, working_directory=working_directory)
+    pptx_toolkit = PPTXToolkit(options.task_id, working_directory=working_directory)
+    pptx_toolkit = message_integration.register_toolkits(pptx_toolkit)
+    mark_it_down_toolkit = MarkItDownToolkit(options.task_id)
+    mark_it_down_toolkit = message_integration.register_toolkits(mark_it_down_toolkit)
+    excel_toolkit = ExcelToolkit(options.task_id, working_directory=working_directory)
+    excel_toolkit = message_integration.register_toolkits(excel_toolkit)
+    note_toolkit = NoteTakingToolkit(options.task_id, Agents.document_agent, working_directory=working_directory)
+    note_toolkit = message_integration.register_toolkits(note_toolkit)
+    terminal_toolkit = TerminalToolkit(options.task_id, Agents.document_agent, safe_mode=True, clone_current_env=False)
+    terminal_toolkit = message_integration.register_toolkits(terminal_toolkit)
+    tools = [
+        *file_write_toolkit.get_tools(),
+        *pptx_toolkit.get_tools(),
+        *HumanToolkit.get_can_use_tools(options.task_id, Agents.document_agent),
+        *mark_it_down_toolkit.get_tools(),
+        *excel_toolkit.get_tools(),
+        *note_toolkit.get_tools(),
+        *terminal_toolkit.get_tools(),
+        *(
+            gdrive_tools
+            if gdrive_tools is not None
+            else await GoogleDriveMCPToolkit.get_can_use_tools(options.task_id, options.get_bun_env())
+        ),
+    ]
+    if env("EXA_API_KEY") or options.is_cloud():
+        search_toolkit = SearchToolkit(options.task_id, Agents.document_agent).search_exa
+        search_toolkit = message_integration.register_functions([search_toolkit])
+        tools.extend(search_toolkit)
+    system_message = DOCUMENT_AGENT_PROMPT + operating_environment(working_directory)
+
     return agent_model(
         Agents.document_agent,
         BaseMessage.make_assistant_message(
@@ -1081,71 +1545,7 @@ supported formats including advanced spreadsheet functionality.
     )
 
 
-@traceroot.trace()
-def multi_modal_agent(options: Chat):
-    working_directory = options.file_save_path()
-    traceroot_logger.info(f"Creating multi-modal agent for task: {options.task_id} in directory: {working_directory}")
-    message_integration = ToolkitMessageIntegration(
-        message_handler=HumanToolkit(options.task_id, Agents.multi_modal_agent).send_message_to_user
-    )
-    video_download_toolkit = VideoDownloaderToolkit(options.task_id, working_directory=working_directory)
-    video_download_toolkit = message_integration.register_toolkits(video_download_toolkit)
-    image_analysis_toolkit = ImageAnalysisToolkit(options.task_id)
-    image_analysis_toolkit = message_integration.register_toolkits(image_analysis_toolkit)
-
-    terminal_toolkit = TerminalToolkit(
-        options.task_id, agent_name=Agents.multi_modal_agent, safe_mode=True, clone_current_env=False
-    )
-    terminal_toolkit = message_integration.register_toolkits(terminal_toolkit)
-    note_toolkit = NoteTakingToolkit(options.task_id, Agents.multi_modal_agent, working_directory=working_directory)
-    note_toolkit = message_integration.register_toolkits(note_toolkit)
-    tools = [
-        *video_download_toolkit.get_tools(),
-        *image_analysis_toolkit.get_tools(),
-        *HumanToolkit.get_can_use_tools(options.task_id, Agents.multi_modal_agent),
-        *terminal_toolkit.get_tools(),
-        *note_toolkit.get_tools(),
-    ]
-    if options.is_cloud():
-        open_ai_image_toolkit = OpenAIImageToolkit(  # todo check llm has this model
-            options.task_id,
-            model="dall-e-3",
-            response_format="b64_json",
-            size="1024x1024",
-            quality="standard",
-            working_directory=working_directory,
-            api_key=options.api_key,
-            url=options.api_url,
-        )
-        open_ai_image_toolkit = message_integration.register_toolkits(open_ai_image_toolkit)
-        tools = [
-            *tools,
-            *open_ai_image_toolkit.get_tools(),
-        ]
-    # Convert string model_platform to enum for comparison
-    try:
-        model_platform_enum = ModelPlatformType(options.model_platform.lower())
-    except (ValueError, AttributeError):
-        model_platform_enum = None
-
-    if model_platform_enum == ModelPlatformType.OPENAI:
-        audio_analysis_toolkit = AudioAnalysisToolkit(
-            options.task_id,
-            working_directory,
-            OpenAIAudioModels(
-                api_key=options.api_key,
-                url=options.api_url,
-            ),
-        )
-        audio_analysis_toolkit = message_integration.register_toolkits(audio_analysis_toolkit)
-        tools.extend(audio_analysis_toolkit.get_tools())
-
-    if env("EXA_API_KEY") or options.is_cloud():
-        search_toolkit = SearchToolkit(options.task_id, Agents.multi_modal_agent).search_exa
-        search_toolkit = message_integration.register_functions([search_toolkit])
-        tools.extend(search_toolkit)
-
-    system_message = f"""
+MULTI_MODAL_AGENT_PROMPT = """
 <role>
 You are a Creative Content Specialist, specializing in analyzing and 
 generating various types of media content. Your expertise includes processing 
@@ -1163,13 +1563,6 @@ your analysis and generation tasks.
 presentations, and other documents.
 </team_structure>
 
-<operating_environment>
-- **System**: {platform.system()} ({platform.machine()})
-- **Working Directory**: `{working_directory}`. All local file operations must 
-occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
-The current date is {datetime.date.today()}. For any date-related tasks, you MUST use this as the current date.
-</operating_environment>
-
 <mandatory_instructions>
 - You MUST use the `read_note` tool to to gather all information collected
     by other team members and write down your findings in the notes.
@@ -1226,6 +1619,73 @@ Your goal is to help users effectively process, understand, and create
 multi-modal content across audio and visual domains.
 """
 
+
+@traceroot.trace()
+def multi_modal_agent(options: Chat):
+    working_directory = options.file_save_path()
+    traceroot_logger.info(f"Creating multi-modal agent for task: {options.task_id} in directory: {working_directory}")
+    message_integration = ToolkitMessageIntegration(
+        message_handler=HumanToolkit(options.task_id, Agents.multi_modal_agent).send_message_to_user
+    )
+    video_download_toolkit = VideoDownloaderToolkit(options.task_id, working_directory=working_directory)
+    video_download_toolkit = message_integration.register_toolkits(video_download_toolkit)
+    image_analysis_toolkit = ImageAnalysisToolkit(options.task_id)
+    image_analysis_toolkit = message_integration.register_toolkits(image_analysis_toolkit)
+
+    terminal_toolkit = TerminalToolkit(
+        options.task_id, agent_name=Agents.multi_modal_agent, safe_mode=True, clone_current_env=False
+    )
+    terminal_toolkit = message_integration.register_toolkits(terminal_toolkit)
+    note_toolkit = NoteTakingToolkit(options.task_id, Agents.multi_modal_agent, working_directory=working_directory)
+    note_toolkit = message_integration.register_toolkits(note_toolkit)
+    tools = [
+        *video_download_toolkit.get_tools(),
+        *image_analysis_toolkit.get_tools(),
+        *HumanToolkit.get_can_use_tools(options.task_id, Agents.multi_modal_agent),
+        *terminal_toolkit.get_tools(),
+        *note_toolkit.get_tools(),
+    ]
+    if options.is_cloud():
+        open_ai_image_toolkit = OpenAIImageToolkit(  # todo check llm has this model
+            options.task_id,
+            model="dall-e-3",
+            response_format="b64_json",
+            size="1024x1024",
+            quality="standard",
+            working_directory=working_directory,
+            api_key=options.api_key,
+            url=options.api_url,
+        )
+        open_ai_image_toolkit = message_integration.register_toolkits(open_ai_image_toolkit)
+        tools = [
+            *tools,
+            *open_ai_image_toolkit.get_tools(),
+        ]
+    # Convert string model_platform to enum for comparison
+    try:
+        model_platform_enum = ModelPlatformType(options.model_platform.lower())
+    except (ValueError, AttributeError):
+        model_platform_enum = None
+
+    if model_platform_enum == ModelPlatformType.OPENAI:
+        audio_analysis_toolkit = AudioAnalysisToolkit(
+            options.task_id,
+            working_directory,
+            OpenAIAudioModels(
+                api_key=options.api_key,
+                url=options.api_url,
+            ),
+        )
+        audio_analysis_toolkit = message_integration.register_toolkits(audio_analysis_toolkit)
+        tools.extend(audio_analysis_toolkit.get_tools())
+
+    if env("EXA_API_KEY") or options.is_cloud():
+        search_toolkit = SearchToolkit(options.task_id, Agents.multi_modal_agent).search_exa
+        search_toolkit = message_integration.register_functions([search_toolkit])
+        tools.extend(search_toolkit)
+
+    system_message = MULTI_MODAL_AGENT_PROMPT + operating_environment(working_directory)
+
     return agent_model(
         Agents.multi_modal_agent,
         BaseMessage.make_assistant_message(
@@ -1247,38 +1707,7 @@ multi-modal content across audio and visual domains.
     )
 
 
-@traceroot.trace()
-async def social_medium_agent(options: Chat):
-    """
-    Agent to handling tasks related to social media:
-    include toolkits: WhatsApp, Twitter, LinkedIn, Reddit, Notion, Slack, Discord and Google Suite.
-    """
-    working_directory = options.file_save_path()
-    traceroot_logger.info(f"Creating social medium agent for task: {options.task_id} in directory: {working_directory}")
-    tools = [
-        *WhatsAppToolkit.get_can_use_tools(options.task_id),
-        *TwitterToolkit.get_can_use_tools(options.task_id),
-        *LinkedInToolkit.get_can_use_tools(options.task_id),
-        *RedditToolkit.get_can_use_tools(options.task_id),
-        *await NotionMCPToolkit.get_can_use_tools(options.task_id),
-        # *SlackToolkit.get_can_use_tools(options.task_id),
-        *await GoogleGmailMCPToolkit.get_can_use_tools(options.task_id, options.get_bun_env()),
-        *GoogleCalendarToolkit.get_can_use_tools(options.task_id),
-        *HumanToolkit.get_can_use_tools(options.task_id, Agents.social_medium_agent),
-        *TerminalToolkit(options.task_id, agent_name=Agents.social_medium_agent, clone_current_env=False).get_tools(),
-        *NoteTakingToolkit(
-            options.task_id, Agents.social_medium_agent, working_directory=working_directory
-        ).get_tools(),
-        # *DiscordToolkit(options.task_id).get_tools(),  # Not supported temporarily
-        # *GoogleSuiteToolkit(options.task_id).get_tools(),  # Not supported temporarily
-    ]
-    if env("EXA_API_KEY") or options.is_cloud():
-        tools.append(FunctionTool(SearchToolkit(options.task_id, Agents.social_medium_agent).search_exa))
-    return agent_model(
-        Agents.social_medium_agent,
-        BaseMessage.make_assistant_message(
-            role_name="Social Medium Agent",
-            content=f"""
+SOCIAL_MEDIUM_AGENT_PROMPT = """
 You are a Social Media Management Assistant with comprehensive capabilities
 across multiple platforms. You MUST use the `send_message_to_user` tool to
 inform the user of every decision and action you take. Your message must
@@ -1288,10 +1717,6 @@ be a comprehensive summary of your actions, presented in a clear, detailed,
 and easy-to-read format. Avoid using markdown tables for presenting data;
 use plain text formatting instead.
 
-- **Working Directory**: `{working_directory}`. All local file operations must 
-occur here, but you can access files from any place in the file system. For all file system operations, you MUST use absolute paths to ensure precision and avoid ambiguity.
-The current date is {datetime.date.today()}. For any date-related tasks, you MUST use this as the current date.
-
 Your integrated toolkits enable you to:
 
 1. WhatsApp Business Management (WhatsAppToolkit):
@@ -1335,7 +1760,7 @@ Your integrated toolkits enable you to:
 
 9. File System Access:
    - You can use terminal tools to interact with the local file system in
-   your working directory (`{working_directory}`), for example, to access
+   your working directory, for example, to access
    files needed for posting. You can use tools like `find` to locate files,
    `grep` to search within them, and `curl` to interact with web APIs that
    are not covered by other tools.
@@ -1347,7 +1772,41 @@ operations.
 - Provide clear explanations of what actions you're taking.
 - Handle rate limits and API restrictions appropriately.
 - Ask clarifying questions when user requests are ambiguous.
-""",
+"""
+
+
+@traceroot.trace()
+async def social_medium_agent(options: Chat):
+    """
+    Agent to handling tasks related to social media:
+    include toolkits: WhatsApp, Twitter, LinkedIn, Reddit, Notion, Slack, Discord and Google Suite.
+    """
+    working_directory = options.file_save_path()
+    traceroot_logger.info(f"Creating social medium agent for task: {options.task_id} in directory: {working_directory}")
+    tools = [
+        *WhatsAppToolkit.get_can_use_tools(options.task_id),
+        *TwitterToolkit.get_can_use_tools(options.task_id),
+        *LinkedInToolkit.get_can_use_tools(options.task_id),
+        *RedditToolkit.get_can_use_tools(options.task_id),
+        *await NotionMCPToolkit.get_can_use_tools(options.task_id),
+        # *SlackToolkit.get_can_use_tools(options.task_id),
+        *await GoogleGmailMCPToolkit.get_can_use_tools(options.task_id, options.get_bun_env()),
+        *GoogleCalendarToolkit.get_can_use_tools(options.task_id),
+        *HumanToolkit.get_can_use_tools(options.task_id, Agents.social_medium_agent),
+        *TerminalToolkit(options.task_id, agent_name=Agents.social_medium_agent, clone_current_env=False).get_tools(),
+        *NoteTakingToolkit(
+            options.task_id, Agents.social_medium_agent, working_directory=working_directory
+        ).get_tools(),
+        # *DiscordToolkit(options.task_id).get_tools(),  # Not supported temporarily
+        # *GoogleSuiteToolkit(options.task_id).get_tools(),  # Not supported temporarily
+    ]
+    if env("EXA_API_KEY") or options.is_cloud():
+        tools.append(FunctionTool(SearchToolkit(options.task_id, Agents.social_medium_agent).search_exa))
+    return agent_model(
+        Agents.social_medium_agent,
+        BaseMessage.make_assistant_message(
+            role_name="Social Medium Agent",
+            content=SOCIAL_MEDIUM_AGENT_PROMPT + operating_environment(working_directory),
         ),
         options,
         tools,
@@ -1367,7 +1826,7 @@ operations.
 
 
 @traceroot.trace()
-async def mcp_agent(options: Chat):
+async def mcp_agent(options: Chat, mcp_tools: list[FunctionTool] | None = None):
     traceroot_logger.info(
         f"Creating MCP agent for task: {options.task_id} with {len(options.installed_mcp['mcpServers'])} MCP servers"
     )
@@ -1377,44 +1836,29 @@ async def mcp_agent(options: Chat):
     ]
     if len(options.installed_mcp["mcpServers"]) > 0:
         try:
-            tools = [*tools, *await get_mcp_tools(options.installed_mcp)]
+            tools = [*tools, *(mcp_tools if mcp_tools is not None else await get_mcp_tools(options.installed_mcp))]
         except Exception as e:
             logger.debug(repr(e))
 
     task_lock = get_task_lock(options.task_id)
+    if task_lock.artifacts is not None:
+        # Large MCP results are offloaded to handles that point at read_artifact
+        tools = [*tools, *ArtifactToolkit(options.task_id, Agents.mcp_agent).get_tools()]
     agent_id = str(uuid.uuid4())
     traceroot_logger.info(f"Creating MCP agent: {Agents.mcp_agent} with id: {agent_id} for task: {options.task_id}")
-    asyncio.create_task(
-        task_lock.put_queue(
-            ActionCreateAgentData(
-                data={
-                    "agent_name": Agents.mcp_agent,
-                    "agent_id": agent_id,
-                    "tools": [key for key in options.installed_mcp["mcpServers"].keys()],
-                }
-            )
-        )
+    announce_agent(
+        task_lock,
+        {
+            "agent_name": Agents.mcp_agent,
+            "agent_id": agent_id,
+            "tools": [key for key in options.installed_mcp["mcpServers"].keys()],
+        },
     )
     return ListenChatAgent(
         options.task_id,
         Agents.mcp_agent,
         system_message="You are a helpful assistant that can help users search mcp servers. The found mcp services will be returned to the user, and you will ask the user via ask_human_via_gui whether they want to install these mcp services.",
-        model=ModelFactory.create(
-            model_platform=options.model_platform,
-            model_type=options.model_type,
-            api_key=options.api_key,
-            url=options.api_url,
-            model_config_dict={
-                "user": str(options.task_id),
-            }
-            if options.is_cloud()
-            else None,
-            **{
-                k: v
-                for k, v in (options.extra_params or {}).items()
-                if k not in ["model_platform", "model_type", "api_key", "url"]
-            },
-        ),
+        model=agent_model_backend(options),
         # output_language=options.language,
         tools=tools,
         agent_id=agent_id,
@@ -1463,9 +1907,15 @@ async def get_toolkits(tools: list[str], agent_name: str, api_task_id: str):
 
 @traceroot.trace()
 async def get_mcp_tools(mcp_server: McpServers):
+    mcp_toolkit = await connect_mcp_toolkit(mcp_server)
+    return mcp_toolkit.get_tools() if mcp_toolkit is not None else []
+
+
+async def connect_mcp_toolkit(mcp_server: McpServers) -> MCPToolkit | None:
+    r"""The toolkit of the installed MCP servers, None when there are none. The caller owns its sessions"""
     traceroot_logger.info(f"Getting MCP tools for {len(mcp_server['mcpServers'])} servers")
     if len(mcp_server["mcpServers"]) == 0:
-        return []
+        return None
     
     # Ensure unified auth directory for all mcp-remote servers to avoid re-authentication on each task
     config_dict = {**mcp_server}
@@ -1483,4 +1933,4 @@ async def get_mcp_tools(mcp_server: McpServers):
     except Exception as e:
         logger.warning(f"Failed to connect MCP toolkit: {e!r}")
         traceroot_logger.error(f"Failed to connect MCP toolkit: {e}", exc_info=True)
-    return mcp_toolkit.get_tools()
+    return mcp_toolkit
@@ -1,7 +1,6 @@
 import asyncio
 from functools import wraps
 from inspect import iscoroutinefunction
-import json
 from typing import Any, Callable
 
 from loguru import logger
@@ -10,15 +9,49 @@ from app.service.task import (
     ActionDeactivateToolkitData,
     get_task_lock,
 )
+from app.service.artifacts import result_text
 from app.utils.toolkit.abstract_toolkit import AbstractToolkit
-from app.service.task import process_task
+from app.service.task import process_task, TaskLock
+
+
+def result_message(
+    task_lock: TaskLock, func_name: str, res: Any, error: Exception | None, return_msg: Callable[[Any], str] | None
+) -> tuple[str, Any]:
+    r"""The deactivate event message of a call and the result handed back to the agent.
+
+    The result is serialized once. When it is offloaded to the artifact store the agent gets the
+    handle the event shows, so it is not serialized and stored again for memory.
+    """
+    if error is not None:
+        res_msg = str(error)
+    elif return_msg:
+        res_msg = return_msg(res)
+    else:
+        try:
+            res_msg = result_text(res)
+        except (TypeError, ValueError):
+            # Handle cases where res contains non-serializable objects (like coroutines)
+            res_msg = str(res)
+    if task_lock.artifacts is None:
+        return res_msg, res
+    offloaded = task_lock.artifacts.offload(func_name, res_msg)
+    if offloaded is not res_msg and error is None and not return_msg:
+        res = offloaded
+    return offloaded, res
 
 
 def listen_toolkit(
     wrap_method: Callable[..., Any] | None = None,
     inputs: Callable[..., str] | None = None,
     return_msg: Callable[[Any], str] | None = None,
+    memoize: bool = False,
 ):
+    r"""Emit activate and deactivate toolkit events around a toolkit method.
+
+    With memoize, identical calls within the task are answered from its ToolMemo, only set it on
+    tools without side effects.
+    """
+
     def decorator(func: Callable[..., Any]):
         wrap = func if wrap_method is None else wrap_method
 
@@ -53,26 +86,20 @@ def listen_toolkit(
                         },
                     )
                 )
+                memo = task_lock.tool_memo if memoize else None
+                memo_key = memo.key(func, args, kwargs) if memo is not None else None
                 error = None
-                res = None
-                try:
-                    res = await func(*args, **kwargs)
-                except Exception as e:
-                    error = e
-
-                if return_msg and error is None:
-                    res_msg = return_msg(res)
-                elif isinstance(res, str):
-                    res_msg = res
-                else:
-                    if error is None:
-                        try:
-                            res_msg = json.dumps(res, ensure_ascii=False)
-                        except TypeError:
-                            # Handle cases where res contains non-serializable objects (like coroutines)
-                            res_msg = str(res)
+                hit, res = memo.get(func.__name__, memo_key) if memo is not None else (False, None)
+                if not hit:
+                    try:
+                        res = await func(*args, **kwargs)
+                    except Exception as e:
+                        error = e
                     else:
-                        res_msg = str(error)
+                        if memo is not None:
+                            memo.put(memo_key, res)
+
+                res_msg, res = result_message(task_lock, func.__name__, res, error, return_msg)
 
                 await task_lock.put_queue(
                     ActionDeactivateToolkitData(
@@ -82,6 +109,8 @@ def listen_toolkit(
                             "toolkit_name": toolkit_name,
                             "method_name": method_name,
                             "message": res_msg,
+                            # Present when the call was answered from the task's memo
+                            **({"memo_hits": memo.hits[func.__name__]} if hit else {}),
                         },
                     )
                 )
@@ -111,64 +140,52 @@ def listen_toolkit(
 
                 toolkit_name = toolkit.toolkit_name()
                 method_name = func.__name__.replace("_", " ")
-                task = asyncio.create_task(
-                    task_lock.put_queue(
-                        ActionActivateToolkitData(
-                            data={
-                                "agent_name": toolkit.agent_name,
-                                "process_task_id": process_task.get(""),
-                                "toolkit_name": toolkit_name,
-                                "method_name": method_name,
-                                "message": args_str,
-                            },
-                        )
+                task_lock.emit(
+                    ActionActivateToolkitData(
+                        data={
+                            "agent_name": toolkit.agent_name,
+                            "process_task_id": process_task.get(""),
+                            "toolkit_name": toolkit_name,
+                            "method_name": method_name,
+                            "message": args_str,
+                        },
                     )
                 )
-                if hasattr(task_lock, "add_background_task"):
-                    task_lock.add_background_task(task)
+                memo = task_lock.tool_memo if memoize else None
+                memo_key = memo.key(func, args, kwargs) if memo is not None else None
                 error = None
-                res = None
-                try:
-                    logger.debug(f"Executing toolkit method: {toolkit_name}.{method_name} for agent '{toolkit.agent_name}'")
-                    res = func(*args, **kwargs)
-                    # Safety check: if the result is a coroutine, we need to await it
-                    if asyncio.iscoroutine(res):
-                        import warnings
-
-                        warnings.warn(f"Async function {func.__name__} was incorrectly called synchronously")
-                        res = asyncio.run(res)
-                except Exception as e:
-                    error = e
-
-                if return_msg and error is None:
-                    res_msg = return_msg(res)
-                elif isinstance(res, str):
-                    res_msg = res
-                else:
-                    if error is None:
-                        try:
-                            res_msg = json.dumps(res, ensure_ascii=False)
-                        except TypeError:
-                            # Handle cases where res contains non-serializable objects (like coroutines)
-                            res_msg = str(res)
+                hit, res = memo.get(func.__name__, memo_key) if memo is not None else (False, None)
+                if not hit:
+                    try:
+                        logger.debug(f"Executing toolkit method: {toolkit_name}.{method_name} for agent '{toolkit.agent_name}'")
+                        res = func(*args, **kwargs)
+                        # Safety check: if the result is a coroutine, we need to await it
+                        if asyncio.iscoroutine(res):
+                            import warnings
+
+                            warnings.warn(f"Async function {func.__name__} was incorrectly called synchronously")
+                            res = asyncio.run(res)
+                    except Exception as e:
+                        error = e
                     else:
-                        res_msg = str(error)
-
-                task = asyncio.create_task(
-                    task_lock.put_queue(
-                        ActionDeactivateToolkitData(
-                            data={
-                                "agent_name": toolkit.agent_name,
-                                "process_task_id": process_task.get(""),
-                                "toolkit_name": toolkit_name,
-                                "method_name": method_name,
-                                "message": res_msg,
-                            },
-                        )
+                        if memo is not None:
+                            memo.put(memo_key, res)
+
+                res_msg, res = result_message(task_lock, func.__name__, res, error, return_msg)
+
+                task_lock.emit(
+                    ActionDeactivateToolkitData(
+                        data={
+                            "agent_name": toolkit.agent_name,
+                            "process_task_id": process_task.get(""),
+                            "toolkit_name": toolkit_name,
+                            "method_name": method_name,
+                            "message": res_msg,
+                            # Present when the call was answered from the task's memo
+                            **({"memo_hits": memo.hits[func.__name__]} if hit else {}),
+                        },
                     )
                 )
-                if hasattr(task_lock, "add_background_task"):
-                    task_lock.add_background_task(task)
                 if error is not None:
                     raise error
                 return res
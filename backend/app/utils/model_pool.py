@@ -0,0 +1,136 @@
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any
+from camel.models import BaseModelBackend, ModelFactory
+from app.component.environment import env
+
+
+class ModelPool:
+    r"""LRU pool of model backends shared by every agent of every task.
+
+    Backends are keyed by platform, model type, api key hash, url, config and extra params, so agents
+    with the same settings reuse one backend. Backends whose config differs still share the HTTP clients
+    of an earlier backend with the same endpoint and key, which keeps their keep-alive connections warm
+    across tasks. Per-task settings such as the ``user`` of cloud models are kept out of the key, see
+    ``for_user``.
+    """
+
+    def __init__(self, max_size: int = 32) -> None:
+        self.max_size = max_size
+        self.backends: OrderedDict[tuple, BaseModelBackend] = OrderedDict()
+        self.clients: OrderedDict[tuple, tuple[Any, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.client_hits = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(
+        model_platform: str,
+        model_type: str,
+        api_key: str | None,
+        url: str | None,
+        model_config_dict: dict | None,
+        extra_params: dict,
+    ) -> tuple:
+        api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else None
+        return (
+            str(model_platform),
+            str(model_type),
+            api_key_hash,
+            url,
+            json.dumps(model_config_dict, sort_keys=True, default=str),
+            json.dumps(extra_params, sort_keys=True, default=str),
+        )
+
+    def get(
+        self,
+        model_platform: str,
+        model_type: str,
+        api_key: str | None = None,
+        url: str | None = None,
+        model_config_dict: dict | None = None,
+        **extra_params,
+    ) -> BaseModelBackend:
+        key = self.key(model_platform, model_type, api_key, url, model_config_dict, extra_params)
+        with self._lock:
+            backend = self.backends.get(key)
+            if backend is not None:
+                self.backends.move_to_end(key)
+                self.hits += 1
+                return backend
+            self.misses += 1
+        backend = ModelFactory.create(
+            model_platform=model_platform,
+            model_type=model_type,
+            api_key=api_key,
+            url=url,
+            model_config_dict=model_config_dict,
+            **extra_params,
+        )
+        with self._lock:
+            # Another thread may have created the same backend meanwhile, keep the first one
+            if key in self.backends:
+                self.backends.move_to_end(key)
+                return self.backends[key]
+            self._share_clients(key, backend)
+            self.backends[key] = backend
+            while len(self.backends) > self.max_size:
+                # Agents still holding an evicted backend keep using it, it is only dropped from the pool
+                self.backends.popitem(last=False)
+                self.evictions += 1
+        return backend
+
+    @staticmethod
+    def for_user(backend: BaseModelBackend, user: str) -> BaseModelBackend:
+        r"""A view of a pooled backend that sends user with each of its requests.
+
+        The view shares the clients, token counter and endpoint stats of the pooled backend, only its
+        config is its own, so every task of a cloud model uses the same pooled backend.
+        """
+        view = copy.copy(backend)
+        view.model_config_dict = {**backend.model_config_dict, "user": user}
+        view.pooled = backend
+        return view
+
+    def _share_clients(self, key: tuple, backend: BaseModelBackend):
+        client = getattr(backend, "_client", None)
+        async_client = getattr(backend, "_async_client", None)
+        if client is None or async_client is None:
+            return
+        # Clients do not depend on the model or its config, only on the endpoint, credentials and params
+        client_key = (key[0], key[2], key[3], key[5])
+        shared = self.clients.get(client_key)
+        if shared is not None:
+            backend._client, backend._async_client = shared
+            self.clients.move_to_end(client_key)
+            self.client_hits += 1
+            return
+        self.clients[client_key] = (client, async_client)
+        while len(self.clients) > self.max_size:
+            self.clients.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.backends),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "client_hits": self.client_hits,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self.backends.clear()
+            self.clients.clear()
+
+
+model_pool = ModelPool(int(env("model_pool_size", "32")))
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Dict, List, Optional, Type
+
+from camel.messages import OpenAIMessage
+from camel.models import BaseModelBackend
+from camel.utils import BaseTokenCounter
+from loguru import logger
+from pydantic import BaseModel
+
+from app.component.environment import env
+
+
+class EndpointStats:
+    r"""Rolling latency and error rate of one model endpoint, over its last window calls"""
+
+    def __init__(self, window: int = 50) -> None:
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.last_error_at = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float | None) -> None:
+        r"""A finished call, seconds is None when it failed"""
+        with self._lock:
+            self.calls += 1
+            self.outcomes.append(seconds is None)
+            if seconds is None:
+                self.errors += 1
+                self.last_error_at = time.monotonic()
+            else:
+                self.latencies.append(seconds)
+
+    def record_hedge(self, won: bool) -> None:
+        r"""A call of this endpoint was duplicated to another one, won when the other answered first"""
+        with self._lock:
+            if won:
+                self.hedge_wins += 1
+            else:
+                self.hedges += 1
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def healthy(self, max_error_rate: float, cooldown: float) -> bool:
+        # An endpoint over the error rate gets a probe request again once the cooldown has passed
+        return self.error_rate() <= max_error_rate or time.monotonic() - self.last_error_at > cooldown
+
+    def summary(self) -> dict[str, Any]:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        with self._lock:
+            calls, errors, hedges, hedge_wins = self.calls, self.errors, self.hedges, self.hedge_wins
+        return {
+            "calls": calls,
+            "errors": errors,
+            "error_rate": round(self.error_rate(), 4),
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "hedges": hedges,
+            "hedge_wins": hedge_wins,
+        }
+
+
+_endpoint_stats: "weakref.WeakKeyDictionary[BaseModelBackend, EndpointStats]" = weakref.WeakKeyDictionary()
+_stats_lock = threading.Lock()
+
+
+def endpoint_stats(backend: BaseModelBackend) -> EndpointStats:
+    r"""Stats of a backend, shared by every router using it so they survive across tasks"""
+    # A per-task view of a pooled backend counts towards the pooled one
+    backend = getattr(backend, "pooled", backend)
+    with _stats_lock:
+        stats = _endpoint_stats.get(backend)
+        if stats is None:
+            stats = _endpoint_stats[backend] = EndpointStats(int(env("model_route_window", "50")))
+        return stats
+
+
+def endpoint_name(backend: BaseModelBackend) -> str:
+    r"""model_type@url, with a fingerprint of the API key since one url can serve several keys"""
+    name = f"{backend.model_type}@{backend._url or 'default'}"
+    if backend._api_key:
+        name += f"#{hashlib.sha256(backend._api_key.encode()).hexdigest()[:8]}"
+    return name
+
+
+def model_router_stats() -> dict[str, dict[str, Any]]:
+    with _stats_lock:
+        items = list(_endpoint_stats.items())
+    stats_by_name: dict[str, dict[str, Any]] = {}
+    for backend, stats in items:
+        name = key = endpoint_name(backend)
+        # Backends configured the same way outside the pool still get an entry each
+        index = 1
+        while key in stats_by_name:
+            index += 1
+            key = f"{name}/{index}"
+        stats_by_name[key] = stats.summary()
+    return stats_by_name
+
+
+class RoutedModelBackend(BaseModelBackend):
+    r"""Several endpoints serving the same agents, each request goes to the fastest healthy one.
+
+    Endpoints are ranked by rolling p50 latency, ones with fewer than three calls first so every
+    endpoint gets measured, and ones over model_route_max_error_rate last. A failed call moves on to the
+    next endpoint. With model_hedge on, an async call that has not answered after the p95 latency of
+    its endpoint is sent to the next endpoint as well, the first answer wins and the other is
+    cancelled, its elapsed time counting as a latency sample. Blocking calls are only routed, a thread stuck in a request cannot be cancelled.
+    """
+
+    def __init__(self, endpoints: List[BaseModelBackend]) -> None:
+        primary = endpoints[0]
+        super().__init__(
+            primary.model_type,
+            primary.model_config_dict,
+            api_key=primary._api_key,
+            url=primary._url,
+            timeout=primary._timeout,
+            max_retries=primary._max_retries,
+        )
+        self.endpoints = endpoints
+        self.max_error_rate = float(env("model_route_max_error_rate", "0.5"))
+        self.cooldown = float(env("model_route_cooldown", "30"))
+        self.hedge = env("model_hedge", "off") == "on"
+        self.hedge_min_delay = float(env("model_hedge_min_delay", "0.5"))
+        self._hedge_lost: "weakref.WeakKeyDictionary[asyncio.Task, bool]" = weakref.WeakKeyDictionary()
+
+    @property
+    def token_counter(self) -> BaseTokenCounter:
+        return self.endpoints[0].token_counter
+
+    @property
+    def token_limit(self) -> int:
+        return self.endpoints[0].token_limit
+
+    @property
+    def stream(self) -> bool:
+        return self.endpoints[0].stream
+
+    def ranked(self) -> List[BaseModelBackend]:
+        def rank(endpoint: BaseModelBackend):
+            stats = endpoint_stats(endpoint)
+            p50 = stats.quantile(0.5)
+            return (not stats.healthy(self.max_error_rate, self.cooldown), len(stats.latencies) >= 3, p50 or 0.0)
+
+        return sorted(self.endpoints, key=rank)
+
+    def hedge_delay(self, endpoint: BaseModelBackend) -> float | None:
+        p95 = endpoint_stats(endpoint).quantile(0.95)
+        return max(p95, self.hedge_min_delay) if self.hedge and p95 is not None else None
+
+    def _run(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ):
+        error: Exception | None = None
+        for endpoint in self.ranked():
+            started = time.perf_counter()
+            try:
+                response = endpoint._run(messages, response_format, tools)
+            except Exception as e:
+                endpoint_stats(endpoint).record(None)
+                logger.warning(f"Model endpoint {endpoint_name(endpoint)} failed, trying the next one: {e!r}")
+                error = e
+                continue
+            endpoint_stats(endpoint).record(time.perf_counter() - started)
+            return response
+        raise error
+
+    async def _acall(self, endpoint: BaseModelBackend, *args):
+        started = time.perf_counter()
+        try:
+            response = await endpoint._arun(*args)
+        except asyncio.CancelledError:
+            # A call that lost a hedge took at least this long, without the sample a slow endpoint that
+            # always loses would keep its old p50 and stay ranked first
+            if self._hedge_lost.get(asyncio.current_task()):
+                endpoint_stats(endpoint).record(time.perf_counter() - started)
+            raise
+        except Exception:
+            endpoint_stats(endpoint).record(None)
+            raise
+        endpoint_stats(endpoint).record(time.perf_counter() - started)
+        return response
+
+    async def _arun(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ):
+        candidates = iter(self.ranked())
+        primary = next(candidates)
+        calls = {asyncio.create_task(self._acall(primary, messages, response_format, tools)): primary}
+        pending = set(calls)
+        hedge_delay = self.hedge_delay(primary)
+        hedged = False
+        error: BaseException | None = None
+        answered = False
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The primary is slower than usual, send the request to the next endpoint as well
+                    hedge_delay = None
+                    endpoint = next(candidates, None)
+                    if endpoint is not None:
+                        hedged = True
+                        endpoint_stats(primary).record_hedge(won=False)
+                        task = asyncio.create_task(self._acall(endpoint, messages, response_format, tools))
+                        calls[task] = endpoint
+                        pending.add(task)
+                    continue
+                # A call that answered wins even when another one finished with an error at the same time
+                for task in done:
+                    if task.exception() is None:
+                        if hedged and calls[task] is not primary:
+                            endpoint_stats(primary).record_hedge(won=True)
+                        answered = True
+                        return task.result()
+                for task in done:
+                    error = task.exception()
+                    logger.warning(f"Model endpoint {endpoint_name(calls[task])} failed: {error!r}")
+                if not pending:
+                    endpoint = next(candidates, None)
+                    if endpoint is not None:
+                        task = asyncio.create_task(self._acall(endpoint, messages, response_format, tools))
+                        calls[task] = endpoint
+                        pending.add(task)
+            raise error
+        finally:
+            for task in pending:
+                # Only calls beaten by another answer are measured, not ones of a request that was stopped
+                if answered:
+                    self._hedge_lost[task] = True
+                task.cancel()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+from camel.messages import BaseMessage
+from app.component.environment import env
+
+
+class ResponseCache:
+    r"""Content addressed cache of model responses on disk.
+
+    Entries are keyed by the model, the system message, the conversation so far and the new input, so
+    a hit is a response the same agent would have been asked to produce again. The store is bounded by
+    size with least recently used eviction, and entries expire after ttl seconds.
+
+    Hits only note the access time in memory, it is written with the next put, and the total size is
+    kept as a running sum, so a lookup is a single primary key read and a put does no table scan.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, ttl: float, purge_interval: float = 60) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.stats: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+        # Access times of hits not written yet
+        self._accessed: dict[str, float] = {}
+        self._purged_at = 0.0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, role TEXT, content TEXT, tokens INTEGER, size INTEGER, "
+            "created_at REAL, accessed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(model: dict[str, Any], messages: list[tuple[str, str]], tools: list[str]) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "tools": tools}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _role_stats(self, role: str) -> dict[str, int]:
+        return self.stats.setdefault(role, {"hits": 0, "misses": 0, "saved_tokens": 0})
+
+    def get(self, role: str, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content, tokens, created_at, size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            stats = self._role_stats(role)
+            if row is None or now - row[2] > self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._size -= row[3]
+                    self._accessed.pop(key, None)
+                stats["misses"] += 1
+                return None
+            self._accessed[key] = now
+            stats["hits"] += 1
+            stats["saved_tokens"] += row[1]
+            return row[0]
+
+    def put(self, role: str, key: str, content: str, tokens: int) -> None:
+        now = time.time()
+        size = len(content.encode())
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, role, content, tokens, size, now, now),
+            )
+            self._size += size - (old[0] if old else 0)
+            self._accessed.pop(key, None)
+            if self._accessed:
+                self._db.executemany(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                    [(accessed_at, accessed_key) for accessed_key, accessed_at in self._accessed.items()],
+                )
+                self._accessed.clear()
+            if now - self._purged_at >= self.purge_interval:
+                self._purged_at = now
+                expired = self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses WHERE created_at < ?", (now - self.ttl,)
+                ).fetchone()[0]
+                if expired:
+                    self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+                    self._size -= expired
+            if self._size > self.max_bytes:
+                # Drop the least recently used entries until the store fits again
+                freed = 0
+                evict = []
+                for old_key, old_size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                    if self._size - freed <= self.max_bytes:
+                        break
+                    evict.append((old_key,))
+                    freed += old_size
+                self._db.executemany("DELETE FROM responses WHERE key = ?", evict)
+                self._size -= freed
+            self._db.commit()
+
+    def cache_stats(self) -> dict[str, Any]:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size = self._size
+            roles = {}
+            for role, stats in self.stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                roles[role] = {**stats, "hit_rate": round(stats["hits"] / lookups, 4) if lookups else None}
+            return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes, "roles": roles}
+
+
+def cached_agents() -> set[str]:
+    r"""Agent roles whose responses are cached, opt-in through llm_cache_agents"""
+    return {name.strip() for name in env("llm_cache_agents", "").split(",") if name.strip()}
+
+
+_cache: ResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                Path(env("llm_cache_path", os.path.expanduser("~/.eigent/cache/llm_responses.db"))),
+                max_bytes=int(float(env("llm_cache_max_mb", "64")) * 1024 * 1024),
+                ttl=float(env("llm_cache_ttl", str(7 * 24 * 3600))),
+            )
+        return _cache
+
+
+def response_cache_stats() -> dict[str, Any]:
+    return _cache.cache_stats() if _cache is not None else {"entries": 0, "bytes": 0, "roles": {}}
+
+
+def message_content(message: BaseMessage | str) -> str:
+    return message.content if isinstance(message, BaseMessage) else message
+
+
+TASK_ID_PLACEHOLDER = "<task_id>"
+
+
+def without_task_id(text: str, task_id: str) -> str:
+    r"""text with the task id, and with it the task's working directory, replaced by a placeholder,
+    so the same prompt of another task has the same key"""
+    return text.replace(task_id, TASK_ID_PLACEHOLDER) if task_id else text
+
+
+def with_task_id(text: str, task_id: str) -> str:
+    return text.replace(TASK_ID_PLACEHOLDER, task_id) if task_id else text
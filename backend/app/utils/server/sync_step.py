@@ -1,48 +1,299 @@
-import time
 import httpx
 import asyncio
 import os
 import json
+from pathlib import Path
 from loguru import logger
-from app.service.chat_service import Chat
+from app.model.chat import Chat, SseMessage
 from app.component.environment import env
 
 
 def sync_step(func):
     async def wrapper(*args, **kwargs):
         server_url = env("SERVER_URL")
-        sync_url = server_url + "/chat/steps" if server_url else None
+        chat: Chat = args[0] if args else None
         async for value in func(*args, **kwargs):
-            if not server_url:
-                yield value
-                continue
-
-            if isinstance(value, str) and value.startswith("data: "):
-                value_json_str = value[len("data: ") :].strip()
-            else:
-                value_json_str = value
-            json_data = json.loads(value_json_str)
-            chat: Chat = args[0] if args else None
-            if chat is not None:
-                asyncio.create_task(
-                    send_to_api(
-                        sync_url,
-                        {
-                            "task_id": chat.task_id,
-                            "step": json_data["step"],
-                            "data": json_data["data"],
-                        },
-                    )
-                )
+            if server_url and chat is not None:
+                uploader = get_step_uploader(server_url)
+                for payload in step_payloads(value):
+                    uploader.add(chat.task_id, payload)
             yield value
 
     return wrapper
 
 
-async def send_to_api(url, data):
-    async with httpx.AsyncClient() as client:
+def step_payloads(value) -> list[str]:
+    r"""JSON payloads of the frames in a write, parsed only for plain strings"""
+    if isinstance(value, SseMessage):
+        return value.payloads
+    if not isinstance(value, str):
+        return [json.dumps(value, ensure_ascii=False)]
+    # A single write may carry several frames (e.g. a collapsed toolkit call)
+    payloads = []
+    for frame in value.split("\n\n"):
+        if not frame.strip():
+            continue
+        if frame.startswith("data: "):
+            frame = frame[len("data: ") :].strip()
+        payloads.append(frame)
+    return payloads
+
+
+class StepUploader:
+    r"""Upload chat steps to the server in batches over a keep-alive connection.
+
+    Steps are appended to a local spool file before they are sent and only dropped from it once
+    the server accepted them, so a restart or a network blip does not lose them. File IO runs on a
+    worker thread from the flush loop, never on the event loop in `add`. Payloads are kept as the
+    JSON text of their SSE frame and sent grouped by task, so they are never decoded here.
+
+    Accepted steps are left at the head of the spool until they outnumber the unsent ones, so
+    rewriting it stays amortized linear in the number of steps. Until then an `#accepted <count>`
+    line appended after each accepted batch tells a restarted uploader how many to skip.
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        spool_path: Path,
+        batch_size: int = 100,
+        flush_interval: float = 1,
+        max_pending: int = 100_000,
+    ) -> None:
+        self.server_url = server_url
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # (task_id, JSON payload) of the steps not accepted yet
+        self.pending: list[tuple[str, str]] = []
+        # The spool holds `_accepted` steps already sent, then the first `_spooled` steps of pending
+        self._spooled = 0
+        self._accepted = 0
+        self.batch_supported = True
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_keepalive_connections=2))
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._closed = False
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.spool_path.exists():
+            self._load_spool()
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+        self._task = asyncio.create_task(self._run())
+
+    def _load_spool(self):
+        lines = []
+        with open(self.spool_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith(ACCEPTED_MARK):
+                    try:
+                        self._accepted = int(line[len(ACCEPTED_MARK) :])
+                    except ValueError:
+                        # Torn write of the last marker, the previous one still holds
+                        pass
+                elif line.strip():
+                    lines.append(line)
+        self._accepted = min(self._accepted, len(lines))
+        self.pending = [step for step in map(parse_spool_line, lines[self._accepted :]) if step is not None]
+        self._spooled = len(self.pending)
+        if self.pending:
+            logger.info(f"Recovered {len(self.pending)} unsent steps from {self.spool_path}")
+
+    def add(self, task_id: str, payload: str) -> None:
+        r"""Queue a step given the JSON payload of its SSE frame, it is passed through as is"""
+        self.pending.append((task_id, payload))
+        if len(self.pending) > self.max_pending:
+            dropped = len(self.pending) - self.max_pending
+            del self.pending[:dropped]
+            self._skip_spooled(dropped)
+            logger.warning(f"Step spool is full, dropped {dropped} oldest steps")
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _skip_spooled(self, count: int) -> None:
+        r"""The oldest count steps left pending, the spooled ones among them are now stale lines of the spool"""
+        skipped = min(count, self._spooled)
+        self._spooled -= skipped
+        self._accepted += skipped
+
+    async def _run(self):
+        delay = self.flush_interval
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                ok = await self.flush()
+            except Exception as e:
+                # Keep the loop alive when the spool cannot be written, the steps are still pending
+                logger.error(f"Step sync flush failed: {e}")
+                ok = False
+            # Back off while the server is unreachable
+            delay = self.flush_interval if ok else min(delay * 2, 60)
+
+    async def flush(self) -> bool:
+        r"""Send pending steps batch by batch, return False when the server did not accept them"""
+        async with self._flush_lock:
+            return await self._flush()
+
+    async def _flush(self) -> bool:
+        await self._append_spool()
+        done = 0
+        # Steps of a rejected batch left to send one by one, to drop only the invalid ones
+        isolate = 0
+        ok = True
+        while self.pending:
+            batch = self.pending[: 1 if isolate else self.batch_size]
+            try:
+                count = await self._send(batch)
+                self.sent += count
+            except Exception as e:
+                if not is_rejected(e):
+                    self.failed += 1
+                    logger.warning(f"Failed to sync {len(batch)} steps, will retry: {e}")
+                    ok = False
+                    break
+                if len(batch) > 1:
+                    isolate = len(batch)
+                    continue
+                count = 1
+                self.rejected += 1
+                logger.error(f"Dropping step of task {batch[0][0]} the server rejected: {batch[0][1][:200]!r}, {e}")
+            del self.pending[:count]
+            self._skip_spooled(count)
+            isolate = max(isolate - count, 0)
+            done += count
+        if done:
+            await self._mark_accepted()
+        return ok
+
+    async def _send(self, batch: list[tuple[str, str]]) -> int:
+        r"""Send the steps of batch, return how many of them the server took"""
+        if self.batch_supported:
+            res = await self.client.post(
+                self.server_url + "/chat/steps/batch",
+                content=batch_body(batch),
+                headers={"Content-Type": "application/json"},
+            )
+            if res.status_code not in (404, 405):
+                res.raise_for_status()
+                return len(batch)
+            logger.info("Server has no batch step endpoint, syncing steps one by one")
+            self.batch_supported = False
+        # Older servers take a single step per request, with its task id inside
+        task_id, payload = batch[0]
+        record = json.loads(payload)
+        res = await self.client.post(
+            self.server_url + "/chat/steps",
+            json={"task_id": task_id, **record} if isinstance(record, dict) else {"task_id": task_id, "data": record},
+        )
+        res.raise_for_status()
+        return 1
+
+    async def _append_spool(self):
+        steps = self.pending[self._spooled :]
+        if steps:
+            await asyncio.to_thread(self._write_spool, [f"{task_id}\t{payload}" for task_id, payload in steps])
+            self._spooled = min(self._spooled + len(steps), len(self.pending))
+
+    async def _mark_accepted(self):
+        if self._accepted > self._spooled:
+            lines = [f"{task_id}\t{payload}" for task_id, payload in self.pending[: self._spooled]]
+            self._accepted = 0
+            await asyncio.to_thread(self._rewrite_spool, lines)
+        elif self._accepted:
+            await asyncio.to_thread(self._write_spool, [f"{ACCEPTED_MARK}{self._accepted}"])
+
+    def _write_spool(self, lines: list[str]):
+        self._spool.writelines(line + "\n" for line in lines)
+        self._spool.flush()
+
+    def _rewrite_spool(self, lines: list[str]):
+        r"""Replace the spool with the steps that were not accepted yet"""
+        self._spool.close()
+        temp_path = self.spool_path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in lines)
+        os.replace(temp_path, self.spool_path)
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+
+    async def close(self):
+        self._closed = True
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
         try:
-            res = await client.post(url, json=data)
-            # logger.info(res)
+            await self.flush()
         except Exception as e:
-            logger.error(e)
+            logger.error(f"Step sync flush on close failed: {e}")
+        self._spool.close()
+        await self.client.aclose()
+
+
+ACCEPTED_MARK = "#accepted "
+
+
+def parse_spool_line(line: str) -> tuple[str, str] | None:
+    r"""(task_id, payload) of a spool line, also reading the JSON records of older spools"""
+    task_id, sep, payload = line.partition("\t")
+    if sep:
+        return task_id, payload
+    try:
+        record = json.loads(line)
+        task_id = record.pop("task_id")
+    except (ValueError, AttributeError, KeyError):
+        logger.warning(f"Skipping unreadable spool line: {line[:100]!r}")
+        return None
+    return task_id, json.dumps(record, ensure_ascii=False)
+
+
+def batch_body(batch: list[tuple[str, str]]) -> str:
+    r"""Batch request body with the steps grouped by task, payloads are spliced in as they are"""
+    tasks: dict[str, list[str]] = {}
+    for task_id, payload in batch:
+        tasks.setdefault(task_id, []).append(payload)
+    groups = ",".join(
+        f'{{"task_id": {json.dumps(task_id)}, "steps": [{",".join(payloads)}]}}' for task_id, payloads in tasks.items()
+    )
+    return f'{{"tasks": [{groups}]}}'
+
+
+def is_rejected(e: Exception) -> bool:
+    r"""Whether the steps themselves are invalid, so sending them again cannot succeed"""
+    if isinstance(e, httpx.HTTPStatusError):
+        code = e.response.status_code
+        return 400 <= code < 500 and code not in (401, 403, 408, 409, 425, 429)
+    # A payload that is not JSON, only decoded for servers without the batch endpoint
+    return isinstance(e, ValueError)
+
+
+_uploader: StepUploader | None = None
+
+
+def get_step_uploader(server_url: str) -> StepUploader:
+    global _uploader
+    if _uploader is None:
+        _uploader = StepUploader(
+            server_url,
+            Path(env("step_spool_path", os.path.expanduser("~/.eigent/runtime/step_spool.jsonl"))),
+            batch_size=int(env("step_batch_size", "100")),
+            flush_interval=float(env("step_flush_interval", "1")),
+        )
+    _uploader.server_url = server_url
+    return _uploader
+
+
+async def close_step_uploader():
+    r"""Flush and close the step uploader on shutdown"""
+    global _uploader
+    if _uploader is not None:
+        await _uploader.close()
+        _uploader = None
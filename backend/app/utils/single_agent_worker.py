@@ -1,14 +1,122 @@
+import asyncio
 import datetime
+import time
+from typing import Any
 from camel.agents.chat_agent import AsyncStreamingChatAgentResponse
-from camel.societies.workforce.single_agent_worker import SingleAgentWorker as BaseSingleAgentWorker
+from camel.societies.workforce.single_agent_worker import AgentPool, SingleAgentWorker as BaseSingleAgentWorker
 from camel.tasks.task import Task, TaskState, is_task_result_insufficient
 
+from app.component.environment import env
+from app.service.task import get_task_lock
 from app.utils.agent import ListenChatAgent
 from camel.societies.workforce.prompts import PROCESS_TASK_PROMPT
 from colorama import Fore
 from camel.societies.workforce.utils import TaskResult
 
 
+class AdaptivePool(AgentPool):
+    r"""Agent pool that clones spares ahead of the subtasks assigned to its worker.
+
+    A clone rebuilds the tools and model state of the agent, so a borrow that finds the pool empty
+    waits for a spare still being cloned, or clones one itself when none is. The workforce reserves agents as it assigns subtasks and the pool clones that
+    many spares in the background, off the event loop. Spares idle for idle_timeout are dropped.
+    """
+
+    def __init__(
+        self,
+        base_agent: ListenChatAgent,
+        initial_size: int = 1,
+        max_size: int = 10,
+        auto_scale: bool = True,
+        idle_timeout: float | None = None,
+        cleanup_interval: float | None = None,
+    ) -> None:
+        self.pending = 0
+        self._building: set[asyncio.Task] = set()
+        super().__init__(
+            base_agent,
+            initial_size=initial_size,
+            max_size=max_size,
+            auto_scale=auto_scale,
+            idle_timeout=idle_timeout or float(env("agent_pool_idle_timeout", "60")),
+            cleanup_interval=cleanup_interval or float(env("agent_pool_cleanup_interval", "15")),
+        )
+
+    def _record(self, method: str, *args: Any) -> None:
+        try:
+            metrics = get_task_lock(self.base_agent.api_task_id).metrics
+        except Exception:
+            # The task is gone, e.g. a pool still cleaning up after the task ended
+            return
+        getattr(metrics, method)(self.base_agent.agent_name, *args)
+
+    def _create_fresh_agent(self) -> ListenChatAgent:
+        started = time.perf_counter()
+        agent = super()._create_fresh_agent()
+        self._record("record_pool_clone", time.perf_counter() - started, True)
+        return agent
+
+    async def _clone(self, spare: bool) -> ListenChatAgent:
+        started = time.perf_counter()
+        agent = await asyncio.to_thread(self.base_agent.clone, with_memory=False)
+        self._total_clones_created += 1
+        self._record("record_pool_clone", time.perf_counter() - started, spare)
+        return agent
+
+    def reserve(self, count: int) -> None:
+        r"""Expect count more borrows and clone spares for those the pool cannot serve yet"""
+        self.pending += count
+        missing = min(self.pending, self.max_size) - len(self._available_agents) - len(self._building)
+        for _ in range(max(missing, 0)):
+            task = asyncio.create_task(self._add_spare())
+            self._building.add(task)
+            task.add_done_callback(self._building.discard)
+
+    async def _add_spare(self) -> None:
+        agent = await self._clone(spare=True)
+        async with self._lock:
+            if len(self._available_agents) < self.max_size:
+                self._agent_last_used[id(agent)] = time.time()
+                self._available_agents.append(agent)
+
+    async def get_agent(self) -> ListenChatAgent:
+        if not self.auto_scale:
+            return await super().get_agent()
+        async with self._lock:
+            self._total_borrows += 1
+            self.pending = max(self.pending - 1, 0)
+        while True:
+            async with self._lock:
+                if self._available_agents:
+                    agent = self._available_agents.popleft()
+                    self._in_use_agents.add(id(agent))
+                    self._pool_hits += 1
+                    self._record("record_pool_borrow", True)
+                    return agent
+            building = set(self._building)
+            if not building:
+                break
+            # A spare is already being cloned, waiting for it is quicker than starting another clone
+            await asyncio.wait(building, return_when=asyncio.FIRST_COMPLETED)
+        self._record("record_pool_borrow", False)
+        agent = await self._clone(spare=False)
+        async with self._lock:
+            self._in_use_agents.add(id(agent))
+        return agent
+
+    async def cleanup_idle_agents(self) -> None:
+        cleaned = self._agents_cleaned
+        await super().cleanup_idle_agents()
+        if self._agents_cleaned > cleaned:
+            self._record("record_pool_shrink", self._agents_cleaned - cleaned)
+        if not self._in_use_agents and not self._building:
+            # Nothing is running, reservations that never turned into borrows are stale
+            self.pending = 0
+
+    def get_stats(self) -> dict:
+        return {**super().get_stats(), "pending": self.pending, "building": len(self._building)}
+
+
 class SingleAgentWorker(BaseSingleAgentWorker):
     def __init__(
         self,
@@ -23,13 +131,22 @@ class SingleAgentWorker(BaseSingleAgentWorker):
         super().__init__(
             description=description,
             worker=worker,
-            use_agent_pool=use_agent_pool,
-            pool_initial_size=pool_initial_size,
-            pool_max_size=pool_max_size,
-            auto_scale_pool=auto_scale_pool,
+            use_agent_pool=False,
             use_structured_output_handler=use_structured_output_handler,
         )
         self.worker = worker  # change type hint
+        self.use_agent_pool = use_agent_pool
+        self.agent_pool: AdaptivePool | None = (
+            AdaptivePool(worker, pool_initial_size, pool_max_size, auto_scale_pool) if use_agent_pool else None
+        )
+
+    def reset(self) -> Any:
+        pool, self.agent_pool = self.agent_pool, None
+        if self._cleanup_task and not self._cleanup_task.done():
+            self._cleanup_task.cancel()
+        super().reset()
+        if pool:
+            self.agent_pool = AdaptivePool(self.worker, max_size=pool.max_size, auto_scale=pool.auto_scale)
 
     async def _process_task(self, task: Task, dependencies: list[Task]) -> TaskState:
         r"""Processes a task with its dependencies using an efficient agent
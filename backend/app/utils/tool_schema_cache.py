@@ -0,0 +1,83 @@
+import copy
+import hashlib
+import inspect
+import json
+import threading
+from typing import Any, Callable
+from camel.toolkits import function_tool
+
+_generate = function_tool.get_openai_tool_schema
+_validate = function_tool.FunctionTool.validate_openai_tool_schema
+_schemas: dict[tuple, dict[str, Any]] = {}
+_validated: set[str] = set()
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0}
+
+
+def schema_key(func: Callable) -> tuple | None:
+    r"""Key a function by what its schema is generated from, None when it cannot be keyed"""
+    try:
+        signature = str(inspect.signature(func))
+    except (TypeError, ValueError):
+        return None
+    doc = hashlib.sha256((func.__doc__ or "").encode()).hexdigest()
+    return (
+        getattr(func, "__module__", None),
+        getattr(func, "__qualname__", None),
+        getattr(func, "__name__", None),
+        hashlib.sha256(signature.encode()).hexdigest(),
+        doc,
+    )
+
+
+def get_openai_tool_schema(func: Callable) -> dict[str, Any]:
+    r"""Cached drop-in for camel's get_openai_tool_schema.
+
+    Toolkits are built per agent and per task, but a bound method of the same class with the same
+    signature and docstring always yields the same schema, so it is only parsed once per process.
+    """
+    key = schema_key(func)
+    if key is None:
+        return _generate(func)
+    schema = _schemas.get(key)
+    if schema is None:
+        schema = _generate(func)
+        with _lock:
+            _schemas[key] = schema
+            stats["misses"] += 1
+    else:
+        with _lock:
+            stats["hits"] += 1
+    # Tools may edit their schema in place, never hand out the cached one
+    return copy.deepcopy(schema)
+
+
+def validate_openai_tool_schema(openai_tool_schema: dict[str, Any]) -> None:
+    r"""Validate each distinct schema once, toolkits validate all their schemas on every init"""
+    digest = hashlib.sha256(json.dumps(openai_tool_schema, sort_keys=True, default=str).encode()).hexdigest()
+    if digest in _validated:
+        return
+    _validate(openai_tool_schema)
+    _validated.add(digest)
+
+
+def install() -> None:
+    r"""Make every FunctionTool built without an explicit schema and every schema validation use the cache"""
+    function_tool.get_openai_tool_schema = get_openai_tool_schema
+    function_tool.FunctionTool.validate_openai_tool_schema = staticmethod(validate_openai_tool_schema)
+
+
+def uninstall() -> None:
+    function_tool.get_openai_tool_schema = _generate
+    function_tool.FunctionTool.validate_openai_tool_schema = staticmethod(_validate)
+
+
+def clear() -> None:
+    with _lock:
+        _schemas.clear()
+        _validated.clear()
+        stats["hits"] = stats["misses"] = 0
+
+
+def cache_stats() -> dict[str, Any]:
+    return {"size": len(_schemas), **stats}
@@ -5,6 +5,9 @@ from inflection import titleize
 class AbstractToolkit:
     api_task_id: str
     agent_name: str
+    # Tools sharing state through the toolkit instance, a shell session or a browser page, set this so
+    # ListenChatAgent never runs two of its calls at once when agent_parallel_tools is on
+    serialize_tool_calls: bool = False
 
     @classmethod
     def get_can_use_tools(cls, api_task_id: str) -> list[FunctionTool]:
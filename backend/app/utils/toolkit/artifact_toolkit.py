@@ -0,0 +1,45 @@
+from camel.toolkits.base import BaseToolkit
+from camel.toolkits.function_tool import FunctionTool
+
+from app.service.task import get_task_lock
+from app.utils.listen.toolkit_listen import listen_toolkit
+from app.utils.toolkit.abstract_toolkit import AbstractToolkit
+
+
+class ArtifactToolkit(BaseToolkit, AbstractToolkit):
+    r"""Reads back tool results that were too large to keep in the conversation."""
+
+    def __init__(self, api_task_id: str, agent_name: str, timeout: float | None = None):
+        super().__init__(timeout)
+        self.api_task_id = api_task_id
+        self.agent_name = agent_name
+
+    @listen_toolkit(
+        inputs=lambda _, artifact_id, offset=0, length=4000: f"{artifact_id} from {offset}",
+        return_msg=lambda res: f"{len(res)} chars",
+    )
+    def read_artifact(self, artifact_id: str, offset: int = 0, length: int = 4000) -> str:
+        r"""Read a slice of a stored tool result. Large tool results are
+        replaced by a short preview and an artifact id, use this tool to read
+        the parts of the result you need.
+
+        Args:
+            artifact_id (str): The artifact id given with the preview.
+            offset (int): The character to start reading from.
+                (default: :obj:`0`)
+            length (int): The number of characters to read, at most 20000.
+                (default: :obj:`4000`)
+
+        Returns:
+            str: The requested characters of the stored result.
+        """
+        store = get_task_lock(self.api_task_id).artifacts
+        if store is None:
+            return "Artifacts are not enabled for this task."
+        try:
+            return store.read(artifact_id, max(offset, 0), min(max(length, 1), 20000))
+        except (ValueError, FileNotFoundError):
+            return f"Artifact {artifact_id} not found."
+
+    def get_tools(self) -> list[FunctionTool]:
+        return [FunctionTool(self.read_artifact)]
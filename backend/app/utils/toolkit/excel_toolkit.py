@@ -21,6 +21,6 @@ class ExcelToolkit(BaseExcelToolkit, AbstractToolkit):
             working_directory = env("file_save_path", os.path.expanduser("~/Downloads"))
         super().__init__(timeout=timeout, working_directory=working_directory)
 
-    @listen_toolkit(BaseExcelToolkit.extract_excel_content)
+    @listen_toolkit(BaseExcelToolkit.extract_excel_content, memoize=True)
     def extract_excel_content(self, document_path: str) -> str:
         return super().extract_excel_content(document_path)
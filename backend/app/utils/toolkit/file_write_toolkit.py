@@ -1,4 +1,3 @@
-import asyncio
 import os
 from typing import List
 from camel.toolkits import FileToolkit as BaseFileToolkit
@@ -45,18 +44,17 @@ class FileToolkit(BaseFileToolkit, AbstractToolkit):
         res = super().write_to_file(title, content, filename, encoding, use_latex)
         if "Content successfully written to file: " in res:
             task_lock = get_task_lock(self.api_task_id)
-            asyncio.create_task(
-                task_lock.put_queue(
-                    ActionWriteFileData(
-                        process_task_id=process_task.get(),
-                        data=res.replace("Content successfully written to file: ", ""),
-                    )
+            task_lock.emit(
+                ActionWriteFileData(
+                    process_task_id=process_task.get(),
+                    data=res.replace("Content successfully written to file: ", ""),
                 )
             )
         return res
 
     @listen_toolkit(
         BaseFileToolkit.read_file,
+        memoize=True,
     )
     def read_file(self, file_paths: str | list[str]) -> str | dict[str, str]:
         return super().read_file(file_paths)
@@ -32,14 +32,25 @@ class GoogleDriveMCPToolkit(BaseGoogleDriveMCPToolkit, AbstractToolkit):
             timeout=timeout,
         )
 
+    def get_tools(self) -> list[FunctionTool]:
+        tools = []
+        for item in super().get_tools():
+            setattr(item, "_toolkit_name", self.__class__.__name__)
+            tools.append(item)
+        return tools
+
     @classmethod
-    async def get_can_use_tools(cls, api_task_id: str, input_env: dict[str, str] | None = None) -> list[FunctionTool]:
+    async def connect_can_use(
+        cls, api_task_id: str, input_env: dict[str, str] | None = None
+    ) -> "GoogleDriveMCPToolkit | None":
+        r"""A connected toolkit, None without Google Drive credentials. The caller owns its session"""
         if env("GDRIVE_CREDENTIALS_PATH") is None:
-            return []
+            return None
         toolkit = cls(api_task_id, 180, env("GDRIVE_CREDENTIALS_PATH"), input_env)
         await toolkit.connect()
-        tools = []
-        for item in toolkit.get_tools():
-            setattr(item, "_toolkit_name", cls.__name__)
-            tools.append(item)
-        return tools
+        return toolkit
+
+    @classmethod
+    async def get_can_use_tools(cls, api_task_id: str, input_env: dict[str, str] | None = None) -> list[FunctionTool]:
+        toolkit = await cls.connect_can_use(api_task_id, input_env)
+        return toolkit.get_tools() if toolkit is not None else []
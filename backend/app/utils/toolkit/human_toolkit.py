@@ -1,4 +1,3 @@
-import asyncio
 from camel.toolkits.base import BaseToolkit
 from loguru import logger
 from camel.toolkits.function_tool import FunctionTool
@@ -105,12 +104,10 @@ class HumanToolkit(BaseToolkit, AbstractToolkit):
             print(message_attachment)
         logger.info(f"\nAgent Message:\n{message_title} {message_description} {message_attachment}")
         task_lock = get_task_lock(self.api_task_id)
-        asyncio.create_task(
-            task_lock.put_queue(
-                ActionNoticeData(
-                    process_task_id=process_task.get(""),
-                    data=f"{message_description}",
-                )
+        task_lock.emit(
+            ActionNoticeData(
+                process_task_id=process_task.get(""),
+                data=f"{message_description}",
             )
         )
 
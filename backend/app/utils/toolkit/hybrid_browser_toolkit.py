@@ -305,6 +305,7 @@ websocket_connection_pool = WebSocketConnectionPool()
 
 class HybridBrowserToolkit(BaseHybridBrowserToolkit, AbstractToolkit):
     agent_name: str = Agents.search_agent
+    serialize_tool_calls: bool = True
 
     def __init__(
         self,
@@ -13,6 +13,6 @@ class MarkItDownToolkit(BaseMarkItDownToolkit, AbstractToolkit):
         self.api_task_id = api_task_id
         super().__init__(timeout)
 
-    @listen_toolkit(BaseMarkItDownToolkit.read_files)
+    @listen_toolkit(BaseMarkItDownToolkit.read_files, memoize=True)
     def read_files(self, file_paths: List[str]) -> Dict[str, str]:
         return super().read_files(file_paths)
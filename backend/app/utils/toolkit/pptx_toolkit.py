@@ -1,4 +1,3 @@
-import asyncio
 import os
 from camel.toolkits import PPTXToolkit as BasePPTXToolkit
 
@@ -38,7 +37,5 @@ class PPTXToolkit(BasePPTXToolkit, AbstractToolkit):
         res = super().create_presentation(content, filename, template)
         if "PowerPoint presentation successfully created" in res:
             task_lock = get_task_lock(self.api_task_id)
-            asyncio.create_task(
-                task_lock.put_queue(ActionWriteFileData(process_task_id=process_task.get(), data=str(file_path)))
-            )
+            task_lock.emit(ActionWriteFileData(process_task_id=process_task.get(), data=str(file_path)))
         return res
@@ -51,6 +51,7 @@ class SearchToolkit(BaseSearchToolkit, AbstractToolkit):
     @listen_toolkit(
         BaseSearchToolkit.search_google,
         lambda _, query, search_type="web": f"with query '{query}' and {search_type} result pages",
+        memoize=True,
     )
     def search_google(self, query: str, search_type: str = "web") -> list[dict[str, Any]]:
         if env("GOOGLE_API_KEY") and env("SEARCH_ENGINE_ID"):
@@ -163,7 +164,9 @@ class SearchToolkit(BaseSearchToolkit, AbstractToolkit):
     # def search_bing(self, query: str) -> dict[str, Any]:
     #     return super().search_bing(query)
 
-    @listen_toolkit(BaseSearchToolkit.search_exa, lambda _, query, *args, **kwargs: f"{query}, {args}, {kwargs}")
+    @listen_toolkit(
+        BaseSearchToolkit.search_exa, lambda _, query, *args, **kwargs: f"{query}, {args}, {kwargs}", memoize=True
+    )
     def search_exa(
         self,
         query: str,
@@ -1,4 +1,3 @@
-import asyncio
 import os
 from pathlib import Path
 from typing import Any, Dict
@@ -13,6 +12,7 @@ from app.service.task import process_task
 
 class TerminalToolkit(BaseTerminalToolkit, AbstractToolkit):
     agent_name: str = Agents.developer_agent
+    serialize_tool_calls: bool = True
 
     def __init__(
         self,
@@ -49,17 +49,13 @@ class TerminalToolkit(BaseTerminalToolkit, AbstractToolkit):
         task_lock = get_task_lock(self.api_task_id)
         # This method will be called during init. At that time, the process_task_id parameter does not exist, so it is set to be empty default
         process_task_id = process_task.get("")
-        task = asyncio.create_task(
-            task_lock.put_queue(
-                ActionTerminalData(
-                    action=Action.terminal,
-                    process_task_id=process_task_id,
-                    data=output,
-                )
+        task_lock.emit(
+            ActionTerminalData(
+                action=Action.terminal,
+                process_task_id=process_task_id,
+                data=output,
             )
         )
-        if hasattr(task_lock, "add_background_task"):
-            task_lock.add_background_task(task)
 
     def _ensure_uv_available(self) -> bool:
         self.uv_path = uv()
@@ -1,4 +1,5 @@
 import asyncio
+from collections import Counter
 from typing import Generator, List
 from camel.agents import ChatAgent
 from camel.societies.workforce.workforce import (
@@ -19,7 +20,6 @@ from app.service.task import (
     ActionAssignTaskData,
     ActionEndData,
     ActionTaskStateData,
-    get_camel_task,
     get_task_lock,
 )
 from app.utils.single_agent_worker import SingleAgentWorker
@@ -123,7 +123,17 @@ class Workforce(BaseWorkforce):
         # Task assignment phase: send "waiting for execution" notification to the frontend, and send "start execution" notification when the task actually begins execution
         assigned = await super()._find_assignee(tasks)
 
+        # Let each worker clone spares for its subtasks now, not when they start
+        demand = Counter(item.assignee_id for item in assigned.assignments)
+        for child in self._children:
+            if isinstance(child, SingleAgentWorker) and child.agent_pool and demand[child.node_id]:
+                child.agent_pool.reserve(demand[child.node_id])
+
         task_lock = get_task_lock(self.api_task_id)
+        if any(item.task_id not in task_lock.task_index for item in assigned.assignments):
+            # Subtasks created by the workforce itself, e.g. when a failed task is decomposed again
+            for pending in tasks:
+                task_lock.task_index.add(pending, pending.parent)
         for item in assigned.assignments:
             # DEBUG ▶ Task has been assigned to which worker and its dependencies
             logger.debug(f"[WF] ASSIGN {item.task_id} -> {item.assignee_id} deps={item.dependencies}")
@@ -131,7 +141,7 @@ class Workforce(BaseWorkforce):
             if self._task and item.task_id == self._task.id:
                 continue
             # Find task content
-            task_obj = get_camel_task(item.task_id, tasks)
+            task_obj = task_lock.task_index.get(item.task_id)
             content = task_obj.content if task_obj else ""
             # Asynchronously send waiting notification
             task = asyncio.create_task(
@@ -233,6 +243,8 @@ class Workforce(BaseWorkforce):
         logger.debug(f"[WF] FAIL  {task.id} retry={task.failure_count}")
 
         result = await super()._handle_failed_task(task)
+        if not result:
+            get_task_lock(self.api_task_id).metrics.record_retry(task.id)
 
         error_message = ""
         if self.metrics_logger and hasattr(self.metrics_logger, "log_entries"):
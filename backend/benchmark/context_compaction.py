@@ -0,0 +1,77 @@
+r"""Prompt tokens per step of a tool heavy worker with and without context compaction.
+
+Run from the backend directory:
+
+    uv run python -m benchmark.context_compaction --steps 10 --budget 12000
+
+Each step feeds a worker agent a new prompt, tool calls returning pages of text and a reply, the way
+a search or developer agent fills its memory, and reports the prompt the next model call would send.
+No model is called, the model backend is only used to count tokens.
+"""
+
+import argparse
+import os
+import random
+import string
+
+from camel.messages import BaseMessage
+from camel.models import ModelFactory
+from camel.types import OpenAIBackendRole
+
+from app.service.task import create_task_lock, task_locks
+from app.utils.agent import ListenChatAgent
+
+
+def page(chars: int) -> str:
+    words = ("".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))) for _ in range(chars // 4))
+    return " ".join(words)[:chars]
+
+
+def run(name: str, args, budget: int) -> list[int]:
+    os.environ["agent_context_budget"] = str(budget)
+    random.seed(0)
+    task_id = f"bench_{name}"
+    create_task_lock(task_id)
+    agent = ListenChatAgent(
+        task_id,
+        "search_agent",
+        "You are a research agent. Use your tools to answer the task.",
+        model=ModelFactory.create(args.platform, args.model, api_key="benchmark"),
+    )
+    prompts = []
+    for step in range(args.steps):
+        agent.update_memory(
+            BaseMessage.make_user_message(role_name="User", content=f"Subtask {step}: look into topic {step}"),
+            OpenAIBackendRole.USER,
+        )
+        for call in range(args.tools_per_step):
+            agent._record_tool_calling(
+                "browser_get_page_snapshot", {"url": f"https://example.com/{step}/{call}"}, page(args.result_chars), f"call_{step}_{call}"
+            )
+        agent.record_message(BaseMessage.make_assistant_message(role_name="assistant", content=f"Findings for topic {step}."))
+        prompts.append(agent._context_tokens())
+    compactions = task_locks[task_id].metrics.summary()["agents"]
+    print(f"{name:<10} " + " ".join(f"{tokens:>7}" for tokens in prompts) + f"  total {sum(prompts)}")
+    if compactions:
+        print(f"{'':<10} {compactions[0]['compactions']} compactions, {compactions[0]['compacted_tokens']} tokens removed")
+    return prompts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--platform", default="openai")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--tools-per-step", type=int, default=3)
+    parser.add_argument("--result-chars", type=int, default=6000)
+    parser.add_argument("--budget", type=int, default=12000)
+    args = parser.parse_args()
+
+    print(f"{'step':<10} " + " ".join(f"{step:>7}" for step in range(args.steps)))
+    full = run("full", args, 0)
+    compacted = run("compacted", args, args.budget)
+    print(f"prompt tokens sent over {args.steps} steps: {sum(full)} -> {sum(compacted)} ({sum(compacted) / sum(full):.0%})")
+
+
+if __name__ == "__main__":
+    main()
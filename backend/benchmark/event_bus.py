@@ -0,0 +1,84 @@
+r"""Enqueue latency of the task event bus under concurrent requests.
+
+Run from the backend directory:
+
+    uv run python -m benchmark.event_bus --requests 2000 --concurrency 64
+
+Compares three ways of getting an event onto a task queue owned by the main loop:
+
+- ``asyncio.run``: the old sync controller path, a fresh event loop per request on a threadpool thread
+- ``put_queue``: async controllers awaiting ``TaskLock.put_queue`` on the owning loop
+- ``emit``: worker threads (``asyncio.to_thread`` tools, toolkits) calling ``TaskLock.emit``
+
+Latency is measured from the moment a request starts until the consumer reads the event.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.service.task import ActionNoticeData, TaskLock, TaskQueue
+
+
+async def consume(task_lock: TaskLock, total: int, latencies: list[float]):
+    for _ in range(total):
+        item = await task_lock.get_queue()
+        latencies.append(time.perf_counter() - float(item.data))
+
+
+def event() -> ActionNoticeData:
+    return ActionNoticeData(process_task_id="", data=repr(time.perf_counter()))
+
+
+async def bench_asyncio_run(task_lock: TaskLock, requests: int, pool: ThreadPoolExecutor):
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *(loop.run_in_executor(pool, lambda: asyncio.run(task_lock.queue.put(event()))) for _ in range(requests))
+    )
+
+
+async def bench_put_queue(task_lock: TaskLock, requests: int, pool: ThreadPoolExecutor):
+    await asyncio.gather(*(task_lock.put_queue(event()) for _ in range(requests)))
+
+
+async def bench_emit(task_lock: TaskLock, requests: int, pool: ThreadPoolExecutor):
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(pool, lambda: task_lock.emit(event())) for _ in range(requests)))
+
+
+async def run(name: str, bench, requests: int, concurrency: int):
+    task_lock = TaskLock(name, TaskQueue(maxsize=requests), {})
+    latencies: list[float] = []
+    consumer = asyncio.create_task(consume(task_lock, requests, latencies))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        await bench(task_lock, requests, pool)
+        try:
+            await asyncio.wait_for(consumer, timeout=10)
+        except asyncio.TimeoutError:
+            # asyncio.run puts from another loop never wake the consumer waiting on this loop
+            print(f"{name:<12} lost wakeups, {len(latencies)}/{requests} events read")
+            return
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(
+        f"{name:<12} {requests / elapsed:>10.0f} req/s"
+        f"  p50 {statistics.median(latencies) * 1e6:>9.1f}us"
+        f"  p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e6:>9.1f}us"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    for name, bench in [("asyncio.run", bench_asyncio_run), ("put_queue", bench_put_queue), ("emit", bench_emit)]:
+        await run(name, bench, args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+r"""Latency of model calls through one endpoint, routed across several, and routed with hedging.
+
+Run from the backend directory:
+
+    uv run python -m benchmark.model_routing --requests 2000 --scale 0.01
+
+Each fake endpoint answers in a lognormal time around its median, with a share of calls stalling in
+the tail, the way a provider under load does. No model is called. Latencies are reported in unscaled
+seconds.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from unittest.mock import MagicMock
+
+from camel.models import BaseModelBackend
+
+from app.utils.model_router import RoutedModelBackend, endpoint_stats
+
+
+class FakeEndpoint(BaseModelBackend):
+    def __init__(self, name: str, median: float, stall_rate: float, stall: float, scale: float, rng: random.Random):
+        super().__init__("gpt-4o-mini", {}, url=f"https://{name}.example.com")
+        self.median = median
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.scale = scale
+        self.rng = rng
+
+    @property
+    def token_counter(self):
+        return MagicMock()
+
+    def _run(self, messages, response_format=None, tools=None):
+        raise NotImplementedError
+
+    async def _arun(self, messages, response_format=None, tools=None):
+        seconds = self.rng.lognormvariate(0, 0.3) * self.median
+        if self.rng.random() < self.stall_rate:
+            seconds += self.stall
+        await asyncio.sleep(seconds * self.scale)
+        return seconds
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def run(name: str, args, hedge: bool, endpoints: int) -> list[float]:
+    os.environ["model_hedge"] = "on" if hedge else "off"
+    os.environ["model_hedge_min_delay"] = str(0.5 * args.scale)
+    rng = random.Random(0)
+    backends = [
+        # The configured model is the slower of the two, routing should find the other one
+        FakeEndpoint("configured", 1.3, args.stall_rate, args.stall, args.scale, rng),
+        FakeEndpoint("extra", 1.0, args.stall_rate, args.stall, args.scale, rng),
+    ][:endpoints]
+    router = RoutedModelBackend(backends) if endpoints > 1 else None
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def call() -> float:
+        async with semaphore:
+            started = time.perf_counter()
+            if router is None:
+                await backends[0]._arun([])
+            else:
+                await router._arun([])
+            return (time.perf_counter() - started) / args.scale
+
+    latencies = await asyncio.gather(*(call() for _ in range(args.requests)))
+    hedges = sum(endpoint_stats(backend).hedges for backend in backends)
+    print(
+        f"{name:<8} p50 {percentile(latencies, 0.5):6.2f}s  p95 {percentile(latencies, 0.95):6.2f}s  "
+        f"p99 {percentile(latencies, 0.99):6.2f}s  max {max(latencies):6.2f}s  hedged {hedges / args.requests:.0%}"
+    )
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    parser.add_argument("--stall", type=float, default=10.0, help="extra seconds of a stalled call")
+    parser.add_argument("--scale", type=float, default=0.01, help="wall clock seconds per simulated second")
+    args = parser.parse_args()
+
+    single = await run("single", args, hedge=False, endpoints=1)
+    await run("routed", args, hedge=False, endpoints=2)
+    hedged = await run("hedged", args, hedge=True, endpoints=2)
+    print(f"p99 latency: {percentile(single, 0.99):.2f}s -> {percentile(hedged, 0.99):.2f}s with hedging")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
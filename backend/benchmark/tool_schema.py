@@ -0,0 +1,77 @@
+r"""Tool construction time with and without the tool schema cache.
+
+Run from the backend directory:
+
+    uv run python -m benchmark.tool_schema --rounds 20
+
+Each round builds the tools a task builds for its agents (human, note taking, terminal, file and
+search toolkits plus the message integration wrappers), like ``construct_workforce`` does for every
+task. The first cached round fills the cache, the others reuse it.
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from camel.toolkits import ToolkitMessageIntegration
+
+from app.service.task import Agents, create_task_lock
+from app.utils import tool_schema_cache
+from app.utils.toolkit.file_write_toolkit import FileToolkit
+from app.utils.toolkit.human_toolkit import HumanToolkit
+from app.utils.toolkit.note_taking_toolkit import NoteTakingToolkit
+from app.utils.toolkit.search_toolkit import SearchToolkit
+from app.utils.toolkit.terminal_toolkit import TerminalToolkit
+
+
+def build_tools(task_id: str, working_directory: str) -> int:
+    tools = []
+    for agent in (Agents.developer_agent, Agents.search_agent, Agents.document_agent, Agents.multi_modal_agent):
+        message_integration = ToolkitMessageIntegration(
+            message_handler=HumanToolkit(task_id, agent).send_message_to_user
+        )
+        tools += HumanToolkit.get_can_use_tools(task_id, agent)
+        tools += message_integration.register_toolkits(
+            NoteTakingToolkit(task_id, agent, working_directory=working_directory)
+        ).get_tools()
+        tools += TerminalToolkit(task_id, agent, working_directory=working_directory, safe_mode=True).get_tools()
+        tools += FileToolkit(task_id, working_directory=working_directory).get_tools()
+        tools += SearchToolkit(task_id, agent).get_tools()
+    return len(tools)
+
+
+def run(name: str, rounds: int, working_directory: str):
+    timings = []
+    count = 0
+    for i in range(rounds):
+        started = time.perf_counter()
+        count = build_tools(f"bench_{name}_{i}", working_directory)
+        timings.append(time.perf_counter() - started)
+    print(
+        f"{name:<8} {count} tools/round"
+        f"  first {timings[0] * 1e3:>8.1f}ms"
+        f"  median {statistics.median(timings) * 1e3:>8.1f}ms"
+    )
+    return statistics.median(timings)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    for i in range(args.rounds):
+        create_task_lock(f"bench_uncached_{i}")
+        create_task_lock(f"bench_cached_{i}")
+    with tempfile.TemporaryDirectory() as working_directory:
+        tool_schema_cache.uninstall()
+        uncached = run("uncached", args.rounds, working_directory)
+        tool_schema_cache.install()
+        cached = run("cached", args.rounds, working_directory)
+    print(f"saved {(uncached - cached) * 1e3:.1f}ms per task ({uncached / cached:.1f}x), {tool_schema_cache.cache_stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
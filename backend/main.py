@@ -15,6 +15,12 @@ logger.info("Starting Eigent Multi-Agent System API")
 logger.info(f"Python encoding: {os.environ.get('PYTHONIOENCODING')}")
 logger.info(f"Environment: {os.environ.get('ENVIRONMENT', 'development')}")
 
+if env("tool_schema_cache", "on") == "on":
+    from app.utils import tool_schema_cache
+
+    tool_schema_cache.install()
+    logger.info("Tool schema cache installed")
+
 prefix = env("url_prefix", "")
 logger.info(f"Loading routers with prefix: '{prefix}'")
 auto_include_routers(api, prefix, "app/controller")
@@ -77,6 +83,22 @@ async def cleanup_resources():
         except Exception as e:
             logger.error(f"Error cleaning up task {task_id}: {e}")
 
+    # Flush steps that were not synced to the server yet
+    try:
+        from app.utils.server.sync_step import close_step_uploader
+
+        await close_step_uploader()
+    except Exception as e:
+        logger.error(f"Error closing step uploader: {e}")
+
+    # Disconnect the MCP servers of warm workforce templates
+    try:
+        from app.service.workforce_template import workforce_templates
+
+        await workforce_templates.close()
+    except Exception as e:
+        logger.error(f"Error closing workforce templates: {e}")
+
     # Remove PID file
     pid_file = dir / "run.pid"
     if pid_file.exists():
@@ -221,6 +221,7 @@ def mock_task_lock():
     task_lock.put_queue = AsyncMock()
     task_lock.put_human_input = AsyncMock()
     task_lock.add_background_task = MagicMock()
+    task_lock.artifacts = None
     return task_lock
 
 
@@ -267,6 +268,21 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(autouse=True)
+def clear_model_pool():
+    """Do not share pooled model backends between tests."""
+    from app.utils.model_pool import model_pool
+
+    model_pool.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def no_workforce_templates(monkeypatch):
+    """Do not prewarm workforce templates in the background of tests."""
+    monkeypatch.setenv("workforce_template", "off")
+
+
 @pytest.fixture
 def mock_environment_variables():
     """Mock environment variables for testing."""
@@ -1,12 +1,12 @@
 import os
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from fastapi import Response
 from fastapi.responses import StreamingResponse
 from fastapi.testclient import TestClient
 
-from app.controller.chat_controller import improve, post, stop, supplement, human_reply, install_mcp
+from app.controller.chat_controller import improve, post, stream, stop, supplement, human_reply, install_mcp
 from pydantic import ValidationError
 from app.exception.exception import UserException
 from app.model.chat import Chat, HumanReply, McpServers, Status, SupplementChat
@@ -17,7 +17,7 @@ class TestChatController:
     """Test cases for chat controller endpoints."""
     
     @pytest.mark.asyncio
-    async def test_post_chat_endpoint_success(self, sample_chat_data, mock_request, mock_task_lock, mock_environment_variables):
+    async def test_post_chat_endpoint_success(self, sample_chat_data, mock_task_lock, mock_environment_variables):
         """Test successful chat initialization."""
         chat_data = Chat(**sample_chat_data)
         
@@ -34,14 +34,15 @@ class TestChatController:
             
             mock_step_solve.return_value = mock_generator()
             
-            response = await post(chat_data, mock_request)
+            response = await post(chat_data)
             
             assert isinstance(response, StreamingResponse)
             assert response.media_type == "text/event-stream"
-            mock_step_solve.assert_called_once_with(chat_data, mock_request, mock_task_lock)
+            mock_step_solve.assert_called_once_with(chat_data, mock_task_lock)
+            mock_task_lock.start_stream.assert_called_once_with(mock_step_solve.return_value)
 
     @pytest.mark.asyncio
-    async def test_post_chat_sets_environment_variables(self, sample_chat_data, mock_request, mock_task_lock):
+    async def test_post_chat_sets_environment_variables(self, sample_chat_data, mock_task_lock):
         """Test that environment variables are properly set."""
         chat_data = Chat(**sample_chat_data)
         
@@ -57,7 +58,7 @@ class TestChatController:
             
             mock_step_solve.return_value = mock_generator()
             
-            await post(chat_data, mock_request)
+            await post(chat_data)
             
             # Check environment variables were set
             assert os.environ.get("OPENAI_API_KEY") == "test_key"
@@ -65,24 +66,35 @@ class TestChatController:
             assert os.environ.get("CAMEL_MODEL_LOG_ENABLED") == "true"
             assert os.environ.get("browser_port") == "8080"
 
-    def test_improve_chat_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_stream_reattach_success(self, mock_task_lock):
+        """Test reattaching to a running chat stream."""
+        task_id = "test_task_123"
+
+        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock):
+            response = await stream(task_id, last_event_id=42)
+
+            assert isinstance(response, StreamingResponse)
+            assert response.media_type == "text/event-stream"
+            mock_task_lock.subscribe.assert_called_once_with(42)
+
+    @pytest.mark.asyncio
+    async def test_improve_chat_success(self, mock_task_lock):
         """Test successful chat improvement."""
         task_id = "test_task_123"
         supplement_data = SupplementChat(question="Improve this code")
         mock_task_lock.status = Status.processing
         
-        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = improve(task_id, supplement_data)
+            response = await improve(task_id, supplement_data)
             
             assert isinstance(response, Response)
             assert response.status_code == 201
-            mock_run.assert_called_once()
-            # put_queue is invoked when creating the coroutine passed to asyncio.run
-            mock_task_lock.put_queue.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
-    def test_improve_chat_task_done_error(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_improve_chat_task_done_error(self, mock_task_lock):
         """Test improvement fails when task is done."""
         task_id = "test_task_123"
         supplement_data = SupplementChat(question="Improve this code")
@@ -90,24 +102,25 @@ class TestChatController:
         
         with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock):
             with pytest.raises(UserException):
-                improve(task_id, supplement_data)
+                await improve(task_id, supplement_data)
 
-    def test_supplement_chat_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_supplement_chat_success(self, mock_task_lock):
         """Test successful chat supplementation."""
         task_id = "test_task_123"
         supplement_data = SupplementChat(question="Add more details")
         mock_task_lock.status = Status.done
         
-        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = supplement(task_id, supplement_data)
+            response = await supplement(task_id, supplement_data)
             
             assert isinstance(response, Response)
             assert response.status_code == 201
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
-    def test_supplement_chat_task_not_done_error(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_supplement_chat_task_not_done_error(self, mock_task_lock):
         """Test supplementation fails when task is not done."""
         task_id = "test_task_123"
         supplement_data = SupplementChat(question="Add more details")
@@ -115,48 +128,48 @@ class TestChatController:
         
         with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock):
             with pytest.raises(UserException):
-                supplement(task_id, supplement_data)
+                await supplement(task_id, supplement_data)
 
-    def test_stop_chat_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_stop_chat_success(self, mock_task_lock):
         """Test successful chat stopping."""
         task_id = "test_task_123"
         
-        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = stop(task_id)
+            response = await stop(task_id)
             
             assert isinstance(response, Response)
             assert response.status_code == 204
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
-    def test_human_reply_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_human_reply_success(self, mock_task_lock):
         """Test successful human reply."""
         task_id = "test_task_123"
         reply_data = HumanReply(agent="test_agent", reply="This is my reply")
         
-        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = human_reply(task_id, reply_data)
+            response = await human_reply(task_id, reply_data)
             
             assert isinstance(response, Response)
             assert response.status_code == 201
-            mock_run.assert_called_once()
+            mock_task_lock.put_human_input.assert_awaited_once()
 
-    def test_install_mcp_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_install_mcp_success(self, mock_task_lock):
         """Test successful MCP installation."""
         task_id = "test_task_123"
         mcp_data: McpServers = {"mcpServers": {"test_server": {"config": "test"}}}
         
-        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = install_mcp(task_id, mcp_data)
+            response = await install_mcp(task_id, mcp_data)
             
             assert isinstance(response, Response)
             assert response.status_code == 201
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
 
 @pytest.mark.integration
@@ -189,10 +202,10 @@ class TestChatControllerIntegration:
         task_id = "test_task_123"
         supplement_data = {"question": "Improve this code"}
         
-        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock, \
-             patch("asyncio.run"):
+        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock:
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
             mock_task_lock.status = Status.processing
             mock_get_lock.return_value = mock_task_lock
             
@@ -205,10 +218,10 @@ class TestChatControllerIntegration:
         task_id = "test_task_123"
         supplement_data = {"question": "Add more details"}
         
-        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock, \
-             patch("asyncio.run"):
+        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock:
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
             mock_task_lock.status = Status.done
             mock_get_lock.return_value = mock_task_lock
             
@@ -220,10 +233,10 @@ class TestChatControllerIntegration:
         """Test stop chat endpoint through FastAPI test client."""
         task_id = "test_task_123"
         
-        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock, \
-             patch("asyncio.run"):
+        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock:
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
             mock_get_lock.return_value = mock_task_lock
             
             response = client.delete(f"/chat/{task_id}")
@@ -235,10 +248,11 @@ class TestChatControllerIntegration:
         task_id = "test_task_123"
         reply_data = {"agent": "test_agent", "reply": "This is my reply"}
         
-        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock, \
-             patch("asyncio.run"):
+        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock:
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
+            mock_task_lock.put_human_input = AsyncMock()
             mock_get_lock.return_value = mock_task_lock
             
             response = client.post(f"/chat/{task_id}/human-reply", json=reply_data)
@@ -250,10 +264,10 @@ class TestChatControllerIntegration:
         task_id = "test_task_123"
         mcp_data = {"mcpServers": {"test_server": {"config": "test"}}}
         
-        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock, \
-             patch("asyncio.run"):
+        with patch("app.controller.chat_controller.get_task_lock") as mock_get_lock:
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
             mock_get_lock.return_value = mock_task_lock
             
             response = client.post(f"/chat/{task_id}/install-mcp", json=mcp_data)
@@ -309,30 +323,31 @@ class TestChatControllerErrorCases:
         # If future validation moves to endpoint level, keep logic placeholder below.
         # (Intentionally not calling post with invalid Chat object since creation fails.)
 
-    def test_improve_with_nonexistent_task(self):
+    @pytest.mark.asyncio
+    async def test_improve_with_nonexistent_task(self):
         """Test improve endpoint with nonexistent task."""
         task_id = "nonexistent_task"
         supplement_data = SupplementChat(question="Improve this code")
         
         with patch("app.controller.chat_controller.get_task_lock", side_effect=KeyError("Task not found")):
             with pytest.raises(KeyError):
-                improve(task_id, supplement_data)
+                await improve(task_id, supplement_data)
 
-    def test_supplement_with_empty_question(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_supplement_with_empty_question(self, mock_task_lock):
         """Test supplement endpoint with empty question."""
         task_id = "test_task_123"
         supplement_data = SupplementChat(question="")
         mock_task_lock.status = Status.done
         
-        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run"):
+        with patch("app.controller.chat_controller.get_task_lock", return_value=mock_task_lock):
             
             # Should handle empty question gracefully or raise appropriate error
-            response = supplement(task_id, supplement_data)
+            response = await supplement(task_id, supplement_data)
             assert response.status_code == 201  # Or should it be an error?
 
     @pytest.mark.asyncio
-    async def test_post_environment_setup_failure(self, sample_chat_data, mock_request):
+    async def test_post_environment_setup_failure(self, sample_chat_data):
         """Test chat endpoint when environment setup fails."""
         chat_data = Chat(**sample_chat_data)
         
@@ -345,4 +360,4 @@ class TestChatControllerErrorCases:
             
             # Should handle environment setup failures gracefully
             with pytest.raises(Exception):
-                await post(chat_data, mock_request)
+                await post(chat_data)
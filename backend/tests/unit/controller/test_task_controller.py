@@ -1,9 +1,9 @@
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
 from fastapi import Response
 from fastapi.testclient import TestClient
 
-from app.controller.task_controller import start, put, take_control, add_agent, TakeControl
+from app.controller.task_controller import start, put, take_control, add_agent, queue_stats, locks, metrics, TakeControl
 from app.model.chat import NewAgent, UpdateData, TaskContent
 from app.service.task import Action
 
@@ -12,20 +12,21 @@ from app.service.task import Action
 class TestTaskController:
     """Test cases for task controller endpoints."""
     
-    def test_start_task_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_start_task_success(self, mock_task_lock):
         """Test successful task start."""
         task_id = "test_task_123"
         
-        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = start(task_id)
+            response = await start(task_id)
             
             assert isinstance(response, Response)
             assert response.status_code == 201
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
-    def test_update_task_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_update_task_success(self, mock_task_lock):
         """Test successful task update."""
         task_id = "test_task_123"
         update_data = UpdateData(
@@ -35,44 +36,44 @@ class TestTaskController:
             ]
         )
         
-        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = put(task_id, update_data)
+            response = await put(task_id, update_data)
             
             assert isinstance(response, Response)
             assert response.status_code == 201
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
-    def test_take_control_pause_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_take_control_pause_success(self, mock_task_lock):
         """Test successful task pause control."""
         task_id = "test_task_123"
         control_data = TakeControl(action=Action.pause)
         
-        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = take_control(task_id, control_data)
+            response = await take_control(task_id, control_data)
             
             assert isinstance(response, Response)
             assert response.status_code == 204
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
-    def test_take_control_resume_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_take_control_resume_success(self, mock_task_lock):
         """Test successful task resume control."""
         task_id = "test_task_123"
         control_data = TakeControl(action=Action.resume)
         
-        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = take_control(task_id, control_data)
+            response = await take_control(task_id, control_data)
             
             assert isinstance(response, Response)
             assert response.status_code == 204
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
-    def test_add_agent_success(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_add_agent_success(self, mock_task_lock):
         """Test successful agent addition."""
         task_id = "test_task_123"
         new_agent = NewAgent(
@@ -84,38 +85,73 @@ class TestTaskController:
         )
         
         with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("app.controller.task_controller.load_dotenv"), \
-             patch("asyncio.run") as mock_run:
+             patch("app.controller.task_controller.load_dotenv"):
             
-            response = add_agent(task_id, new_agent)
+            response = await add_agent(task_id, new_agent)
             
             assert isinstance(response, Response)
             assert response.status_code == 204
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_queue_stats_success(self, mock_task_lock):
+        """Test queue stats retrieval."""
+        task_id = "test_task_123"
+        mock_task_lock.queue_stats.return_value = {"size": 3, "maxsize": 1000, "dropped": 0}
+
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
+            result = await queue_stats(task_id)
+
+            assert result == {"size": 3, "maxsize": 1000, "dropped": 0}
+
+    @pytest.mark.asyncio
+    async def test_metrics_success(self, mock_task_lock):
+        """Test task metrics retrieval."""
+        mock_task_lock.metrics.summary.return_value = {"total_tokens": 42, "agents": []}
+
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
+            result = await metrics("test_task_123")
+
+            assert result == {"total_tokens": 42, "agents": []}
+
+    @pytest.mark.asyncio
+    async def test_locks_success(self, mock_task_lock):
+        """Test live task locks listing."""
+        mock_task_lock.lock_stats.return_value = {"id": "test_task_123", "retained_bytes": 128}
 
-    def test_start_task_nonexistent_task(self):
+        with patch.dict("app.controller.task_controller.task_locks", {"test_task_123": mock_task_lock}, clear=True):
+            result = await locks()
+
+            assert result["count"] == 1
+            assert result["retained_bytes"] == 128
+            assert result["locks"] == [{"id": "test_task_123", "retained_bytes": 128}]
+            assert "ttl" in result["reaper"]
+
+    @pytest.mark.asyncio
+    async def test_start_task_nonexistent_task(self):
         """Test start task with nonexistent task ID."""
         task_id = "nonexistent_task"
         
         with patch("app.controller.task_controller.get_task_lock", side_effect=KeyError("Task not found")):
             with pytest.raises(KeyError):
-                start(task_id)
+                await start(task_id)
 
-    def test_update_task_empty_data(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_update_task_empty_data(self, mock_task_lock):
         """Test update task with empty task list."""
         task_id = "test_task_123"
         update_data = UpdateData(task=[])
         
-        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = put(task_id, update_data)
+            response = await put(task_id, update_data)
             
             assert isinstance(response, Response)
             assert response.status_code == 201
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
-    def test_add_agent_with_mcp_tools(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_add_agent_with_mcp_tools(self, mock_task_lock):
         """Test adding agent with MCP tools."""
         task_id = "test_task_123"
         new_agent = NewAgent(
@@ -127,14 +163,13 @@ class TestTaskController:
         )
         
         with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("app.controller.task_controller.load_dotenv"), \
-             patch("asyncio.run") as mock_run:
+             patch("app.controller.task_controller.load_dotenv"):
             
-            response = add_agent(task_id, new_agent)
+            response = await add_agent(task_id, new_agent)
             
             assert isinstance(response, Response)
             assert response.status_code == 204
-            mock_run.assert_called_once()
+            mock_task_lock.put_queue.assert_awaited_once()
 
 
 @pytest.mark.integration
@@ -145,10 +180,10 @@ class TestTaskControllerIntegration:
         """Test start task endpoint through FastAPI test client."""
         task_id = "test_task_123"
         
-        with patch("app.controller.task_controller.get_task_lock") as mock_get_lock, \
-             patch("asyncio.run"):
+        with patch("app.controller.task_controller.get_task_lock") as mock_get_lock:
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
             mock_get_lock.return_value = mock_task_lock
             
             response = client.post(f"/task/{task_id}/start")
@@ -165,10 +200,10 @@ class TestTaskControllerIntegration:
             ]
         }
         
-        with patch("app.controller.task_controller.get_task_lock") as mock_get_lock, \
-             patch("asyncio.run"):
+        with patch("app.controller.task_controller.get_task_lock") as mock_get_lock:
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
             mock_get_lock.return_value = mock_task_lock
             
             response = client.put(f"/task/{task_id}", json=update_data)
@@ -180,10 +215,10 @@ class TestTaskControllerIntegration:
         task_id = "test_task_123"
         control_data = {"action": "pause"}
         
-        with patch("app.controller.task_controller.get_task_lock") as mock_get_lock, \
-             patch("asyncio.run"):
+        with patch("app.controller.task_controller.get_task_lock") as mock_get_lock:
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
             mock_get_lock.return_value = mock_task_lock
             
             response = client.put(f"/task/{task_id}/take-control", json=control_data)
@@ -195,10 +230,10 @@ class TestTaskControllerIntegration:
         task_id = "test_task_123"
         control_data = {"action": "resume"}
         
-        with patch("app.controller.task_controller.get_task_lock") as mock_get_lock, \
-             patch("asyncio.run"):
+        with patch("app.controller.task_controller.get_task_lock") as mock_get_lock:
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
             mock_get_lock.return_value = mock_task_lock
             
             response = client.put(f"/task/{task_id}/take-control", json=control_data)
@@ -217,10 +252,10 @@ class TestTaskControllerIntegration:
         }
         
         with patch("app.controller.task_controller.get_task_lock") as mock_get_lock, \
-             patch("app.controller.task_controller.load_dotenv"), \
-             patch("asyncio.run"):
+             patch("app.controller.task_controller.load_dotenv"):
             
             mock_task_lock = MagicMock()
+            mock_task_lock.put_queue = AsyncMock()
             mock_get_lock.return_value = mock_task_lock
             
             response = client.post(f"/task/{task_id}/add-agent", json=agent_data)
@@ -232,17 +267,20 @@ class TestTaskControllerIntegration:
 class TestTaskControllerErrorCases:
     """Test error cases and edge conditions for task controller."""
     
-    def test_start_task_async_error(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_start_task_async_error(self, mock_task_lock):
         """Test start task when async operation fails."""
         task_id = "test_task_123"
         
-        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run", side_effect=Exception("Async error")):
+        mock_task_lock.put_queue.side_effect = Exception("Async error")
+
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
             
             with pytest.raises(Exception, match="Async error"):
-                start(task_id)
+                await start(task_id)
 
-    def test_update_task_with_invalid_task_content(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_update_task_with_invalid_task_content(self, mock_task_lock):
         """Test update task with invalid task content."""
         task_id = "test_task_123"
         # Create invalid update data that might cause validation errors
@@ -251,11 +289,10 @@ class TestTaskControllerErrorCases:
             TaskContent(id="valid_id", content="Valid content")
         ])
         
-        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
             
             # Should handle invalid data gracefully or raise appropriate error
-            response = put(task_id, update_data)
+            response = await put(task_id, update_data)
             assert response.status_code == 201
 
     def test_take_control_invalid_action(self):
@@ -266,7 +303,8 @@ class TestTaskControllerErrorCases:
         with pytest.raises((ValueError, TypeError)):
             TakeControl(action="invalid_action")
 
-    def test_add_agent_env_load_failure(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_add_agent_env_load_failure(self, mock_task_lock):
         """Test add agent when environment loading fails."""
         task_id = "test_task_123"
         new_agent = NewAgent(
@@ -278,14 +316,14 @@ class TestTaskControllerErrorCases:
         )
         
         with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("app.controller.task_controller.load_dotenv", side_effect=Exception("Env load failed")), \
-             patch("asyncio.run"):
+             patch("app.controller.task_controller.load_dotenv", side_effect=Exception("Env load failed")):
             
             # Should handle environment load failure gracefully or raise error
             with pytest.raises(Exception, match="Env load failed"):
-                add_agent(task_id, new_agent)
+                await add_agent(task_id, new_agent)
 
-    def test_add_agent_with_empty_name(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_add_agent_with_empty_name(self, mock_task_lock):
         """Test add agent with empty name."""
         task_id = "test_task_123"
         new_agent = NewAgent(
@@ -297,29 +335,29 @@ class TestTaskControllerErrorCases:
         )
         
         with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("app.controller.task_controller.load_dotenv"), \
-             patch("asyncio.run"):
+             patch("app.controller.task_controller.load_dotenv"):
             
             # Should handle empty name appropriately
-            response = add_agent(task_id, new_agent)
+            response = await add_agent(task_id, new_agent)
             assert response.status_code == 204
 
-    def test_task_operations_with_concurrent_access(self, mock_task_lock):
+    @pytest.mark.asyncio
+    async def test_task_operations_with_concurrent_access(self, mock_task_lock):
         """Test task operations with concurrent access scenarios."""
         task_id = "test_task_123"
         
         # Simulate concurrent access by having the task lock be modified during operation
-        def side_effect():
+        def side_effect(data):
             mock_task_lock.status = "modified_during_operation"
             return None
         
         mock_task_lock.put_queue.side_effect = side_effect
         
-        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock), \
-             patch("asyncio.run") as mock_run:
+        with patch("app.controller.task_controller.get_task_lock", return_value=mock_task_lock):
             
-            response = start(task_id)
+            response = await start(task_id)
             assert response.status_code == 201
+            assert mock_task_lock.status == "modified_during_operation"
 
 
 @pytest.mark.model_backend
@@ -0,0 +1,154 @@
+import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from camel.agents._types import ToolCallRequest
+from camel.toolkits import FunctionTool
+
+from app.model.chat import Chat
+from app.service.artifacts import ArtifactStore
+from app.service.task import TaskLock
+from app.utils.agent import ListenChatAgent, mcp_agent
+from app.utils.listen.toolkit_listen import listen_toolkit
+from app.utils.toolkit.abstract_toolkit import AbstractToolkit
+from app.utils.toolkit.artifact_toolkit import ArtifactToolkit
+
+
+@pytest.mark.unit
+class TestArtifactStore:
+    """Test cases for the per-task store of large tool results."""
+
+    def test_small_results_are_kept(self, temp_dir):
+        """Test that results within the threshold are returned unchanged."""
+        store = ArtifactStore(temp_dir, threshold=100)
+
+        assert store.offload("read_file", "short") == "short"
+        assert store.offload("read_file", {"rows": [1, 2]}) == {"rows": [1, 2]}
+        assert list(temp_dir.iterdir()) == []
+
+    def test_large_result_is_replaced_by_handle(self, temp_dir):
+        """Test that a large result is stored once by hash and replaced by a handle with a preview."""
+        store = ArtifactStore(temp_dir, threshold=100, preview_chars=10)
+        page = "".join(str(i % 10) for i in range(250))
+
+        handle = store.offload("browser_get_page_snapshot", page)
+
+        artifact_id = store.put(page)
+        assert handle.startswith(f"[browser_get_page_snapshot returned 250 chars, stored as artifact {artifact_id}.")
+        assert handle.endswith("\n0123456789")
+        assert store.offload("browser_get_page_snapshot", page) == handle
+        assert len(list(temp_dir.iterdir())) == 1
+
+    def test_read_pages_through_artifact(self, temp_dir):
+        """Test that slices point at the next offset until the end of the artifact."""
+        store = ArtifactStore(temp_dir, threshold=10)
+        artifact_id = store.put("abcdefghij" * 3)
+
+        assert store.read(artifact_id, 0, 12) == "abcdefghijab\n[chars 0-12 of 30, continue with offset=12]"
+        assert store.read(artifact_id, 24, 12) == "efghij"
+        with pytest.raises(ValueError):
+            store.read("../../etc/passwd")
+
+    def test_paging_tool_results_are_not_offloaded(self, temp_dir):
+        """Test that slices read back by the agent are never stored again."""
+        store = ArtifactStore(temp_dir, threshold=10)
+
+        assert store.offload("read_artifact", "x" * 100) == "x" * 100
+
+
+@pytest.mark.unit
+class TestListenChatAgentArtifacts:
+    """Test cases for offloading tool results of a ListenChatAgent."""
+
+    def test_memory_keeps_handle_and_agent_reads_slices(self, temp_dir):
+        """Test that memory gets the handle and read_artifact returns the stored text."""
+        task_lock = TaskLock("artifact_task", MagicMock(), {})
+        task_lock.artifacts = ArtifactStore(temp_dir, threshold=100, preview_chars=20)
+        sheet = "name,amount\n" + "".join(f"row{i},{i}\n" for i in range(100))
+
+        with patch("app.utils.agent.get_task_lock", return_value=task_lock), \
+             patch("app.utils.toolkit.artifact_toolkit.get_task_lock", return_value=task_lock), \
+             patch("app.utils.listen.toolkit_listen.get_task_lock", return_value=task_lock), \
+             patch("camel.models.ModelFactory.create", return_value=MagicMock(model_type="gpt-4o")):
+            agent = ListenChatAgent(api_task_id="artifact_task", agent_name="document_agent", model="gpt-4o")
+            record = agent._record_tool_calling("extract_excel_content", {"document_path": "a.xlsx"}, sheet, "call_1")
+            artifact_id = task_lock.artifacts.put(sheet)
+            chunk = ArtifactToolkit("artifact_task", "document_agent").read_artifact(artifact_id, offset=20, length=30)
+
+        assert record.result.endswith("\nname,amount\nrow0,0\nr")
+        assert agent.memory.retrieve()[-1].memory_record.message.result == record.result
+        assert chunk.startswith(sheet[20:50])
+
+    @pytest.mark.asyncio
+    async def test_event_and_memory_share_one_artifact(self, temp_dir):
+        """Test that a large non-string result is serialized once and both the event and memory point at it."""
+        task_lock = TaskLock("artifact_task", MagicMock(), {})
+        task_lock.artifacts = ArtifactStore(temp_dir, threshold=100, preview_chars=20)
+        task_lock.put_queue = AsyncMock()
+
+        def search_rows(query: str) -> list[dict]:
+            """Search rows."""
+            return [{"row": i, "query": query} for i in range(20)]
+
+        with patch("app.utils.agent.get_task_lock", return_value=task_lock), \
+             patch("camel.models.ModelFactory.create", return_value=MagicMock(model_type="gpt-4o")):
+            agent = ListenChatAgent(
+                api_task_id="artifact_task", agent_name="document_agent", model="gpt-4o", tools=[FunctionTool(search_rows)]
+            )
+            record = await agent._aexecute_tool(
+                ToolCallRequest(tool_name="search_rows", args={"query": "a"}, tool_call_id="call_1")
+            )
+
+        event = task_lock.put_queue.call_args_list[-1].args[0]
+        assert event.data["message"] == record.result
+        assert len(list(temp_dir.iterdir())) == 1
+
+    @pytest.mark.asyncio
+    async def test_listened_tool_result_is_stored_once(self, temp_dir):
+        """Test that a toolkit method under listen_toolkit hands the agent the handle its event shows."""
+        task_lock = TaskLock("artifact_task", MagicMock(), {})
+        task_lock.artifacts = ArtifactStore(temp_dir, threshold=100, preview_chars=20)
+        task_lock.put_queue = AsyncMock()
+
+        class RowToolkit(AbstractToolkit):
+            def __init__(self):
+                self.api_task_id = "artifact_task"
+                self.agent_name = "document_agent"
+
+            @listen_toolkit()
+            async def search_rows(self, query: str) -> list[dict]:
+                """Search rows."""
+                return [{"row": i, "query": query, "at": datetime.date(2026, 1, 1)} for i in range(20)]
+
+        with patch("app.utils.agent.get_task_lock", return_value=task_lock), \
+             patch("app.utils.listen.toolkit_listen.get_task_lock", return_value=task_lock), \
+             patch("camel.models.ModelFactory.create", return_value=MagicMock(model_type="gpt-4o")), \
+             patch.object(task_lock.artifacts, "put", wraps=task_lock.artifacts.put) as put:
+            agent = ListenChatAgent(
+                api_task_id="artifact_task",
+                agent_name="document_agent",
+                model="gpt-4o",
+                tools=[FunctionTool(RowToolkit().search_rows)],
+            )
+            record = await agent._aexecute_tool(
+                ToolCallRequest(tool_name="search_rows", args={"query": "a"}, tool_call_id="call_1")
+            )
+
+        event = task_lock.put_queue.call_args_list[-1].args[0]
+        assert event.data["message"] == record.result
+        assert put.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_mcp_agent_can_read_artifacts(self, sample_chat_data):
+        """Test that the MCP agent gets read_artifact for the handles of its large results."""
+        task_lock = TaskLock(sample_chat_data["task_id"], MagicMock(), {})
+        task_lock.artifacts = MagicMock()
+        options = Chat(**{**sample_chat_data, "installed_mcp": {"mcpServers": {}}})
+
+        with patch("app.utils.agent.get_task_lock", return_value=task_lock), \
+             patch("app.utils.agent.agent_model_backend", return_value=MagicMock()), \
+             patch("app.utils.agent.ListenChatAgent") as agent_class:
+            await mcp_agent(options)
+
+        tools = agent_class.call_args.kwargs["tools"]
+        assert "read_artifact" in [tool.get_function_name() for tool in tools]
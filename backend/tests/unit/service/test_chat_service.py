@@ -1,3 +1,5 @@
+import asyncio
+import threading
 from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
 
@@ -10,12 +12,14 @@ from app.service.chat_service import (
     add_sub_tasks,
     question_confirm,
     summary_task,
+    build_component,
     construct_workforce,
     format_agent_description,
     new_agent_model
 )
 from app.model.chat import Chat, NewAgent
-from app.service.task import Action, ActionImproveData, ActionEndData, ActionInstallMcpData
+from app.utils.agent import announce_agent
+from app.service.task import Action, ActionImproveData, ActionEndData, ActionInstallMcpData, ActionStopData, TaskIndex
 from camel.tasks import Task
 from camel.tasks.task import TaskState
 
@@ -128,6 +132,25 @@ class TestChatServiceUtilities:
         assert len(result) == 1
         # Note: The actual behavior depends on the implementation details
 
+    def test_update_sub_tasks_removes_from_index(self):
+        """Test update_sub_tasks drops removed tasks and their subtasks from the index."""
+        from app.model.chat import TaskContent
+
+        main_task = Task(content="Main", id="main")
+        kept = Task(content="Kept", id="kept")
+        removed = Task(content="Removed", id="removed")
+        removed.add_subtask(Task(content="Removed child", id="removed_child"))
+        main_task.add_subtask(kept)
+        main_task.add_subtask(removed)
+        task_index = TaskIndex()
+        task_index.add(main_task)
+
+        update_sub_tasks(main_task.subtasks, {"kept": TaskContent(id="kept", content="Kept")}, task_index=task_index)
+
+        assert "kept" in task_index
+        assert "removed" not in task_index
+        assert "removed_child" not in task_index
+
     def test_add_sub_tasks_to_camel_task(self):
         """Test add_sub_tasks adds new tasks to CAMEL task."""
         from app.model.chat import TaskContent
@@ -151,6 +174,19 @@ class TestChatServiceUtilities:
         assert new_subtasks[0].id.startswith("main.")
         assert new_subtasks[1].id.startswith("main.")
 
+    def test_add_sub_tasks_updates_index(self):
+        """Test add_sub_tasks indexes the new subtasks under the CAMEL task."""
+        from app.model.chat import TaskContent
+
+        camel_task = Task(content="Main Task", id="main")
+        task_index = TaskIndex()
+        task_index.add(camel_task)
+
+        add_sub_tasks(camel_task, [TaskContent(id="", content="New Task 1")], task_index)
+
+        assert task_index.get("main.1") is camel_task.subtasks[0]
+        assert task_index.parent("main.1") is camel_task
+
     def test_to_sub_tasks_creates_proper_response(self):
         """Test to_sub_tasks creates properly formatted SSE response."""
         task = Task(content="Main Task", id="main")
@@ -224,7 +260,7 @@ class TestChatServiceAgentOperations:
     @pytest.mark.asyncio
     async def test_question_confirm_simple_query(self, mock_camel_agent):
         """Test question_confirm with simple query that gets direct response."""
-        mock_camel_agent.step.return_value.msgs[0].content = "Hello! How can I help you today?"
+        mock_camel_agent.astep.return_value.msgs = [MagicMock(content="Hello! How can I help you today?")]
         mock_camel_agent.chat_history = []
         
         result = await question_confirm(mock_camel_agent, "hello")
@@ -236,7 +272,7 @@ class TestChatServiceAgentOperations:
     @pytest.mark.asyncio
     async def test_question_confirm_complex_task(self, mock_camel_agent):
         """Test question_confirm with complex task that should proceed."""
-        mock_camel_agent.step.return_value.msgs[0].content = "yes"
+        mock_camel_agent.astep.return_value.msgs = [MagicMock(content="yes")]
         mock_camel_agent.chat_history = []
         
         result = await question_confirm(mock_camel_agent, "Create a web application with authentication")
@@ -247,14 +283,16 @@ class TestChatServiceAgentOperations:
     @pytest.mark.asyncio
     async def test_summary_task(self, mock_camel_agent):
         """Test summary_task creates proper task summary."""
-        mock_camel_agent.step.return_value.msgs[0].content = "Web App Creation|Create a modern web application with user authentication and dashboard"
+        mock_camel_agent.astep.return_value.msgs = [
+            MagicMock(content="Web App Creation|Create a modern web application with user authentication and dashboard")
+        ]
         
         task = Task(content="Create a web application with user authentication", id="web_app_task")
         
         result = await summary_task(mock_camel_agent, task)
         
         assert result == "Web App Creation|Create a modern web application with user authentication and dashboard"
-        mock_camel_agent.step.assert_called_once()
+        mock_camel_agent.astep.assert_awaited_once()
 
     @pytest.mark.asyncio
     async def test_new_agent_model_creation(self, sample_chat_data):
@@ -296,17 +334,91 @@ class TestChatServiceAgentOperations:
              patch("app.utils.toolkit.human_toolkit.get_task_lock", return_value=mock_task_lock):
             
             mock_agent_model.return_value = MagicMock()
+            latency = {}
             
-            workforce, mcp = await construct_workforce(options)
+            workforce, mcp = await construct_workforce(options, latency)
             
             assert workforce is mock_workforce
-            assert mcp is mock_mcp_agent
+            assert await mcp is mock_mcp_agent
             
             # Should add multiple agent workers
             assert mock_workforce.add_single_agent_worker.call_count >= 4
+            assert set(latency) == {
+                "coordinator_agent",
+                "task_agent",
+                "new_worker_agent",
+                "developer_agent",
+                "search_agent",
+                "document_agent",
+                "multi_modal_agent",
+                "mcp_agent",
+            }
 
     @pytest.mark.asyncio
-    async def test_install_mcp_success(self, mock_camel_agent):
+    async def test_construct_workforce_skips_failed_worker(self, sample_chat_data, mock_task_lock):
+        """Test construct_workforce leaves out a worker that fails or times out."""
+        options = Chat(**sample_chat_data)
+        mock_workforce = MagicMock()
+
+        async def slow_document_agent(options):
+            await asyncio.sleep(10)
+
+        with patch("app.service.chat_service.agent_model", return_value=MagicMock()), \
+             patch("app.service.chat_service.Workforce", return_value=mock_workforce), \
+             patch("app.service.chat_service.search_agent", side_effect=Exception("browser unavailable")), \
+             patch("app.service.chat_service.developer_agent"), \
+             patch("app.service.chat_service.document_agent", side_effect=slow_document_agent), \
+             patch("app.service.chat_service.multi_modal_agent"), \
+             patch("app.service.chat_service.mcp_agent"), \
+             patch("app.service.chat_service.env", side_effect=lambda key, default=None: "1" if key == "agent_build_timeout" else default), \
+             patch("app.utils.toolkit.human_toolkit.get_task_lock", return_value=mock_task_lock):
+
+            workforce, mcp = await construct_workforce(options)
+            await mcp
+
+        descriptions = [call.args[0] for call in mock_workforce.add_single_agent_worker.call_args_list]
+        assert len(descriptions) == 2
+        assert descriptions[0].startswith("Developer Agent")
+        assert descriptions[1].startswith("Multi-Modal Agent")
+
+    @pytest.mark.asyncio
+    async def test_abandoned_build_creates_no_agent(self, mock_task_lock):
+        """Test that a threaded builder finishing after its timeout does not announce its agent."""
+        gate = threading.Event()
+        finished = threading.Event()
+        errors = []
+
+        def slow_build():
+            gate.wait(5)
+            try:
+                announce_agent(mock_task_lock, {"agent_name": "search_agent", "agent_id": "1", "tools": []})
+            except TimeoutError as e:
+                errors.append(e)
+            finally:
+                finished.set()
+
+        latency = {}
+        with pytest.raises(asyncio.TimeoutError):
+            await build_component("search_agent", slow_build, 0.05, latency)
+        gate.set()
+        await asyncio.to_thread(finished.wait, 5)
+
+        assert len(errors) == 1
+        mock_task_lock.emit.assert_not_called()
+        assert "search_agent" in latency
+
+    @pytest.mark.asyncio
+    async def test_build_in_time_creates_agent(self, mock_task_lock):
+        """Test that a builder finishing within its timeout announces its agent."""
+        data = {"agent_name": "search_agent", "agent_id": "1", "tools": []}
+
+        await build_component("search_agent", lambda: announce_agent(mock_task_lock, data), 1, {})
+
+        mock_task_lock.emit.assert_called_once()
+        assert mock_task_lock.emit.call_args.args[0].data == data
+
+    @pytest.mark.asyncio
+    async def test_install_mcp_success(self, mock_camel_agent, mock_task_lock):
         """Test install_mcp successfully installs MCP tools."""
         mock_tools = [MagicMock(), MagicMock()]
         install_data = ActionInstallMcpData(
@@ -314,17 +426,44 @@ class TestChatServiceAgentOperations:
         )
         
         with patch("app.service.chat_service.get_mcp_tools", return_value=mock_tools):
-            await install_mcp(mock_camel_agent, install_data)
+            await install_mcp(mock_camel_agent, install_data, mock_task_lock)
             
             mock_camel_agent.add_tools.assert_called_once_with(mock_tools)
 
+    @pytest.mark.asyncio
+    async def test_install_mcp_waits_for_mcp_agent(self, mock_camel_agent, mock_task_lock):
+        """Test install_mcp waits for the MCP agent that is still being built."""
+        install_data = ActionInstallMcpData(data={"mcpServers": {"notion": {"config": "test"}}})
+        mcp = asyncio.get_running_loop().create_future()
+        mcp.set_result(mock_camel_agent)
+
+        with patch("app.service.chat_service.get_mcp_tools", return_value=[]):
+            await install_mcp(mcp, install_data, mock_task_lock)
+
+        mock_camel_agent.add_tools.assert_called_once_with([])
+
+    @pytest.mark.asyncio
+    async def test_install_mcp_reports_failed_mcp_agent(self, mock_task_lock):
+        """Test install_mcp notifies the user instead of raising when the MCP agent failed to build."""
+        install_data = ActionInstallMcpData(data={"mcpServers": {"notion": {"config": "test"}}})
+        mcp = asyncio.get_running_loop().create_future()
+        mcp.set_exception(asyncio.TimeoutError())
+
+        with patch("app.service.chat_service.get_mcp_tools", return_value=[]) as get_tools:
+            await install_mcp(mcp, install_data, mock_task_lock)
+
+        get_tools.assert_not_called()
+        notice = mock_task_lock.emit.call_args.args[0]
+        assert notice.action == Action.notice
+        assert notice.data.startswith("Failed to install MCP servers")
+
 
 @pytest.mark.integration
 class TestChatServiceIntegration:
     """Integration tests for chat service."""
     
     @pytest.mark.asyncio
-    async def test_step_solve_basic_workflow(self, sample_chat_data, mock_request, mock_task_lock):
+    async def test_step_solve_basic_workflow(self, sample_chat_data, mock_task_lock):
         """Test step_solve basic workflow integration."""
         options = Chat(**sample_chat_data)
         
@@ -351,7 +490,7 @@ class TestChatServiceIntegration:
             
             # Convert async generator to list
             responses = []
-            async for response in step_solve(options, mock_request, mock_task_lock):
+            async for response in step_solve(options, mock_task_lock):
                 responses.append(response)
                 # Break after a few responses to avoid infinite loop
                 if len(responses) > 10:
@@ -360,27 +499,71 @@ class TestChatServiceIntegration:
             # Should have received some responses
             assert len(responses) > 0
 
-    @pytest.mark.asyncio 
-    async def test_step_solve_with_disconnected_request(self, sample_chat_data, mock_request, mock_task_lock):
-        """Test step_solve handles disconnected request."""
+    @pytest.mark.asyncio
+    async def test_step_solve_summarizes_while_decomposing(self, sample_chat_data, mock_task_lock):
+        """Test step_solve runs the task summary concurrently with the decomposition."""
         options = Chat(**sample_chat_data)
-        mock_request.is_disconnected = AsyncMock(return_value=True)
-        
+        mock_task_lock.get_queue = AsyncMock(side_effect=[
+            ActionImproveData(action=Action.improve, data="Test question"),
+            ActionEndData(action=Action.end)
+        ])
+        summary_started = threading.Event()
+
+        def make_sub_tasks(task):
+            # Only returns once the summary is already running
+            assert summary_started.wait(timeout=5)
+            return []
+
+        async def summarize(agent, task):
+            summary_started.set()
+            assert task.subtasks == []
+            return "Test Summary"
+
         mock_workforce = MagicMock()
-        
+        mock_workforce.eigent_make_sub_tasks.side_effect = make_sub_tasks
+
         with patch("app.service.chat_service.construct_workforce", return_value=(mock_workforce, MagicMock())), \
-             patch("app.utils.agent.get_task_lock", return_value=mock_task_lock):
-            # Should exit immediately if request is disconnected
-            responses = []
-            async for response in step_solve(options, mock_request, mock_task_lock):
-                responses.append(response)
-            
-            # Should not have any responses due to immediate disconnection
-            assert len(responses) == 0
-            # Note: Workforce might not be created/stopped if request is immediately disconnected
+             patch("app.service.chat_service.question_confirm_agent"), \
+             patch("app.service.chat_service.task_summary_agent"), \
+             patch("app.service.chat_service.question_confirm", return_value=True), \
+             patch("app.service.chat_service.summary_task", side_effect=summarize):
+            responses = [response async for response in step_solve(options, mock_task_lock)]
+
+        assert any("to_sub_tasks" in response and "Test Summary" in response for response in responses)
+
+    @pytest.mark.asyncio
+    async def test_step_solve_stops_on_stop_action(self, sample_chat_data, mock_task_lock):
+        """Test step_solve stops the workforce and releases the task lock on stop.
+
+        A stop is also what the task lock sends when no client reattaches to a
+        detached stream in time.
+        """
+        options = Chat(**sample_chat_data)
+        mock_task_lock.get_queue = AsyncMock(side_effect=[
+            ActionImproveData(action=Action.improve, data="Test question"),
+            ActionStopData(),
+        ])
+
+        mock_workforce = MagicMock()
+        mock_workforce._running = True
+
+        with patch("app.service.chat_service.construct_workforce", return_value=(mock_workforce, MagicMock())), \
+             patch("app.service.chat_service.question_confirm_agent"), \
+             patch("app.service.chat_service.task_summary_agent"), \
+             patch("app.service.chat_service.question_confirm", return_value=True), \
+             patch("app.service.chat_service.summary_task", return_value="Test Summary"), \
+             patch("app.service.chat_service.delete_task_lock") as mock_delete:
+            mock_workforce.eigent_make_sub_tasks.return_value = []
+
+            responses = [response async for response in step_solve(options, mock_task_lock)]
+
+            assert len(responses) > 0
+            mock_workforce.stop.assert_called_once()
+            mock_workforce.stop_gracefully.assert_called_once()
+            mock_delete.assert_awaited_once_with(mock_task_lock.id)
 
     @pytest.mark.asyncio
-    async def test_step_solve_error_handling(self, sample_chat_data, mock_request, mock_task_lock):
+    async def test_step_solve_error_handling(self, sample_chat_data, mock_task_lock):
         """Test step_solve handles errors gracefully."""
         options = Chat(**sample_chat_data)
         
@@ -389,7 +572,7 @@ class TestChatServiceIntegration:
         
         with patch("app.utils.agent.get_task_lock", return_value=mock_task_lock):
             responses = []
-            async for response in step_solve(options, mock_request, mock_task_lock):
+            async for response in step_solve(options, mock_task_lock):
                 responses.append(response)
                 break  # Exit after first iteration
             
@@ -427,7 +610,7 @@ class TestChatServiceErrorCases:
     @pytest.mark.asyncio
     async def test_question_confirm_agent_error(self, mock_camel_agent):
         """Test question_confirm when agent raises error."""
-        mock_camel_agent.step.side_effect = Exception("Agent error")
+        mock_camel_agent.astep.side_effect = Exception("Agent error")
         
         with pytest.raises(Exception, match="Agent error"):
             await question_confirm(mock_camel_agent, "test question")
@@ -435,7 +618,7 @@ class TestChatServiceErrorCases:
     @pytest.mark.asyncio
     async def test_summary_task_agent_error(self, mock_camel_agent):
         """Test summary_task when agent raises error."""
-        mock_camel_agent.step.side_effect = Exception("Summary error")
+        mock_camel_agent.astep.side_effect = Exception("Summary error")
         
         task = Task(content="Test task", id="test")
         
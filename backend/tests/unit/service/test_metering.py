@@ -0,0 +1,77 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from camel.agents import ChatAgent
+from camel.messages import BaseMessage
+from camel.responses import ChatAgentResponse
+
+from app.service.metering import TaskMetrics
+from app.service.task import TaskLock
+from app.utils.agent import ListenChatAgent
+
+
+@pytest.mark.unit
+class TestTaskMetrics:
+    """Test cases for per-task metering."""
+
+    def test_summary_aggregates_agents(self):
+        """Test that usage is kept per agent and model and totalled for the task."""
+        metrics = TaskMetrics()
+        metrics.record_step("developer_agent", "gpt-4o", {"prompt_tokens": 100, "completion_tokens": 20}, ["shell_exec"])
+        metrics.record_step("developer_agent", "gpt-4o", {"prompt_tokens": 50, "completion_tokens": 5}, ["shell_exec", "write_to_file"])
+        metrics.record_step("search_agent", "gpt-4o-mini", None, [], failed=True)
+        metrics.record_model_call("developer_agent", "gpt-4o", 0.2)
+        metrics.record_model_call("developer_agent", "gpt-4o", 7.0)
+        metrics.record_retry("task.1")
+
+        summary = metrics.summary()
+
+        assert summary["prompt_tokens"] == 150
+        assert summary["completion_tokens"] == 25
+        assert summary["total_tokens"] == 175
+        assert summary["tool_calls"] == 3
+        assert summary["retries"] == 1
+        developer, search = summary["agents"]
+        assert developer["model"] == "gpt-4o"
+        assert developer["tool_calls"] == {"shell_exec": 2, "write_to_file": 1}
+        assert developer["model_calls"] == 2
+        assert developer["max_model_seconds"] == 7.0
+        assert developer["latency_histogram"]["le_0.5"] == 1
+        assert developer["latency_histogram"]["le_10"] == 1
+        assert search["failed_steps"] == 1
+
+    def test_cached_tokens_from_usage(self):
+        """Test that cached prompt tokens are read from OpenAI and Anthropic style usage."""
+        metrics = TaskMetrics()
+        metrics.record_model_call(
+            "developer_agent", "gpt-4o", 1.0, {"prompt_tokens": 4000, "prompt_tokens_details": {"cached_tokens": 3072}}
+        )
+        metrics.record_model_call("developer_agent", "gpt-4o", 1.0, {"prompt_tokens": 4000, "cache_read_input_tokens": 928})
+        metrics.record_model_call("developer_agent", "gpt-4o", 1.0, None)
+
+        developer = metrics.summary()["agents"][0]
+        assert developer["cached_tokens"] == 4000
+        assert developer["cache_hit_rate"] == 0.5
+        assert metrics.summary()["cached_tokens"] == 4000
+
+    def test_listen_chat_agent_records_steps(self):
+        """Test that ListenChatAgent steps land in the metrics of their task."""
+        task_lock = TaskLock("metering_task", MagicMock(), {})
+        backend = MagicMock()
+        backend.model_type = "gpt-4o"
+        response = ChatAgentResponse(
+            msgs=[BaseMessage.make_assistant_message(role_name="assistant", content="Done")],
+            terminated=False,
+            info={"usage": {"prompt_tokens": 30, "completion_tokens": 12, "total_tokens": 42}, "tool_calls": []},
+        )
+
+        with patch("app.utils.agent.get_task_lock", return_value=task_lock), \
+             patch("camel.models.ModelFactory.create", return_value=backend), \
+             patch.object(ChatAgent, "step", return_value=response):
+            agent = ListenChatAgent(api_task_id="metering_task", agent_name="task_agent", model="gpt-4o")
+            agent.step("Plan the task")
+
+        summary = task_lock.metrics.summary()
+        assert summary["total_tokens"] == 42
+        assert summary["agents"][0]["agent_name"] == "task_agent"
+        assert summary["agents"][0]["steps"] == 1
@@ -1,5 +1,4 @@
 import asyncio
-import weakref
 from datetime import datetime, timedelta
 from unittest.mock import patch
 import pytest
@@ -24,6 +23,8 @@ from app.service.task import (
     ActionSearchMcpData,
     ActionInstallMcpData,
     ActionTerminalData,
+    ActionToolkitCallData,
+    ActionAgentDeltaData,
     ActionStopData,
     ActionEndData,
     ActionSupplementData,
@@ -31,16 +32,19 @@ from app.service.task import (
     ActionNewAgent,
     ActionBudgetNotEnough,
     Agents,
+    EventCoalescer,
+    QueuePolicy,
+    TaskIndex,
     TaskLock,
+    TaskQueue,
+    TaskReaper,
     task_locks,
     get_task_lock,
     create_task_lock,
     delete_task_lock,
-    get_camel_task,
     set_process_task,
     process_task,
     _periodic_cleanup,
-    task_index,
 )
 from camel.tasks import Task
 
@@ -279,6 +283,394 @@ class TestTaskLock:
         assert task2.cancelled()
 
 
+@pytest.mark.unit
+class TestTaskQueue:
+    """Test cases for the bounded TaskQueue."""
+
+    @pytest.mark.asyncio
+    async def test_drop_oldest_evicts_low_priority_event(self):
+        """Test that drop_oldest evicts the oldest low-priority event when full."""
+        queue = TaskQueue(maxsize=2, policy=QueuePolicy.drop_oldest)
+        await queue.put(ActionTerminalData(process_task_id="1", data="first"))
+        await queue.put(ActionStartData())
+        await queue.put(ActionTerminalData(process_task_id="1", data="second"))
+
+        assert queue.qsize() == 2
+        assert queue.dropped == 1
+        assert (await queue.get()).action == Action.start
+        assert (await queue.get()).data == "second"
+
+    @pytest.mark.asyncio
+    async def test_drop_oldest_drops_new_low_priority_event(self):
+        """Test that a low-priority event is dropped when nothing else can be evicted."""
+        queue = TaskQueue(maxsize=1, policy=QueuePolicy.drop_oldest)
+        await queue.put(ActionStartData())
+        await queue.put(ActionTerminalData(process_task_id="1", data="output"))
+
+        assert queue.qsize() == 1
+        assert queue.dropped == 1
+        assert (await queue.get()).action == Action.start
+
+    @pytest.mark.asyncio
+    async def test_control_actions_bypass_capacity(self):
+        """Test that control actions are accepted even when the queue is full."""
+        queue = TaskQueue(maxsize=1, policy=QueuePolicy.block)
+        await queue.put(ActionStartData())
+        await asyncio.wait_for(queue.put(ActionStopData()), timeout=1)
+
+        assert queue.qsize() == 2
+        assert queue.dropped == 0
+        assert queue.peak_size == 2
+
+    @pytest.mark.asyncio
+    async def test_block_policy_waits_for_consumer(self):
+        """Test that the block policy makes producers wait for free space."""
+        queue = TaskQueue(maxsize=1, policy=QueuePolicy.block)
+        await queue.put(ActionTerminalData(process_task_id="1", data="first"))
+
+        producer = asyncio.create_task(queue.put(ActionTerminalData(process_task_id="1", data="second")))
+        await asyncio.sleep(0.01)
+        assert not producer.done()
+        assert queue.blocked == 1
+
+        assert (await queue.get()).data == "first"
+        await asyncio.wait_for(producer, timeout=1)
+        assert (await queue.get()).data == "second"
+
+    @pytest.mark.asyncio
+    async def test_coalesce_merges_terminal_output(self):
+        """Test that coalesce merges terminal output into the pending tail event."""
+        queue = TaskQueue(maxsize=1, policy=QueuePolicy.coalesce)
+        await queue.put(ActionTerminalData(process_task_id="1", data="a\n"))
+        await queue.put(ActionTerminalData(process_task_id="1", data="b\n"))
+
+        assert queue.qsize() == 1
+        assert queue.coalesced == 1
+        assert (await queue.get()).data == "a\nb\n"
+
+    @pytest.mark.asyncio
+    async def test_coalesce_falls_back_to_drop_oldest(self):
+        """Test that coalesce evicts when output belongs to another process task."""
+        queue = TaskQueue(maxsize=1, policy=QueuePolicy.coalesce)
+        await queue.put(ActionTerminalData(process_task_id="1", data="a"))
+        await queue.put(ActionTerminalData(process_task_id="2", data="b"))
+
+        assert queue.coalesced == 0
+        assert queue.dropped == 1
+        assert (await queue.get()).process_task_id == "2"
+
+    @pytest.mark.asyncio
+    async def test_full_queue_merges_agent_deltas(self):
+        """Test that streamed output of an agent is merged into its pending delta instead of blocking."""
+        queue = TaskQueue(maxsize=2, policy=QueuePolicy.drop_oldest)
+        await queue.put(delta("a", "Hel"))
+        await queue.put(delta("b", "Hi"))
+        await asyncio.wait_for(queue.put(delta("a", "lo")), timeout=1)
+        await asyncio.wait_for(queue.put(delta("a", "Bye", replace=True)), timeout=1)
+
+        assert queue.coalesced == 2
+        assert [(item.data["agent_id"], item.data["delta"]) for item in (await queue.get(), await queue.get())] == [
+            ("a", "Bye"),
+            ("b", "Hi"),
+        ]
+
+    def test_task_lock_queue_stats(self):
+        """Test that queue stats are exposed through the task lock."""
+        task_lock = TaskLock("test_123", TaskQueue(maxsize=10, policy=QueuePolicy.drop_oldest), {})
+        stats = task_lock.queue_stats()
+
+        assert stats["size"] == 0
+        assert stats["maxsize"] == 10
+        assert stats["policy"] == "drop_oldest"
+        assert stats["dropped"] == 0
+
+        plain_lock = TaskLock("test_456", asyncio.Queue(), {})
+        assert plain_lock.queue_stats() == {"size": 0, "maxsize": 0}
+
+
+def delta(agent_id: str, text: str, replace: bool = False) -> ActionAgentDeltaData:
+    return ActionAgentDeltaData(
+        data={
+            "agent_name": f"agent_{agent_id}",
+            "agent_id": agent_id,
+            "process_task_id": "1",
+            "delta": text,
+            "replace": replace,
+        }
+    )
+
+
+@pytest.mark.unit
+class TestEventCoalescer:
+    """Test cases for EventCoalescer."""
+
+    @staticmethod
+    def toolkit_data(method_name: str = "shell exec") -> dict:
+        return {
+            "agent_name": "developer_agent",
+            "toolkit_name": "Terminal Toolkit",
+            "process_task_id": "1",
+            "method_name": method_name,
+            "message": "",
+        }
+
+    @pytest.mark.asyncio
+    async def test_merges_terminal_chunks_of_same_process_task(self):
+        """Test that consecutive terminal chunks are merged and order is kept."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        for data in ["a\n", "b\n", "c\n"]:
+            await task_lock.put_queue(ActionTerminalData(process_task_id="1", data=data))
+        await task_lock.put_queue(ActionTerminalData(process_task_id="2", data="d\n"))
+        await task_lock.put_queue(ActionEndData())
+
+        events = EventCoalescer(task_lock, 0.05)
+        first = await events.get()
+        second = await events.get()
+        third = await events.get()
+
+        assert first.process_task_id == "1"
+        assert first.data == "a\nb\nc\n"
+        assert second.process_task_id == "2"
+        assert second.data == "d\n"
+        assert third.action == Action.end
+
+    @pytest.mark.asyncio
+    async def test_collapses_short_toolkit_call(self):
+        """Test that an activation followed by its deactivation becomes one toolkit call."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        await task_lock.put_queue(ActionActivateToolkitData(data=self.toolkit_data()))
+        await task_lock.put_queue(ActionDeactivateToolkitData(data=self.toolkit_data()))
+
+        item = await EventCoalescer(task_lock, 0.05).get()
+
+        assert isinstance(item, ActionToolkitCallData)
+        assert item.activate.action == Action.activate_toolkit
+        assert item.deactivate.action == Action.deactivate_toolkit
+
+    @pytest.mark.asyncio
+    async def test_keeps_unmatched_toolkit_events_in_order(self):
+        """Test that a non-matching event after an activation is returned next."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        await task_lock.put_queue(ActionActivateToolkitData(data=self.toolkit_data()))
+        await task_lock.put_queue(ActionDeactivateToolkitData(data=self.toolkit_data("shell view")))
+
+        events = EventCoalescer(task_lock, 0.05)
+        assert (await events.get()).action == Action.activate_toolkit
+        assert (await events.get()).action == Action.deactivate_toolkit
+
+    @pytest.mark.asyncio
+    async def test_long_toolkit_call_is_not_collapsed(self):
+        """Test that an activation is released once the window expires."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        await task_lock.put_queue(ActionActivateToolkitData(data=self.toolkit_data()))
+
+        item = await asyncio.wait_for(EventCoalescer(task_lock, 0.01).get(), timeout=1)
+        assert item.action == Action.activate_toolkit
+
+    @pytest.mark.asyncio
+    async def test_merges_agent_deltas_of_same_agent(self):
+        """Test that consecutive deltas of an agent become one frame and other agents keep theirs."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        for item in [delta("a", "Hel"), delta("a", "lo"), delta("b", "Hi"), delta("b", "!")]:
+            await task_lock.put_queue(item)
+
+        events = EventCoalescer(task_lock, 0.05)
+        first = await events.get()
+        second = await events.get()
+
+        assert (first.data["agent_id"], first.data["delta"], first.data["replace"]) == ("a", "Hello", False)
+        assert (second.data["agent_id"], second.data["delta"]) == ("b", "Hi!")
+
+    @pytest.mark.asyncio
+    async def test_zero_window_disables_coalescing(self):
+        """Test that a zero window passes events through untouched."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        await task_lock.put_queue(ActionTerminalData(process_task_id="1", data="a"))
+        await task_lock.put_queue(ActionTerminalData(process_task_id="1", data="b"))
+
+        events = EventCoalescer(task_lock, 0)
+        assert (await events.get()).data == "a"
+        assert (await events.get()).data == "b"
+
+
+@pytest.mark.unit
+class TestTaskLockStream:
+    """Test cases for the resumable SSE stream of a task lock."""
+
+    def test_publish_assigns_increasing_event_ids(self):
+        """Test that every frame of a write gets its own event id."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+
+        first = task_lock.publish('data: {"step": "a"}\n\n')
+        second = task_lock.publish('data: {"step": "b"}\n\ndata: {"step": "c"}\n\n')
+
+        assert first == 'id: 1\ndata: {"step": "a"}\n\n'
+        assert second == 'id: 2\ndata: {"step": "b"}\n\nid: 3\ndata: {"step": "c"}\n\n'
+        assert task_lock.event_id == 3
+        assert [event_id for event_id, _ in task_lock.replay] == [1, 2, 3]
+
+    def test_replay_buffer_is_bounded(self):
+        """Test that only the most recent frames are kept for replay."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {}, replay_size=2)
+        for step in ["a", "b", "c"]:
+            task_lock.publish(f"data: {step}\n\n")
+
+        assert [event_id for event_id, _ in task_lock.replay] == [2, 3]
+
+    @pytest.mark.asyncio
+    async def test_subscribe_replays_after_last_event_id(self):
+        """Test that a reattaching client only receives frames it has not seen."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+
+        async def frames():
+            for step in ["a", "b", "c"]:
+                yield f"data: {step}\n\n"
+
+        task_lock.start_stream(frames())
+        await task_lock.stream_task
+
+        received = [frame async for frame in task_lock.subscribe(last_event_id=1)]
+        assert received == ["id: 2\ndata: b\n\nid: 3\ndata: c\n\n"]
+        assert task_lock.subscribers == 0
+
+    @pytest.mark.asyncio
+    async def test_subscribe_reports_frames_dropped_from_replay(self):
+        """Test that a client whose next frame left the replay buffer gets a gap event first."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {}, replay_size=2)
+
+        async def frames():
+            for step in ["a", "b", "c", "d"]:
+                yield f"data: {step}\n\n"
+
+        task_lock.start_stream(frames())
+        await task_lock.stream_task
+
+        received = [frame async for frame in task_lock.subscribe(last_event_id=1)]
+        assert received == [
+            'data: {"step": "replay_gap", "data": {"last_event_id": 1, "next_event_id": 3}}\n\n'
+            "id: 3\ndata: c\n\nid: 4\ndata: d\n\n"
+        ]
+        # An id from another stream of the task is no longer valid either
+        received = [frame async for frame in task_lock.subscribe(last_event_id=9)]
+        assert received[0].startswith('data: {"step": "replay_gap"')
+        assert received[0].endswith("id: 3\ndata: c\n\nid: 4\ndata: d\n\n")
+        assert [frame async for frame in task_lock.subscribe(last_event_id=2)] == [
+            "id: 3\ndata: c\n\nid: 4\ndata: d\n\n"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_lagging_subscriber_gets_gap(self):
+        """Test that a subscriber falling more than the replay buffer behind is told it missed frames."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {}, replay_size=2)
+        task_lock.publish("data: a\n\n")
+        subscriber = task_lock.subscribe()
+        assert await subscriber.__anext__() == "id: 1\ndata: a\n\n"
+
+        for step in ["b", "c", "d"]:
+            task_lock.publish(f"data: {step}\n\n")
+        received = await asyncio.wait_for(subscriber.__anext__(), timeout=1)
+
+        assert received.startswith('data: {"step": "replay_gap", "data": {"last_event_id": 1, "next_event_id": 3}}')
+        assert received.endswith("id: 3\ndata: c\n\nid: 4\ndata: d\n\n")
+        await subscriber.aclose()
+
+    @pytest.mark.asyncio
+    async def test_subscribe_follows_live_stream(self):
+        """Test that an attached client receives frames as they are produced."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        release = asyncio.Event()
+
+        async def frames():
+            yield "data: a\n\n"
+            await release.wait()
+            yield "data: b\n\n"
+
+        task_lock.start_stream(frames())
+        subscriber = task_lock.subscribe()
+        assert await subscriber.__anext__() == "id: 1\ndata: a\n\n"
+
+        release.set()
+        assert await asyncio.wait_for(subscriber.__anext__(), timeout=1) == "id: 2\ndata: b\n\n"
+        with pytest.raises(StopAsyncIteration):
+            await asyncio.wait_for(subscriber.__anext__(), timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_detached_stream_is_stopped_after_timeout(self):
+        """Test that a stop is queued when no client reattaches in time."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+
+        async def frames():
+            await asyncio.Event().wait()  # never produces a frame
+            yield ""
+
+        task_lock.start_stream(frames())
+
+        with patch("app.service.task.env", return_value="0"):
+            subscriber = task_lock.subscribe()
+            pending = asyncio.create_task(subscriber.__anext__())
+            await asyncio.sleep(0.01)
+            pending.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await pending
+            await asyncio.sleep(0.01)
+
+        assert task_lock.subscribers == 0
+        item = await asyncio.wait_for(task_lock.get_queue(), timeout=1)
+        assert item.action == Action.stop
+        await task_lock.cleanup()
+
+
+@pytest.mark.unit
+class TestTaskLockEventBus:
+    """Test cases for enqueueing events from other threads and event loops."""
+
+    @pytest.mark.asyncio
+    async def test_task_lock_captures_running_loop(self):
+        """Test that a task lock created inside a loop is bound to it."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        assert task_lock.loop is asyncio.get_running_loop()
+
+    @pytest.mark.asyncio
+    async def test_emit_from_worker_thread(self):
+        """Test that emit marshals the event onto the owning loop."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+
+        await asyncio.to_thread(task_lock.emit, ActionNoticeData(process_task_id="1", data="hello"))
+
+        item = await asyncio.wait_for(task_lock.get_queue(), timeout=1)
+        assert item.action == Action.notice
+        assert item.data == "hello"
+
+    @pytest.mark.asyncio
+    async def test_put_queue_from_foreign_loop(self):
+        """Test that put_queue awaited in another loop lands in the owning queue."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+
+        await asyncio.to_thread(asyncio.run, task_lock.put_queue(ActionStopData()))
+
+        item = await asyncio.wait_for(task_lock.get_queue(), timeout=1)
+        assert item.action == Action.stop
+
+    @pytest.mark.asyncio
+    async def test_put_human_input_from_foreign_loop(self):
+        """Test that human replies can be delivered from another loop."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        task_lock.add_human_input_listen("agent")
+
+        await asyncio.to_thread(asyncio.run, task_lock.put_human_input("agent", "yes"))
+
+        assert await asyncio.wait_for(task_lock.get_human_input("agent"), timeout=1) == "yes"
+
+    def test_emit_without_loop_is_dropped(self):
+        """Test that emit never raises when no event loop is available."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        assert task_lock.loop is None
+
+        task_lock.emit(ActionNoticeData(process_task_id="1", data="hello"))
+
+        assert task_lock.queue.empty()
+
+
 @pytest.mark.unit
 class TestTaskLockManagement:
     """Test cases for task lock management functions."""
@@ -296,6 +688,7 @@ class TestTaskLockManagement:
         assert task_lock.id == task_id
         assert task_id in task_locks
         assert task_locks[task_id] is task_lock
+        assert isinstance(task_lock.queue, TaskQueue)
 
     def test_create_task_lock_already_exists(self):
         """Test creating task lock that already exists."""
@@ -346,77 +739,90 @@ class TestTaskLockManagement:
 
 
 @pytest.mark.unit
-class TestCamelTaskManagement:
-    """Test cases for CAMEL task management functions."""
-    
-    def setup_method(self):
-        """Clean up task_index before each test."""
-        global task_index
-        task_index.clear()
+class TestTaskIndex:
+    """Test cases for the per-task index of CAMEL tasks."""
 
-    def test_get_camel_task_direct_match(self):
-        """Test getting CAMEL task with direct ID match."""
+    def test_get_task_direct_match(self):
+        """Test getting an indexed CAMEL task by id."""
         task = Task(content="Test task", id="test_123")
-        tasks = [task]
-        
-        result = get_camel_task("test_123", tasks)
-        assert result is task
+        task_index = TaskIndex()
+        task_index.add(task)
+
+        assert task_index.get("test_123") is task
+        assert "test_123" in task_index
 
-    def test_get_camel_task_in_subtasks(self):
-        """Test getting CAMEL task from subtasks."""
+    def test_add_indexes_subtasks(self):
+        """Test that adding a task indexes its whole subtree with parents."""
         subtask = Task(content="Subtask", id="subtask_123")
         parent_task = Task(content="Parent task", id="parent_123")
         parent_task.add_subtask(subtask)
-        tasks = [parent_task]
-        
-        result = get_camel_task("subtask_123", tasks)
-        assert result is subtask
+        task_index = TaskIndex()
+        task_index.add(parent_task)
 
-    def test_get_camel_task_not_found(self):
-        """Test getting CAMEL task that doesn't exist."""
-        task = Task(content="Test task", id="test_123")
-        tasks = [task]
-        
-        result = get_camel_task("nonexistent_task", tasks)
-        assert result is None
+        assert task_index.get("subtask_123") is subtask
+        assert task_index.parent("subtask_123") is parent_task
+        assert task_index.parent("parent_123") is None
 
-    def test_get_camel_task_from_cache(self):
-        """Test getting CAMEL task from weak reference cache."""
-        task = Task(content="Test task", id="test_123")
-        task_index["test_123"] = weakref.ref(task)
-        
-        result = get_camel_task("test_123", [])
-        assert result is task
+    def test_get_task_not_found(self):
+        """Test getting a CAMEL task that was never indexed."""
+        task_index = TaskIndex()
+        task_index.add(Task(content="Test task", id="test_123"))
 
-    def test_get_camel_task_dead_reference(self):
-        """Test getting CAMEL task with dead weak reference."""
-        task = Task(content="Test task", id="test_123")
-        task_ref = weakref.ref(task)
-        task_index["test_123"] = task_ref
-        
-        # Delete the original task to make the weak reference dead
-        del task
-        
-        # Should rebuild index and return None since task is not in tasks list
-        result = get_camel_task("test_123", [])
-        assert result is None
-        assert "test_123" not in task_index
+        assert task_index.get("nonexistent_task") is None
+        assert task_index.parent("nonexistent_task") is None
 
-    def test_get_camel_task_rebuilds_index(self):
-        """Test that get_camel_task rebuilds the index."""
-        task1 = Task(content="Task 1", id="task_1")
-        task2 = Task(content="Task 2", id="task_2")
-        tasks = [task1, task2]
-        
-        # Index should be empty initially
-        assert len(task_index) == 0
-        
-        # Getting a task should rebuild the index
-        result = get_camel_task("task_2", tasks)
-        assert result is task2
-        assert len(task_index) == 2
-        assert "task_1" in task_index
-        assert "task_2" in task_index
+    def test_add_subtask_updates_tree_and_index(self):
+        """Test that add_subtask attaches the task and indexes it."""
+        parent_task = Task(content="Parent task", id="parent_123")
+        task_index = TaskIndex()
+        task_index.add(parent_task)
+
+        subtask = Task(content="Subtask", id="parent_123.1")
+        task_index.add_subtask(parent_task, subtask)
+
+        assert parent_task.subtasks == [subtask]
+        assert task_index.get("parent_123.1") is subtask
+        assert task_index.parent("parent_123.1") is parent_task
+
+    def test_remove_drops_subtree(self):
+        """Test that removing a task also removes its descendants."""
+        root_task = Task(content="Root task", id="root")
+        child = Task(content="Child", id="child")
+        grandchild = Task(content="Grandchild", id="grandchild")
+        root_task.add_subtask(child)
+        child.add_subtask(grandchild)
+        task_index = TaskIndex()
+        task_index.add(root_task)
+
+        task_index.remove("child")
+
+        assert "child" not in task_index
+        assert "grandchild" not in task_index
+        assert len(task_index) == 1
+
+    def test_subtree_iterates_descendants(self):
+        """Test subtree iteration in depth-first order."""
+        root_task = Task(content="Root task", id="root")
+        child1 = Task(content="Child 1", id="child_1")
+        child2 = Task(content="Child 2", id="child_2")
+        grandchild = Task(content="Grandchild", id="grandchild")
+        root_task.add_subtask(child1)
+        root_task.add_subtask(child2)
+        child1.add_subtask(grandchild)
+        task_index = TaskIndex()
+        task_index.add(root_task)
+
+        assert [task.id for task in task_index.subtree("root")] == ["root", "child_1", "grandchild", "child_2"]
+        assert list(task_index.subtree("nonexistent")) == []
+
+    def test_task_lock_has_own_index(self):
+        """Test that every task lock keeps a separate index."""
+        first = TaskLock("first", asyncio.Queue(), {})
+        second = TaskLock("second", asyncio.Queue(), {})
+        first.task_index.add(Task(content="Test task", id="test_123"))
+
+        assert "test_123" in first.task_index
+        assert "test_123" not in second.task_index
 
 
 @pytest.mark.unit
@@ -518,15 +924,97 @@ class TestPeriodicCleanup:
             mock_logger.assert_called()
 
 
+@pytest.mark.unit
+class TestTaskReaper:
+    """Test cases for the TTL reaper of stale task locks."""
+
+    def setup_method(self):
+        """Clean up task_locks before each test."""
+        task_locks.clear()
+
+    def add_lock(self, id: str, idle: timedelta) -> TaskLock:
+        task_lock = TaskLock(id, asyncio.Queue(), {})
+        task_lock.last_accessed = datetime.now() - idle
+        task_locks[id] = task_lock
+        return task_lock
+
+    def test_pop_expired_returns_stale_locks(self):
+        """Test that only locks idle for longer than the ttl expire."""
+        reaper = TaskReaper(timedelta(hours=2))
+        reaper.schedule(self.add_lock("stale", timedelta(hours=3)))
+        reaper.schedule(self.add_lock("fresh", timedelta(minutes=1)))
+
+        assert reaper.pop_expired(datetime.now()) == ["stale"]
+        assert list(reaper.scheduled) == ["fresh"]
+
+    def test_touched_lock_is_rescheduled(self):
+        """Test that a lock accessed after scheduling is pushed back, not reaped."""
+        reaper = TaskReaper(timedelta(hours=2))
+        task_lock = self.add_lock("touched", timedelta(hours=3))
+        reaper.schedule(task_lock)
+        task_lock.last_accessed = datetime.now()
+
+        assert reaper.pop_expired(datetime.now()) == []
+        assert reaper.scheduled["touched"] == task_lock.last_accessed + timedelta(hours=2)
+        assert len(reaper.deadlines) == 1
+
+    def test_attached_subscriber_keeps_lock_alive(self):
+        """Test that a lock with a connected client is not reaped."""
+        reaper = TaskReaper(timedelta(hours=2))
+        task_lock = self.add_lock("streaming", timedelta(hours=3))
+        task_lock.subscribers = 1
+        reaper.schedule(task_lock)
+
+        assert reaper.pop_expired(datetime.now()) == []
+        assert "streaming" in reaper.scheduled
+
+    def test_discarded_lock_is_skipped(self):
+        """Test that entries of deleted or recreated locks are ignored."""
+        reaper = TaskReaper(timedelta(hours=2))
+        reaper.schedule(self.add_lock("recreated", timedelta(hours=3)))
+        reaper.discard("recreated")
+        reaper.schedule(self.add_lock("recreated", timedelta(0)))
+
+        assert reaper.pop_expired(datetime.now()) == []
+        assert len(reaper.deadlines) == 1
+
+    @pytest.mark.asyncio
+    async def test_run_deletes_expired_locks(self):
+        """Test that the reaper loop cleans up locks once their deadline passes."""
+        reaper = TaskReaper(timedelta(milliseconds=20))
+        runner = asyncio.create_task(reaper.run())
+        await asyncio.sleep(0)
+        reaper.schedule(self.add_lock("short_lived", timedelta(0)))
+
+        await asyncio.sleep(0.1)
+        runner.cancel()
+
+        assert "short_lived" not in task_locks
+        assert reaper.reaped == 1
+
+    def test_lock_stats_estimates_retained_memory(self):
+        """Test that queued events and replay frames are accounted for."""
+        task_lock = TaskLock("test_123", asyncio.Queue(), {})
+        assert task_lock.retained_bytes() == 0
+
+        task_lock.queue.put_nowait(ActionNoticeData(process_task_id="1", data="hello"))
+        task_lock.publish("data: a\n\n")
+
+        stats = task_lock.lock_stats()
+        assert stats["id"] == "test_123"
+        assert stats["queue"]["size"] == 1
+        assert stats["replay_frames"] == 1
+        assert stats["retained_bytes"] > len("id: 1\ndata: a\n\n")
+
+
 @pytest.mark.integration
 class TestTaskServiceIntegration:
     """Integration tests for task service components."""
     
     def setup_method(self):
         """Clean up before each test."""
-        global task_locks, task_index
+        global task_locks
         task_locks.clear()
-        task_index.clear()
 
     @pytest.mark.asyncio
     async def test_full_task_lifecycle(self):
@@ -614,17 +1102,19 @@ class TestTaskServiceIntegration:
         level1_task1.add_subtask(level2_task1)
         level1_task2.add_subtask(level2_task2)
         
-        tasks = [root_task]
+        task_index = TaskIndex()
+        task_index.add(root_task)
         
         # Test retrieval at different levels
-        assert get_camel_task("root", tasks) is root_task
-        assert get_camel_task("level1_1", tasks) is level1_task1
-        assert get_camel_task("level1_2", tasks) is level1_task2
-        assert get_camel_task("level2_1", tasks) is level2_task1
-        assert get_camel_task("level2_2", tasks) is level2_task2
+        assert task_index.get("root") is root_task
+        assert task_index.get("level1_1") is level1_task1
+        assert task_index.get("level1_2") is level1_task2
+        assert task_index.get("level2_1") is level2_task1
+        assert task_index.get("level2_2") is level2_task2
+        assert task_index.parent("level2_2") is level1_task2
         
         # Test non-existent task
-        assert get_camel_task("nonexistent", tasks) is None
+        assert task_index.get("nonexistent") is None
 
 
 @pytest.mark.model_backend
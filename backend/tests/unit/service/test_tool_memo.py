@@ -0,0 +1,93 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.service.task import Action, TaskLock
+from app.service.tool_memo import ToolMemo
+from app.utils.listen.toolkit_listen import listen_toolkit
+from app.utils.toolkit.abstract_toolkit import AbstractToolkit
+
+
+class ReaderToolkit(AbstractToolkit):
+    def __init__(self, api_task_id: str, working_directory: str | None = None):
+        self.api_task_id = api_task_id
+        self.agent_name = "document_agent"
+        self.working_directory = working_directory
+        self.calls = 0
+
+    @listen_toolkit(memoize=True)
+    def read_file(self, file_path: str) -> str:
+        self.calls += 1
+        if file_path == "missing.txt":
+            return f"Error: File {file_path} does not exist."
+        with open(f"{self.working_directory}/{file_path}") as f:
+            return f.read()
+
+    @listen_toolkit(memoize=True)
+    async def search_google(self, query: str, search_type: str = "web") -> list[dict]:
+        self.calls += 1
+        return [{"title": query, "search_type": search_type}]
+
+
+@pytest.fixture
+def task_lock():
+    task_lock = TaskLock("memo_task", MagicMock(), {})
+    task_lock.emit = MagicMock()
+    with patch("app.utils.listen.toolkit_listen.get_task_lock", return_value=task_lock):
+        yield task_lock
+
+
+@pytest.mark.unit
+class TestToolMemo:
+    """Test cases for per-task memoization of toolkit calls."""
+
+    @pytest.mark.asyncio
+    async def test_repeated_call_is_served_from_memo(self, task_lock):
+        """Test that agents of a task share results of identical calls and see the hit count."""
+        first, second = ReaderToolkit("memo_task"), ReaderToolkit("memo_task")
+        task_lock.put_queue = AsyncMock()
+
+        assert await first.search_google("eigent") == [{"title": "eigent", "search_type": "web"}]
+        assert await second.search_google(" eigent ", search_type="web") == [{"title": "eigent", "search_type": "web"}]
+        await second.search_google("eigent", "news")
+
+        assert first.calls + second.calls == 2
+        deactivations = [
+            call.args[0].data for call in task_lock.put_queue.call_args_list if call.args[0].action == Action.deactivate_toolkit
+        ]
+        assert [data.get("memo_hits") for data in deactivations] == [None, 1, None]
+
+    def test_file_change_invalidates_entry(self, task_lock, temp_dir):
+        """Test that a call naming a file misses again once the file is modified."""
+        (temp_dir / "notes.txt").write_text("v1")
+        toolkit = ReaderToolkit("memo_task", str(temp_dir))
+
+        assert toolkit.read_file("notes.txt") == "v1"
+        assert toolkit.read_file("notes.txt") == "v1"
+        (temp_dir / "notes.txt").write_text("version 2")
+        assert toolkit.read_file("notes.txt") == "version 2"
+        assert toolkit.calls == 2
+
+    def test_errors_are_not_memoized(self, task_lock, temp_dir):
+        """Test that failures reported in the result are retried on the next call."""
+        toolkit = ReaderToolkit("memo_task", str(temp_dir))
+
+        toolkit.read_file("missing.txt")
+        toolkit.read_file("missing.txt")
+
+        assert toolkit.calls == 2
+
+    def test_entries_are_bounded(self):
+        """Test that entries expire after the ttl and the least recently used are dropped."""
+        memo = ToolMemo(max_entries=2, ttl=60)
+        with patch("app.service.tool_memo.time.monotonic", return_value=0.0):
+            memo.put("a", "A")
+            memo.put("b", "B")
+            memo.get("search_google", "a")
+            memo.put("c", "C")
+
+            assert memo.get("search_google", "b") == (False, None)
+            assert memo.get("search_google", "a") == (True, "A")
+        with patch("app.service.tool_memo.time.monotonic", return_value=61.0):
+            assert memo.get("search_google", "c") == (False, None)
+        assert memo.hits == {"search_google": 2}
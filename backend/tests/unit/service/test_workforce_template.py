@@ -0,0 +1,165 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.model.chat import Chat
+from app.service.workforce_template import WorkforceTemplate, WorkforceTemplateCache
+
+
+@pytest.fixture(autouse=True)
+def workforce_templates_on(monkeypatch):
+    monkeypatch.setenv("workforce_template", "on")
+
+
+def template(options: Chat) -> WorkforceTemplate:
+    mcp_toolkit, gdrive_toolkit = MagicMock(), MagicMock()
+    mcp_toolkit.get_tools.return_value = [MagicMock()]
+    gdrive_toolkit.get_tools.return_value = []
+    mcp_toolkit.disconnect, gdrive_toolkit.disconnect = AsyncMock(), AsyncMock()
+    return WorkforceTemplate(options, mcp_toolkit, gdrive_toolkit, 0.1)
+
+
+def build_templates():
+    return patch.object(WorkforceTemplateCache, "build", AsyncMock(side_effect=template))
+
+
+@pytest.mark.unit
+class TestWorkforceTemplateCache:
+    """Test cases for the prewarmed workforce template cache."""
+
+    @pytest.mark.asyncio
+    async def test_taken_template_is_refilled(self, sample_chat_data):
+        """Test that taking a template starts its replacement, so a concurrent task also hits."""
+        cache = WorkforceTemplateCache()
+        first, second = Chat(**sample_chat_data), Chat(**{**sample_chat_data, "task_id": "next_task"})
+
+        with build_templates() as build:
+            assert await cache.take(first) is None
+            taken = await cache.take(second)
+            assert await cache.take(first) is not None
+            await asyncio.sleep(0)
+
+        assert taken.options.task_id == "next_task"
+        assert taken.gdrive_toolkit.api_task_id == "next_task"
+        assert build.await_count == 3
+        assert cache.stats()["hits"] == 2
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["templates"] == 1
+
+    @pytest.mark.asyncio
+    async def test_prewarmed_template_is_taken(self, sample_chat_data):
+        """Test that the first task after startup gets the template its chat prewarmed."""
+        cache = WorkforceTemplateCache()
+        options = Chat(**sample_chat_data)
+
+        with build_templates() as build:
+            cache.prewarm(options)
+            cache.prewarm(options)
+            assert await cache.take(options) is not None
+
+        assert build.await_count == 1
+        assert cache.stats()["misses"] == 0
+
+    @pytest.mark.asyncio
+    async def test_hanging_build_is_not_waited_for(self, sample_chat_data):
+        """Test that take gives up on a template that takes longer than wait_timeout and keeps it warming."""
+        cache = WorkforceTemplateCache(wait_timeout=0.01)
+        options = Chat(**sample_chat_data)
+        connected = asyncio.Event()
+
+        async def slow_build(options):
+            await connected.wait()
+            return template(options)
+
+        with patch.object(WorkforceTemplateCache, "build", AsyncMock(side_effect=slow_build)) as build:
+            cache.prewarm(options)
+            assert await cache.take(options) is None
+            connected.set()
+            assert await cache.take(options) is not None
+            await asyncio.sleep(0)
+
+        assert build.await_count == 2
+        assert cache.stats()["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_released_template_is_disconnected(self, sample_chat_data):
+        """Test that the template a task used is disconnected when the task ends."""
+        cache = WorkforceTemplateCache()
+        options = Chat(**sample_chat_data)
+
+        with build_templates() as build:
+            cache.prewarm(options)
+            used = await cache.take(options)
+            await cache.release(options, used)
+            await asyncio.sleep(0)
+
+        used.mcp_toolkit.disconnect.assert_awaited_once()
+        used.gdrive_toolkit.disconnect.assert_awaited_once()
+        assert build.await_count == 2
+        assert cache.stats()["templates"] == 1
+
+    @pytest.mark.asyncio
+    async def test_different_settings_do_not_share_templates(self, sample_chat_data):
+        """Test that templates are keyed by model and installed MCP servers."""
+        cache = WorkforceTemplateCache()
+        other_mcp = {**sample_chat_data, "installed_mcp": {"mcpServers": {"notion": {"command": "npx"}}}}
+
+        with build_templates():
+            cache.prewarm(Chat(**sample_chat_data))
+            assert await cache.take(Chat(**other_mcp)) is None
+            assert await cache.take(Chat(**{**sample_chat_data, "model_type": "gpt-4o"})) is None
+
+        assert cache.stats()["templates"] == 3
+
+    @pytest.mark.asyncio
+    async def test_failed_template_falls_back(self, sample_chat_data):
+        """Test that a template that failed to build is not used."""
+        cache = WorkforceTemplateCache()
+
+        with patch.object(WorkforceTemplateCache, "build", AsyncMock(side_effect=Exception("mcp down"))):
+            cache.prewarm(Chat(**sample_chat_data))
+            assert await cache.take(Chat(**sample_chat_data)) is None
+
+        assert cache.stats()["misses"] == 1
+        await cache.close()
+
+    @pytest.mark.asyncio
+    async def test_evicted_templates_are_disconnected(self, sample_chat_data):
+        """Test that only max_keys templates are kept warm and evicted ones close their MCP servers."""
+        cache = WorkforceTemplateCache(max_keys=1)
+        options = Chat(**sample_chat_data)
+
+        with build_templates():
+            cache.prewarm(options)
+            evicted = await cache.templates[cache.key(options)]
+            await cache.release(Chat(**{**sample_chat_data, "model_type": "gpt-4o"}), None)
+            await cache.close()
+
+        assert len(cache.templates) == 0
+        evicted.mcp_toolkit.disconnect.assert_awaited_once()
+        assert await cache.take(options) is None
+
+    @pytest.mark.asyncio
+    async def test_close_disconnects_warm_templates(self, sample_chat_data):
+        """Test that templates nobody took are disconnected on shutdown."""
+        cache = WorkforceTemplateCache()
+        options = Chat(**sample_chat_data)
+
+        with build_templates():
+            cache.prewarm(options)
+            warm = await cache.templates[cache.key(options)]
+            await cache.close()
+
+        warm.mcp_toolkit.disconnect.assert_awaited_once()
+        assert cache.templates == {}
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, sample_chat_data, monkeypatch):
+        """Test that no template is built when templates are turned off."""
+        monkeypatch.setenv("workforce_template", "off")
+        cache = WorkforceTemplateCache()
+
+        await cache.release(Chat(**sample_chat_data), None)
+        assert await cache.take(Chat(**sample_chat_data)) is None
+        assert cache.templates == {}
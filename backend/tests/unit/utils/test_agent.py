@@ -1,4 +1,6 @@
 import asyncio
+import threading
+import time
 from threading import Event
 from typing import List
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -6,12 +8,15 @@ import pytest
 import uuid
 
 from camel.agents import ChatAgent
+from camel.agents.chat_agent import AsyncStreamingChatAgentResponse, StreamContentAccumulator, StreamingChatAgentResponse
 from camel.agents._types import ToolCallRequest
 from camel.messages import BaseMessage
 from camel.models import BaseModelBackend
 from camel.responses import ChatAgentResponse
 from camel.toolkits import FunctionTool
+from camel.types import OpenAIBackendRole
 from camel.types.agents import ToolCallingRecord
+from openai.types.chat import ChatCompletionChunk
 
 from app.utils.agent import (
     ListenChatAgent,
@@ -25,10 +30,12 @@ from app.utils.agent import (
     social_medium_agent,
     mcp_agent,
     get_toolkits,
-    get_mcp_tools
+    get_mcp_tools,
+    operating_environment,
+    DEVELOPER_AGENT_PROMPT,
 )
 from app.model.chat import Chat, McpServers
-from app.service.task import ActionActivateAgentData, ActionDeactivateAgentData
+from app.service.task import Action, ActionActivateAgentData, ActionDeactivateAgentData
 
 
 @pytest.mark.unit
@@ -103,7 +110,7 @@ class TestListenChatAgent:
                 args, kwargs = mock_parent_step.call_args
                 assert args[0] == "Test input message"
                 # Should queue activation notification
-                mock_task_lock.put_queue.assert_called()
+                mock_task_lock.emit.assert_called()
 
     def test_listen_chat_agent_step_with_base_message_input(self, mock_task_lock):
         """Test ListenChatAgent step method with BaseMessage input."""
@@ -149,8 +156,8 @@ class TestListenChatAgent:
                 assert args[0] is mock_message
                 
                 # Should queue activation with message content
-                mock_task_lock.put_queue.assert_called()
-                # Just verify put_queue was called - don't check internal data structure details
+                mock_task_lock.emit.assert_called()
+                # Just verify emit was called - don't check internal data structure details
 
     @pytest.mark.asyncio
     async def test_listen_chat_agent_astep(self, mock_task_lock):
@@ -194,6 +201,174 @@ class TestListenChatAgent:
                 # Verify that task lock put_queue was called
                 mock_task_lock.put_queue.assert_called()
 
+    @pytest.mark.asyncio
+    async def test_listen_chat_agent_astep_streams_deltas(self, mock_task_lock, monkeypatch):
+        """Test that streamed content is forwarded as agent_delta frames and the final response is unchanged."""
+        monkeypatch.setenv("agent_delta_interval", "0")
+
+        def chunk(content: str, tokens: int = 0) -> ChatAgentResponse:
+            return ChatAgentResponse(
+                msgs=[BaseMessage.make_assistant_message(role_name="assistant", content=content)],
+                terminated=False,
+                info={"usage": {"total_tokens": tokens}, "tool_calls": []},
+            )
+
+        async def stream():
+            for response in (chunk("Hel"), chunk("Hello"), chunk("Calling tool...\n"), chunk("Calling tool...\nDone", 42)):
+                yield response
+
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create') as mock_create_model, \
+             patch('asyncio.create_task'):
+            mock_backend = MagicMock()
+            mock_backend.model_type = "gpt-4"
+            mock_create_model.return_value = mock_backend
+            agent = ListenChatAgent(api_task_id="test_api_task_123", agent_name="TestAgent", model="gpt-4")
+            agent.process_task_id = "test_process_task"
+
+            with patch.object(ChatAgent, 'astep', return_value=AsyncStreamingChatAgentResponse(stream())):
+                result = await agent.astep("Test async input")
+
+        assert result.msg.content == "Calling tool...\nDone"
+        assert result.info["usage"]["total_tokens"] == 42
+        deltas = [
+            (call.args[0].data["delta"], call.args[0].data["replace"])
+            for call in mock_task_lock.put_queue.call_args_list
+            if call.args[0].action == Action.agent_delta
+        ]
+        assert deltas == [("Hel", False), ("lo", False), ("Calling tool...\n", True), ("Done", False)]
+
+    @pytest.mark.asyncio
+    async def test_listen_chat_agent_streamed_turn_is_metered_and_runs_tools(self, mock_task_lock, monkeypatch):
+        """Test that a streamed model call is metered and its tool calls start together on the agent's tool path."""
+        monkeypatch.setenv("agent_parallel_tools", "on")
+        barrier = threading.Barrier(2, timeout=2)
+
+        def read_file(file_path: str) -> str:
+            """Read a file."""
+            barrier.wait()
+            return file_path
+
+        def chunk(**fields) -> ChatCompletionChunk:
+            return ChatCompletionChunk.model_validate(
+                {"id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4", "choices": [], **fields}
+            )
+
+        async def stream():
+            for i in range(2):
+                call = {"index": i, "id": f"call_{i}", "type": "function"}
+                call["function"] = {"name": "read_file", "arguments": f'{{"file_path": "{i}.txt"}}'}
+                yield chunk(choices=[{"index": 0, "delta": {"tool_calls": [call]}}])
+            yield chunk(choices=[{"index": 0, "delta": {}, "finish_reason": "tool_calls"}])
+            yield chunk(usage={"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15})
+
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create', return_value=MagicMock(model_type="gpt-4")):
+            agent = ListenChatAgent(
+                api_task_id="test_api_task_123", agent_name="TestAgent", model="gpt-4", tools=[FunctionTool(read_file)]
+            )
+            records = []
+            items = [
+                item
+                async for item in agent._aprocess_stream_chunks_with_accumulator(
+                    stream(), StreamContentAccumulator(), {}, records, agent._create_token_usage_tracker()
+                )
+            ]
+
+        assert items[-1] == (True, True)
+        assert sorted(record.result for record in records) == ["0.txt", "1.txt"]
+        mock_task_lock.metrics.record_model_call.assert_called_once()
+        assert mock_task_lock.metrics.record_model_call.call_args.args[3]["total_tokens"] == 15
+        toolkit_events = [call.args[0].action for call in mock_task_lock.put_queue.call_args_list]
+        assert toolkit_events.count(Action.activate_toolkit) == 2
+
+    def test_listen_chat_agent_step_consumes_stream(self, mock_task_lock, monkeypatch):
+        """Test that a streamed sync step forwards deltas and returns the final response."""
+        monkeypatch.setenv("agent_delta_interval", "0")
+
+        def chunk(content: str, tokens: int = 0) -> ChatAgentResponse:
+            return ChatAgentResponse(
+                msgs=[BaseMessage.make_assistant_message(role_name="assistant", content=content)],
+                terminated=False,
+                info={"usage": {"total_tokens": tokens}, "tool_calls": []},
+            )
+
+        def stream():
+            yield chunk("Hel")
+            yield chunk("Hello", 7)
+
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create', return_value=MagicMock(model_type="gpt-4")):
+            agent = ListenChatAgent(api_task_id="test_api_task_123", agent_name="TestAgent", model="gpt-4")
+            with patch.object(ChatAgent, 'step', return_value=StreamingChatAgentResponse(stream())):
+                result = agent.step("Test input")
+
+        assert isinstance(result, ChatAgentResponse)
+        assert result.msg.content == "Hello"
+        deltas = [call.args[0].data["delta"] for call in mock_task_lock.emit.call_args_list if call.args[0].action == Action.agent_delta]
+        assert deltas == ["Hel", "lo"]
+
+    def test_listen_chat_agent_compacts_old_tool_results(self, mock_task_lock, monkeypatch):
+        """Test that old tool results are compacted once the context is over budget."""
+        monkeypatch.setenv("agent_context_keep", "2")
+        monkeypatch.setenv("agent_context_stub_chars", "10")
+
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create') as mock_create_model:
+            mock_backend = MagicMock()
+            mock_backend.model_type = "gpt-4"
+            mock_create_model.return_value = mock_backend
+            agent = ListenChatAgent(api_task_id="test_api_task_123", agent_name="TestAgent", model="gpt-4")
+            agent._record_tool_calling("search", {"query": "a"}, "first page " * 100, "call_1")
+            agent._record_tool_calling("search", {"query": "b"}, "second page " * 100, "call_2")
+
+            with patch.object(agent, "_context_tokens", side_effect=[5000, 1000]):
+                assert agent.compact_memory(budget=2000) is True
+
+        results = [
+            record.memory_record.message.result
+            for record in agent.memory.retrieve()
+            if record.memory_record.message.result is not None
+        ]
+        assert results[0].startswith("[search result compacted, 1100 chars, beginning with:]\nfirst page")
+        assert results[1] == "second page " * 100
+        mock_task_lock.metrics.record_compaction.assert_called_once_with("TestAgent", "gpt-4", 5000, 1000)
+
+    def test_listen_chat_agent_counts_context_only_near_budget(self, mock_task_lock, monkeypatch):
+        """Test that writes keep a running token estimate and the context is only counted when it may be over budget."""
+        monkeypatch.setenv("agent_context_budget", "1000")
+
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create') as mock_create_model:
+            mock_backend = MagicMock()
+            mock_backend.token_counter.count_tokens_from_messages.return_value = 100
+            mock_create_model.return_value = mock_backend
+            agent = ListenChatAgent(api_task_id="test_api_task_123", agent_name="TestAgent", model="gpt-4")
+            writes = 0
+
+            def context_tokens():
+                return 100 * writes
+
+            with patch.object(agent, "_context_tokens", side_effect=context_tokens) as counted:
+                for writes in range(1, 21):
+                    agent.update_memory(BaseMessage.make_user_message(role_name="user", content="hi"), OpenAIBackendRole.USER)
+
+        # Once on the first write, then when the estimate passes the budget and every tenth of it after that
+        assert counted.call_count == 6
+
+    def test_listen_chat_agent_within_budget_is_not_compacted(self, mock_task_lock):
+        """Test that memory under the budget is left untouched."""
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create') as mock_create_model:
+            mock_create_model.return_value = MagicMock()
+            agent = ListenChatAgent(api_task_id="test_api_task_123", agent_name="TestAgent", model="gpt-4")
+            agent._record_tool_calling("search", {"query": "a"}, "page " * 100, "call_1")
+
+            with patch.object(agent, "_context_tokens", return_value=100):
+                assert agent.compact_memory(budget=2000) is False
+
+        mock_task_lock.metrics.record_compaction.assert_not_called()
+
     def test_listen_chat_agent_execute_tool(self, mock_task_lock):
         """Test ListenChatAgent _execute_tool method."""
         api_task_id = "test_api_task_123"
@@ -239,7 +414,7 @@ class TestListenChatAgent:
                 mock_record_func.assert_called_once()
                 
                 # Should queue toolkit activation and deactivation notifications
-                assert mock_task_lock.put_queue.call_count >= 2
+                assert mock_task_lock.emit.call_count >= 2
 
     @pytest.mark.asyncio
     async def test_listen_chat_agent_aexecute_tool(self, mock_task_lock):
@@ -286,6 +461,138 @@ class TestListenChatAgent:
                 # Should queue toolkit activation and deactivation notifications  
                 assert mock_task_lock.put_queue.call_count >= 2
 
+    @pytest.mark.asyncio
+    async def test_listen_chat_agent_runs_tool_calls_in_parallel(self, mock_task_lock, monkeypatch):
+        """Test that the tool calls of one turn overlap up to the cap and are recorded in request order."""
+        monkeypatch.setenv("agent_parallel_tools", "on")
+        monkeypatch.setenv("agent_tool_concurrency", "2")
+        running, peak = 0, 0
+
+        async def search_google(query: str) -> str:
+            """Search Google."""
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.05 if query == "first" else 0.01)
+            running -= 1
+            return f"results for {query}"
+
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create', return_value=MagicMock(model_type="gpt-4")):
+            agent = ListenChatAgent(
+                api_task_id="test_api_task_123", agent_name="TestAgent", model="gpt-4", tools=[FunctionTool(search_google)]
+            )
+            requests = [
+                ToolCallRequest(tool_name="search_google", args={"query": query}, tool_call_id=f"call_{query}")
+                for query in ("first", "second", "third")
+            ]
+            agent._start_tool_calls(requests)
+            records = [await agent._aexecute_tool(request) for request in requests]
+
+        assert peak == 2
+        assert [record.result for record in records] == ["results for first", "results for second", "results for third"]
+        assert [
+            record.memory_record.message.result
+            for record in agent.memory.retrieve()
+            if getattr(record.memory_record.message, "result", None) is not None
+        ] == [
+            "results for first",
+            "results for second",
+            "results for third",
+        ]
+        actions = [call.args[0].action for call in mock_task_lock.put_queue.call_args_list]
+        assert actions.count(Action.activate_toolkit) == actions.count(Action.deactivate_toolkit) == 3
+
+    @pytest.mark.asyncio
+    async def test_listen_chat_agent_overlaps_blocking_sync_tools(self, mock_task_lock, monkeypatch):
+        """Test that blocking sync tools of one turn run in threads at the same time."""
+        monkeypatch.setenv("agent_parallel_tools", "on")
+        monkeypatch.setenv("agent_tool_concurrency", "3")
+        barrier = threading.Barrier(3, timeout=2)
+
+        def read_file(file_path: str) -> str:
+            """Read a file."""
+            # Only returns once all three calls are running at the same time
+            barrier.wait()
+            time.sleep(0.1)
+            return file_path
+
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create', return_value=MagicMock(model_type="gpt-4")):
+            agent = ListenChatAgent(
+                api_task_id="test_api_task_123", agent_name="TestAgent", model="gpt-4", tools=[FunctionTool(read_file)]
+            )
+            requests = [
+                ToolCallRequest(tool_name="read_file", args={"file_path": f"{i}.txt"}, tool_call_id=f"call_{i}")
+                for i in range(3)
+            ]
+            started = time.perf_counter()
+            agent._start_tool_calls(requests)
+            records = [await agent._aexecute_tool(request) for request in requests]
+
+        assert time.perf_counter() - started < 0.25
+        assert [record.result for record in records] == ["0.txt", "1.txt", "2.txt"]
+
+    @pytest.mark.asyncio
+    async def test_listen_chat_agent_cancels_unawaited_tool_calls(self, mock_task_lock, monkeypatch):
+        """Test that calls started for a turn the step did not finish are cancelled."""
+        monkeypatch.setenv("agent_parallel_tools", "on")
+
+        async def search_google(query: str) -> str:
+            """Search Google."""
+            await asyncio.sleep(10)
+            return query
+
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create', return_value=MagicMock(model_type="gpt-4")):
+            agent = ListenChatAgent(
+                api_task_id="test_api_task_123", agent_name="TestAgent", model="gpt-4", tools=[FunctionTool(search_google)]
+            )
+            agent._start_tool_calls(
+                [ToolCallRequest(tool_name="search_google", args={"query": q}, tool_call_id=q) for q in ("a", "b")]
+            )
+            tasks = list(agent._started_tool_calls.values())
+            await agent._cancel_started_tool_calls()
+
+        assert agent._started_tool_calls == {}
+        assert all(task.cancelled() for task in tasks)
+
+    @pytest.mark.asyncio
+    async def test_listen_chat_agent_serializes_marked_toolkits(self, mock_task_lock, monkeypatch):
+        """Test that calls into a toolkit marked serialize_tool_calls never overlap."""
+        monkeypatch.setenv("agent_parallel_tools", "on")
+        running, peak = 0, 0
+
+        class ShellToolkit:
+            serialize_tool_calls = True
+
+            async def shell_exec(self, command: str) -> str:
+                """Run a shell command."""
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+                return command
+
+        with patch('app.utils.agent.get_task_lock', return_value=mock_task_lock), \
+             patch('camel.models.ModelFactory.create', return_value=MagicMock(model_type="gpt-4")):
+            agent = ListenChatAgent(
+                api_task_id="test_api_task_123",
+                agent_name="TestAgent",
+                model="gpt-4",
+                tools=[FunctionTool(ShellToolkit().shell_exec)],
+            )
+            requests = [
+                ToolCallRequest(tool_name="shell_exec", args={"command": f"echo {i}"}, tool_call_id=f"call_{i}")
+                for i in range(3)
+            ]
+            agent._start_tool_calls(requests)
+            records = [await agent._aexecute_tool(request) for request in requests]
+
+        assert peak == 1
+        assert [record.result for record in records] == ["echo 0", "echo 1", "echo 2"]
+
     def test_listen_chat_agent_clone(self, mock_task_lock):
         """Test ListenChatAgent clone method."""
         api_task_id = "test_api_task_123"
@@ -417,7 +724,7 @@ class TestAgentFactoryFunctions:
         task_locks[options.task_id] = mock_task_lock
 
         with patch('app.utils.agent.ListenChatAgent') as mock_listen_agent, \
-             patch('app.utils.agent.ModelFactory.create') as mock_model_factory, \
+             patch('camel.models.ModelFactory.create') as mock_model_factory, \
              patch('app.utils.agent.HumanToolkit.get_can_use_tools', return_value=[]), \
              patch('asyncio.create_task') as mock_create_task:
 
@@ -520,6 +827,11 @@ class TestAgentFactoryFunctions:
             tools_arg = call_args[0][3]  # tools argument
             assert isinstance(tools_arg, list)
 
+            # Per task values come after the static instructions, so tasks share the prompt prefix
+            system_message = call_args[0][1].content
+            assert system_message == DEVELOPER_AGENT_PROMPT + operating_environment(options.file_save_path())
+            assert options.file_save_path() not in DEVELOPER_AGENT_PROMPT
+
     def test_search_agent_creation(self, sample_chat_data):
         """Test search_agent creates agent with search tools."""
         options = Chat(**sample_chat_data)
@@ -711,7 +1023,7 @@ class TestAgentFactoryFunctions:
         task_locks[options.task_id] = mock_task_lock
         
         with patch('app.utils.agent.ListenChatAgent') as mock_listen_agent, \
-             patch('app.utils.agent.ModelFactory.create') as mock_model_factory, \
+             patch('camel.models.ModelFactory.create') as mock_model_factory, \
              patch('asyncio.create_task'), \
              patch('app.utils.agent.McpSearchToolkit') as mock_mcp_search_toolkit, \
              patch('app.utils.agent.get_mcp_tools') as mock_get_mcp_tools:
@@ -879,7 +1191,7 @@ class TestAgentIntegration:
         task_locks[api_task_id] = mock_task_lock
         
         # Create agent
-        with patch('app.utils.agent.ModelFactory.create') as mock_model_factory, \
+        with patch('camel.models.ModelFactory.create') as mock_model_factory, \
              patch('asyncio.create_task'), \
              patch('app.utils.agent.ListenChatAgent') as mock_listen_agent:
             mock_model = MagicMock()
@@ -0,0 +1,80 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.utils.model_pool import ModelPool
+
+
+def backend():
+    model = MagicMock()
+    model._client = MagicMock()
+    model._async_client = MagicMock()
+    return model
+
+
+@pytest.mark.unit
+class TestModelPool:
+    """Test cases for the shared model backend pool."""
+
+    def test_same_settings_reuse_backend(self):
+        """Test that agents with the same settings share one backend."""
+        pool = ModelPool()
+        with patch("camel.models.ModelFactory.create", side_effect=lambda **kwargs: backend()) as create:
+            first = pool.get("openai", "gpt-4o", api_key="key", url="http://llm", max_retries=3)
+            second = pool.get("openai", "gpt-4o", api_key="key", url="http://llm", max_retries=3)
+
+        assert first is second
+        create.assert_called_once()
+        assert pool.stats()["hits"] == 1
+        assert pool.stats()["misses"] == 1
+        assert pool.stats()["hit_rate"] == 0.5
+
+    def test_different_config_shares_clients(self):
+        """Test that different configs get their own backend over the same HTTP clients."""
+        pool = ModelPool()
+        with patch("camel.models.ModelFactory.create", side_effect=lambda **kwargs: backend()):
+            first = pool.get("openai", "gpt-4o", api_key="key", model_config_dict={"temperature": 0})
+            second = pool.get("openai", "gpt-4o", api_key="key", model_config_dict={"temperature": 1})
+            other_key = pool.get("openai", "gpt-4o", api_key="other", model_config_dict={"temperature": 1})
+
+        assert first is not second
+        assert second._client is first._client
+        assert second._async_client is first._async_client
+        assert other_key._client is not first._client
+        assert pool.stats()["client_hits"] == 1
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the pool evicts the least recently used backend when full."""
+        pool = ModelPool(max_size=2)
+        with patch("camel.models.ModelFactory.create", side_effect=lambda **kwargs: backend()):
+            a = pool.get("openai", "a")
+            pool.get("openai", "b")
+            pool.get("openai", "a")
+            pool.get("openai", "c")
+
+            assert pool.get("openai", "a") is a
+            assert pool.stats()["evictions"] == 1
+            assert len(pool.backends) == 2
+            assert pool.key("openai", "b", None, None, None, {}) not in pool.backends
+
+    def test_api_key_is_not_kept_in_key(self):
+        """Test that pool keys only hold a hash of the api key."""
+        key = ModelPool.key("openai", "gpt-4o", "sk-secret", None, None, {})
+
+        assert "sk-secret" not in repr(key)
+
+    def test_user_view_shares_pooled_backend(self):
+        """Test that each task sends its own user through one pooled backend."""
+        pool = ModelPool()
+        with patch("camel.models.ModelFactory.create", side_effect=lambda **kwargs: backend()) as create:
+            pooled = pool.get("openai", "gpt-4o", api_key="key")
+            pooled.model_config_dict = {"stream": True}
+            first = ModelPool.for_user(pool.get("openai", "gpt-4o", api_key="key"), "task_1")
+            second = ModelPool.for_user(pool.get("openai", "gpt-4o", api_key="key"), "task_2")
+
+        create.assert_called_once()
+        assert first.model_config_dict == {"stream": True, "user": "task_1"}
+        assert second.model_config_dict == {"stream": True, "user": "task_2"}
+        assert pooled.model_config_dict == {"stream": True}
+        assert first.pooled is second.pooled is pooled
+        assert first._async_client is pooled._async_client
@@ -0,0 +1,205 @@
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from camel.models import BaseModelBackend
+
+from app.model.chat import Chat
+from app.utils.agent import agent_model_backend
+from app.utils.model_router import RoutedModelBackend, endpoint_stats, model_router_stats
+
+
+class FakeBackend(BaseModelBackend):
+    def __init__(self, name: str, seconds: float = 0.0, fail: bool = False):
+        super().__init__("gpt-4o", {}, url=f"https://{name}.example.com")
+        self.name = name
+        self.seconds = seconds
+        self.fail = fail
+        self.cancelled = False
+
+    @property
+    def token_counter(self):
+        return MagicMock()
+
+    def _run(self, messages, response_format=None, tools=None):
+        if self.fail:
+            raise ConnectionError(self.name)
+        return self.name
+
+    async def _arun(self, messages, response_format=None, tools=None):
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise ConnectionError(self.name)
+        return self.name
+
+
+class GatedBackend(FakeBackend):
+    def __init__(self, name: str, gate: asyncio.Event, fail: bool = False):
+        super().__init__(name, fail=fail)
+        self.gate = gate
+        self.calls = 0
+
+    async def _arun(self, messages, response_format=None, tools=None):
+        self.calls += 1
+        await self.gate.wait()
+        if self.fail:
+            raise ConnectionError(self.name)
+        return self.name
+
+
+def measured(backend: FakeBackend, *latencies: float) -> FakeBackend:
+    for seconds in latencies:
+        endpoint_stats(backend).record(seconds)
+    return backend
+
+
+@pytest.mark.unit
+class TestRoutedModelBackend:
+    """Test cases for latency aware routing across model endpoints."""
+
+    @pytest.mark.asyncio
+    async def test_routes_to_fastest_endpoint(self):
+        """Test that requests go to the endpoint with the lowest rolling p50."""
+        slow = measured(FakeBackend("slow"), 2.0, 2.5, 3.0)
+        fast = measured(FakeBackend("fast"), 0.2, 0.3, 0.4)
+        router = RoutedModelBackend([slow, fast])
+
+        assert router.ranked() == [fast, slow]
+        assert await router._arun([]) == "fast"
+        assert router.model_type == slow.model_type
+
+    def test_unmeasured_and_healthy_endpoints_come_first(self):
+        """Test that new endpoints are tried before measured ones and failing ones go last."""
+        failing = measured(FakeBackend("failing"), None, None, 0.1)
+        measured_ok = measured(FakeBackend("measured"), 0.5, 0.5, 0.5)
+        new = FakeBackend("new")
+        router = RoutedModelBackend([failing, measured_ok, new])
+
+        assert router.ranked() == [new, measured_ok, failing]
+
+    @pytest.mark.asyncio
+    async def test_fails_over_to_next_endpoint(self):
+        """Test that a failed call is sent to the next endpoint and the failing one is ranked last."""
+        down = FakeBackend("down", fail=True)
+        up = measured(FakeBackend("up"), 0.1, 0.1, 0.1)
+        router = RoutedModelBackend([down, up])
+
+        assert await router._arun([]) == "up"
+        assert endpoint_stats(down).errors == 1
+        assert router.ranked() == [up, down]
+        assert router._run([]) == "up"
+
+    @pytest.mark.asyncio
+    async def test_hedged_request_wins_and_cancels_slow_primary(self, monkeypatch):
+        """Test that a call slower than the primary's p95 is duplicated and the loser cancelled."""
+        monkeypatch.setenv("model_hedge", "on")
+        monkeypatch.setenv("model_hedge_min_delay", "0.01")
+        primary = measured(FakeBackend("primary", seconds=5.0), 0.01, 0.02, 0.02)
+        backup = measured(FakeBackend("backup", seconds=0.01), 0.5, 0.5, 0.5)
+        router = RoutedModelBackend([primary, backup])
+
+        started = time.perf_counter()
+        assert await router._arun([]) == "backup"
+        await asyncio.sleep(0)
+
+        assert time.perf_counter() - started < 1
+        assert primary.cancelled
+        assert endpoint_stats(primary).summary()["hedges"] == 1
+        assert endpoint_stats(primary).summary()["hedge_wins"] == 1
+
+    @pytest.mark.asyncio
+    async def test_hedge_loser_latency_is_recorded(self, monkeypatch):
+        """Test that a cancelled loser gets its elapsed time as a sample, so it drops in the ranking."""
+        monkeypatch.setenv("model_hedge", "on")
+        monkeypatch.setenv("model_hedge_min_delay", "0.05")
+        primary = measured(FakeBackend("primary", seconds=5.0), 0.01, 0.01, 0.01)
+        backup = measured(FakeBackend("backup", seconds=0.01), 0.02, 0.02, 0.02)
+        router = RoutedModelBackend([primary, backup])
+
+        assert await router._arun([]) == "backup"
+        await asyncio.sleep(0)
+
+        assert primary.cancelled
+        assert endpoint_stats(primary).calls == 4
+        assert endpoint_stats(primary).errors == 0
+        assert max(endpoint_stats(primary).latencies) >= 0.05
+
+    @pytest.mark.asyncio
+    async def test_stopped_request_records_no_latency(self):
+        """Test that a call cancelled because the whole request stopped is not taken as a sample."""
+        slow = FakeBackend("slow", seconds=5.0)
+        router = RoutedModelBackend([slow])
+
+        call = asyncio.create_task(router._arun([]))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+        assert slow.cancelled
+        assert endpoint_stats(slow).calls == 0
+
+    @pytest.mark.asyncio
+    async def test_answer_wins_over_failure_finishing_with_it(self, monkeypatch):
+        """Test that no further endpoint is called when a failed and an answered call finish together."""
+        monkeypatch.setenv("model_hedge", "on")
+        monkeypatch.setenv("model_hedge_min_delay", "0.01")
+        gate = asyncio.Event()
+        primary = measured(GatedBackend("primary", gate, fail=True), 0.01, 0.01, 0.01)
+        backup = measured(GatedBackend("backup", gate), 0.2, 0.2, 0.2)
+        spare = measured(GatedBackend("spare", gate), 0.5, 0.5, 0.5)
+        router = RoutedModelBackend([primary, backup, spare])
+
+        call = asyncio.create_task(router._arun([]))
+        while not backup.calls:
+            await asyncio.sleep(0.005)
+        gate.set()
+
+        assert await call == "backup"
+        assert spare.calls == 0
+        assert endpoint_stats(primary).summary()["hedge_wins"] == 1
+
+    def test_stats_tell_apart_endpoints_sharing_a_url(self):
+        """Test that endpoints differing only in API key get their own stats entry."""
+        first, second = FakeBackend("shared"), FakeBackend("shared")
+        second._api_key = "other_key"
+        endpoint_stats(first).record(0.1)
+        endpoint_stats(second).record(0.2)
+
+        names = [name for name in model_router_stats() if name.startswith("gpt-4o@https://shared.example.com")]
+
+        assert len(names) == 2
+
+    def test_agent_model_backend_routes_extra_models(self, sample_chat_data):
+        """Test that a chat with extra_models gets a router over the pooled backends of all endpoints."""
+        options = Chat(
+            **sample_chat_data,
+            extra_models=[{"model_platform": "openai", "model_type": "gpt-4", "api_key": "second_key", "api_url": "https://proxy.example.com/v1"}],
+        )
+        backends = {"test_key": FakeBackend("openai"), "second_key": FakeBackend("proxy")}
+
+        with patch("app.utils.agent.model_pool.get", side_effect=lambda **kwargs: backends[kwargs["api_key"]]):
+            router = agent_model_backend(options)
+            single = agent_model_backend(Chat(**sample_chat_data))
+
+        assert isinstance(router, RoutedModelBackend)
+        assert router.endpoints == [backends["test_key"], backends["second_key"]]
+        assert single is backends["test_key"]
+
+    def test_cloud_user_is_sent_per_task_over_pooled_backends(self, sample_chat_data):
+        """Test that cloud tasks share the pooled backend and its stats, with their task id as user."""
+        options = Chat(**{**sample_chat_data, "api_url": "http://44.247.171.124/v1"})
+        pooled = FakeBackend("cloud")
+
+        with patch("app.utils.agent.model_pool.get", return_value=pooled) as get:
+            backend = agent_model_backend(options)
+
+        assert "user" not in (get.call_args.kwargs["model_config_dict"] or {})
+        assert backend.model_config_dict["user"] == str(options.task_id)
+        assert "user" not in pooled.model_config_dict
+        assert endpoint_stats(backend) is endpoint_stats(pooled)
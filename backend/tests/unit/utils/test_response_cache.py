@@ -0,0 +1,151 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from camel.agents import ChatAgent
+from camel.messages import BaseMessage
+from camel.responses import ChatAgentResponse
+
+from app.utils import response_cache
+from app.utils.agent import ListenChatAgent
+from app.utils.response_cache import ResponseCache
+
+
+def response(content: str, tokens: int = 120, tool_calls: list | None = None) -> ChatAgentResponse:
+    return ChatAgentResponse(
+        msgs=[BaseMessage.make_assistant_message(role_name="assistant", content=content)],
+        terminated=False,
+        info={"usage": {"total_tokens": tokens}, "tool_calls": tool_calls or []},
+    )
+
+
+@pytest.mark.unit
+class TestResponseCache:
+    """Test cases for the on-disk model response cache."""
+
+    def test_hit_after_put(self, temp_dir):
+        """Test that a stored response is returned and counted as saved tokens."""
+        cache = ResponseCache(temp_dir / "responses.db", max_bytes=1024, ttl=60)
+        key = cache.key({"model_type": "gpt-4o"}, [("user", "hello")], [])
+
+        assert cache.get("task_agent", key) is None
+        cache.put("task_agent", key, "hi", 42)
+
+        assert cache.get("task_agent", key) == "hi"
+        stats = cache.cache_stats()
+        assert stats["entries"] == 1
+        assert stats["roles"]["task_agent"] == {"hits": 1, "misses": 1, "saved_tokens": 42, "hit_rate": 0.5}
+
+    def test_key_depends_on_history(self):
+        """Test that the same input after a different conversation is a different entry."""
+        first = ResponseCache.key({"model_type": "gpt-4o"}, [("user", "a"), ("user", "hello")], [])
+        second = ResponseCache.key({"model_type": "gpt-4o"}, [("user", "b"), ("user", "hello")], [])
+        other_model = ResponseCache.key({"model_type": "gpt-4.1"}, [("user", "a"), ("user", "hello")], [])
+
+        assert len({first, second, other_model}) == 3
+
+    def test_expired_entry_is_a_miss(self, temp_dir):
+        """Test that entries older than the ttl are not returned."""
+        cache = ResponseCache(temp_dir / "responses.db", max_bytes=1024, ttl=60)
+        with patch("app.utils.response_cache.time.time", return_value=1000.0):
+            cache.put("task_agent", "key", "old", 10)
+        with patch("app.utils.response_cache.time.time", return_value=1061.0):
+            assert cache.get("task_agent", "key") is None
+        assert cache.cache_stats()["entries"] == 0
+
+    def test_least_recently_used_is_evicted(self, temp_dir):
+        """Test that the store stays within max_bytes by dropping the least recently used entries."""
+        cache = ResponseCache(temp_dir / "responses.db", max_bytes=10, ttl=float("inf"))
+        with patch("app.utils.response_cache.time.time", side_effect=[1.0, 2.0, 3.0, 4.0]):
+            cache.put("task_agent", "first", "aaaa", 1)
+            cache.put("task_agent", "second", "bbbb", 1)
+            cache.get("task_agent", "first")
+            cache.put("task_agent", "third", "cccc", 1)
+
+        assert cache.get("task_agent", "first") == "aaaa"
+        assert cache.get("task_agent", "second") is None
+        assert cache.get("task_agent", "third") == "cccc"
+
+
+@pytest.mark.unit
+class TestListenChatAgentResponseCache:
+    """Test cases for caching ListenChatAgent steps."""
+
+    @pytest.fixture
+    def cache(self, temp_dir, monkeypatch):
+        cache = ResponseCache(temp_dir / "responses.db", max_bytes=1024 * 1024, ttl=60)
+        monkeypatch.setattr(response_cache, "_cache", cache)
+        monkeypatch.setenv("llm_cache_agents", "task_summary_agent")
+        return cache
+
+    def agent(self, agent_name: str, task_id: str = "task_1", system_message: str = "Summarize") -> ListenChatAgent:
+        backend = MagicMock()
+        backend.model_type = "gpt-4o"
+        backend.model_config_dict = {"temperature": 0, "user": task_id}
+        with patch("camel.models.ModelFactory.create", return_value=backend):
+            return ListenChatAgent(
+                api_task_id=task_id, agent_name=agent_name, system_message=system_message, model="gpt-4o"
+            )
+
+    def test_second_step_is_served_from_cache(self, cache, mock_task_lock):
+        """Test that an identical prompt to a fresh agent of an opted-in role skips the model."""
+        with patch("app.utils.agent.get_task_lock", return_value=mock_task_lock), \
+             patch.object(ChatAgent, "step", return_value=response("Summary")) as model_step:
+            first = self.agent("task_summary_agent").step("Summarize this task")
+            agent = self.agent("task_summary_agent")
+            second = agent.step("Summarize this task")
+
+        model_step.assert_called_once()
+        assert first.msg.content == second.msg.content == "Summary"
+        assert second.info["cached"] is True
+        assert second.info["usage"]["total_tokens"] == 0
+        assert [record.memory_record.message.content for record in agent.memory.retrieve()][-2:] == [
+            "Summarize this task",
+            "Summary",
+        ]
+        assert cache.cache_stats()["roles"]["task_summary_agent"]["saved_tokens"] == 120
+
+    def test_roles_not_opted_in_are_not_cached(self, cache, mock_task_lock):
+        """Test that agents outside llm_cache_agents always call the model."""
+        with patch("app.utils.agent.get_task_lock", return_value=mock_task_lock), \
+             patch.object(ChatAgent, "step", return_value=response("Answer")) as model_step:
+            self.agent("developer_agent").step("Write code")
+            self.agent("developer_agent").step("Write code")
+
+        assert model_step.call_count == 2
+        assert cache.cache_stats()["entries"] == 0
+
+    def test_tool_call_responses_are_not_cached(self, cache, mock_task_lock):
+        """Test that responses that ran tools are never replayed."""
+        with patch("app.utils.agent.get_task_lock", return_value=mock_task_lock), \
+             patch.object(ChatAgent, "step", return_value=response("Done", tool_calls=[MagicMock()])) as model_step:
+            self.agent("task_summary_agent").step("Summarize this task")
+            self.agent("task_summary_agent").step("Summarize this task")
+
+        assert model_step.call_count == 2
+
+    def test_same_question_in_another_task_is_a_hit(self, cache, mock_task_lock):
+        """Test that task ids in the prompts and the response do not keep other tasks from hitting."""
+
+        def step(task_id: str) -> ChatAgentResponse:
+            agent = self.agent("task_summary_agent", task_id, f"Working Directory: `/home/eigent/task_{task_id}`")
+            return agent.step(f"Task {task_id}: write a poem")
+
+        with patch("app.utils.agent.get_task_lock", return_value=mock_task_lock), \
+             patch.object(ChatAgent, "step", return_value=response("Poem|Saved in /home/eigent/task_1a2b")) as model_step:
+            step("1a2b")
+            second = step("3c4d")
+
+        model_step.assert_called_once()
+        assert second.info["cached"] is True
+        assert second.msg.content == "Poem|Saved in /home/eigent/task_3c4d"
+
+    @pytest.mark.asyncio
+    async def test_async_step_is_served_from_cache(self, cache, mock_task_lock):
+        """Test that astep reads and writes the cache too."""
+        with patch("app.utils.agent.get_task_lock", return_value=mock_task_lock), \
+             patch.object(ChatAgent, "astep", return_value=response("Summary")) as model_step:
+            await self.agent("task_summary_agent").astep("Summarize this task")
+            second = await self.agent("task_summary_agent").astep("Summarize this task")
+
+        model_step.assert_called_once()
+        assert second.info["cached"] is True
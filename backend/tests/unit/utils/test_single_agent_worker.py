@@ -1,3 +1,4 @@
+import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
 
@@ -6,7 +7,7 @@ from camel.societies.workforce.utils import TaskResult
 from camel.tasks import Task
 from camel.tasks.task import TaskState
 
-from app.utils.single_agent_worker import SingleAgentWorker
+from app.utils.single_agent_worker import AdaptivePool, SingleAgentWorker
 from app.utils.agent import ListenChatAgent
 
 
@@ -411,6 +412,74 @@ class TestSingleAgentWorker:
         assert isinstance(worker, BaseSingleAgentWorker)
 
 
+@pytest.mark.unit
+class TestAdaptivePool:
+    """Test cases for the worker agent pool that clones spares ahead of demand."""
+
+    def base_agent(self, mock_task_lock):
+        base = MagicMock(spec=ListenChatAgent)
+        base.api_task_id = "test_task_123"
+        base.agent_name = "search_agent"
+        base.clone.side_effect = lambda with_memory=False: MagicMock(spec=ListenChatAgent)
+        return base
+
+    @pytest.mark.asyncio
+    async def test_reserve_clones_spares_for_pending_subtasks(self, mock_task_lock):
+        """Test that reserved borrows find spares cloned in the background."""
+        with patch("app.utils.single_agent_worker.get_task_lock", return_value=mock_task_lock):
+            pool = AdaptivePool(self.base_agent(mock_task_lock), initial_size=1, max_size=5)
+            pool.reserve(3)
+            await asyncio.gather(*pool._building)
+
+            assert len(pool._available_agents) == 3
+            agents = [await pool.get_agent() for _ in range(3)]
+
+        assert len({id(agent) for agent in agents}) == 3
+        assert pool.get_stats()["pool_hits"] == 3
+        assert pool.pending == 0
+        assert [call.args[1] for call in mock_task_lock.metrics.record_pool_borrow.call_args_list] == [True] * 3
+        spare_clones = [call for call in mock_task_lock.metrics.record_pool_clone.call_args_list if call.args[2]]
+        assert len(spare_clones) == 3  # the initial agent plus two reserved spares
+
+    @pytest.mark.asyncio
+    async def test_empty_pool_clones_on_borrow(self, mock_task_lock):
+        """Test that a borrow from an empty pool clones off the event loop and counts as a miss."""
+        with patch("app.utils.single_agent_worker.get_task_lock", return_value=mock_task_lock):
+            pool = AdaptivePool(self.base_agent(mock_task_lock), initial_size=0, max_size=5)
+            agent = await pool.get_agent()
+
+        assert agent is not None
+        mock_task_lock.metrics.record_pool_borrow.assert_called_once_with("search_agent", False)
+        assert mock_task_lock.metrics.record_pool_clone.call_args.args[2] is False
+
+    @pytest.mark.asyncio
+    async def test_borrow_waits_for_spare_being_cloned(self, mock_task_lock):
+        """Test that a borrow arriving while its spare is still cloning takes that spare instead of cloning again."""
+        with patch("app.utils.single_agent_worker.get_task_lock", return_value=mock_task_lock):
+            base = self.base_agent(mock_task_lock)
+            pool = AdaptivePool(base, initial_size=0, max_size=5)
+            pool.reserve(1)
+            assert len(pool._building) == 1
+            agent = await pool.get_agent()
+
+        assert agent is not None
+        assert base.clone.call_count == 1
+        mock_task_lock.metrics.record_pool_borrow.assert_called_once_with("search_agent", True)
+
+    @pytest.mark.asyncio
+    async def test_idle_spares_shrink(self, mock_task_lock):
+        """Test that spares idle past the timeout are dropped and stale reservations cleared."""
+        with patch("app.utils.single_agent_worker.get_task_lock", return_value=mock_task_lock):
+            pool = AdaptivePool(self.base_agent(mock_task_lock), initial_size=2, max_size=5, idle_timeout=0.01)
+            pool.pending = 4
+            await asyncio.sleep(0.02)
+            await pool.cleanup_idle_agents()
+
+        assert len(pool._available_agents) == 0
+        assert pool.pending == 0
+        mock_task_lock.metrics.record_pool_shrink.assert_called_once_with("search_agent", 2)
+
+
 @pytest.mark.integration
 class TestSingleAgentWorkerIntegration:
     """Integration tests for SingleAgentWorker."""
@@ -0,0 +1,208 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.model.chat import SseMessage, sse_json
+from app.utils.server.sync_step import StepUploader, step_payloads
+
+
+def transport(responses: list[httpx.Request], status_code=200, batch_status_code=None):
+    def handler(request: httpx.Request):
+        responses.append(request)
+        if batch_status_code is not None and request.url.path.endswith("/batch"):
+            return httpx.Response(batch_status_code)
+        return httpx.Response(status_code, json={"code": 200})
+
+    return httpx.MockTransport(handler)
+
+
+async def make_uploader(tmp_path, requests: list[httpx.Request], **kwargs) -> StepUploader:
+    uploader = StepUploader("http://server", tmp_path / "spool.jsonl", batch_size=2, flush_interval=60)
+    uploader.client = httpx.AsyncClient(transport=transport(requests, **kwargs))
+    return uploader
+
+
+@pytest.mark.unit
+class TestStepPayloads:
+    """Test cases for extracting step payloads from SSE writes."""
+
+    def test_sse_json_keeps_payload(self):
+        """Test that sse_json carries the JSON payload of its frame."""
+        message = sse_json("notice", {"message": "hi"})
+
+        assert message == 'data: {"step": "notice", "data": {"message": "hi"}}\n\n'
+        assert step_payloads(message) == ['{"step": "notice", "data": {"message": "hi"}}']
+
+    def test_concatenated_messages_keep_all_payloads(self):
+        """Test that a write of several frames keeps every payload."""
+        message = sse_json("activate_toolkit", 1) + sse_json("deactivate_toolkit", 2)
+
+        assert isinstance(message, SseMessage)
+        assert [json.loads(payload)["step"] for payload in step_payloads(message)] == [
+            "activate_toolkit",
+            "deactivate_toolkit",
+        ]
+
+    def test_plain_string_is_parsed(self):
+        """Test that writes not built by sse_json are still split into frames."""
+        value = 'data: {"step": "a", "data": 1}\n\ndata: {"step": "b", "data": 2}\n\n'
+
+        assert step_payloads(value) == ['{"step": "a", "data": 1}', '{"step": "b", "data": 2}']
+
+
+@pytest.mark.unit
+class TestStepUploader:
+    """Test cases for the batched, spooled step uploader."""
+
+    @pytest.mark.asyncio
+    async def test_flush_sends_batches(self, tmp_path):
+        """Test that pending steps are sent in batches to the bulk endpoint, grouped by task."""
+        requests = []
+        uploader = await make_uploader(tmp_path, requests)
+        uploader.add("task_1", json.dumps({"step": "notice", "data": 0}))
+        uploader.add("task_2", json.dumps({"step": "notice", "data": 1}))
+        uploader.add("task_1", json.dumps({"step": "notice", "data": 2}))
+
+        assert await uploader.flush()
+
+        assert [request.url.path for request in requests] == ["/chat/steps/batch", "/chat/steps/batch"]
+        assert json.loads(requests[0].content) == {
+            "tasks": [
+                {"task_id": "task_1", "steps": [{"step": "notice", "data": 0}]},
+                {"task_id": "task_2", "steps": [{"step": "notice", "data": 1}]},
+            ]
+        }
+        assert uploader.pending == []
+        assert (tmp_path / "spool.jsonl").read_text() == ""
+        await uploader.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_steps_survive_restart(self, tmp_path):
+        """Test that steps the server did not take stay in the spool and are recovered."""
+        requests = []
+        uploader = await make_uploader(tmp_path, requests, status_code=500)
+        uploader.add("task_1", json.dumps({"step": "notice", "data": 1}))
+
+        assert not await uploader.flush()
+        uploader._closed = True
+        uploader._task.cancel()
+        uploader._spool.close()
+
+        recovered = StepUploader("http://server", tmp_path / "spool.jsonl", flush_interval=60)
+        assert recovered.pending == [("task_1", '{"step": "notice", "data": 1}')]
+        recovered.client = httpx.AsyncClient(transport=transport(requests))
+        await recovered.close()
+        assert recovered.pending == []
+
+    @pytest.mark.asyncio
+    async def test_accepted_steps_are_not_resent_after_restart(self, tmp_path):
+        """Test that a restart skips the accepted steps still at the head of the spool."""
+        requests = []
+        uploader = await make_uploader(tmp_path, requests)
+        uploader._task.cancel()
+        uploader.batch_size = 1
+        for i in range(4):
+            uploader.add("task_1", json.dumps({"step": "notice", "data": i}))
+
+        async def send(batch):
+            if batch[0][1].endswith("1}"):
+                raise httpx.ConnectError("down")
+            return len(batch)
+
+        uploader._send = send
+        assert not await uploader.flush()
+        uploader._spool.close()
+
+        recovered = StepUploader("http://server", tmp_path / "spool.jsonl", flush_interval=60)
+        assert [payload for _, payload in recovered.pending] == [
+            json.dumps({"step": "notice", "data": i}) for i in range(1, 4)
+        ]
+        recovered.client = httpx.AsyncClient(transport=transport(requests))
+        await recovered.close()
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_single_steps(self, tmp_path):
+        """Test that steps are posted one by one when the server has no batch endpoint."""
+        requests = []
+        uploader = await make_uploader(tmp_path, requests, batch_status_code=404)
+        uploader.add("task_1", json.dumps({"step": "a", "data": 1}))
+        uploader.add("task_1", json.dumps({"step": "b", "data": 2}))
+
+        assert await uploader.flush()
+
+        assert [request.url.path for request in requests] == ["/chat/steps/batch", "/chat/steps", "/chat/steps"]
+        assert json.loads(requests[1].content) == {"task_id": "task_1", "step": "a", "data": 1}
+        assert not uploader.batch_supported
+        await uploader.close()
+
+    @pytest.mark.asyncio
+    async def test_rejected_steps_are_dropped(self, tmp_path):
+        """Test that a step the server refuses is dropped instead of blocking the ones after it."""
+        requests = []
+
+        def handler(request: httpx.Request):
+            requests.append(request)
+            steps = [step for task in json.loads(request.content)["tasks"] for step in task["steps"]]
+            if any("step" not in step for step in steps):
+                return httpx.Response(422)
+            return httpx.Response(200, json={"code": 200})
+
+        uploader = await make_uploader(tmp_path, requests)
+        uploader.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        uploader.add("task_1", "{}")
+        uploader.add("task_1", json.dumps({"step": "a", "data": 1}))
+        uploader.add("task_1", json.dumps({"step": "b", "data": 2}))
+
+        assert await uploader.flush()
+
+        assert uploader.pending == []
+        assert uploader.rejected == 1
+        assert uploader.sent == 2
+        await uploader.close()
+
+    @pytest.mark.asyncio
+    async def test_spool_errors_do_not_stop_the_loop(self, tmp_path):
+        """Test that a failing spool write is logged and the upload loop keeps running."""
+        requests = []
+        uploader = await make_uploader(tmp_path, requests)
+        uploader.flush_interval = 0.01
+
+        def write_spool(lines):
+            raise OSError("disk full")
+
+        uploader._write_spool = write_spool
+        uploader.add("task_1", json.dumps({"step": "a", "data": 1}))
+        await asyncio.sleep(0.05)
+
+        assert not uploader._task.done()
+        await uploader.close()
+
+    @pytest.mark.asyncio
+    async def test_spool_is_appended_and_compacted(self, tmp_path):
+        """Test that accepted steps stay in the spool until they outnumber the unsent ones."""
+        requests = []
+        uploader = await make_uploader(tmp_path, requests)
+        uploader._task.cancel()
+        uploader.batch_size = 1
+        for i in range(4):
+            uploader.add("task_1", json.dumps({"step": "notice", "data": i}))
+        sent = []
+
+        async def send(batch):
+            if len(sent) == 1:
+                sent.append(None)
+                raise httpx.ConnectError("down")
+            sent.extend(batch)
+            return len(batch)
+
+        uploader._send = send
+        spool = tmp_path / "spool.jsonl"
+        assert not await uploader.flush()
+        # One accepted step is not worth rewriting three unsent ones, a marker records it instead
+        assert spool.read_text().splitlines()[4:] == ["#accepted 1"]
+        assert await uploader.flush()
+        assert uploader.pending == []
+        assert spool.read_text() == ""
+        await uploader.close()
@@ -0,0 +1,79 @@
+import pytest
+from camel.toolkits import FunctionTool
+
+from app.utils import tool_schema_cache
+
+
+class Toolkit:
+    def search(self, query: str, limit: int = 10) -> str:
+        r"""Search the web.
+
+        Args:
+            query (str): What to search for.
+            limit (int): How many results to return.
+        """
+        return query
+
+
+class OtherToolkit:
+    def search(self, query: str) -> str:
+        r"""Search the web.
+
+        Args:
+            query (str): What to search for.
+        """
+        return query
+
+
+@pytest.fixture
+def schema_cache():
+    tool_schema_cache.clear()
+    tool_schema_cache.install()
+    yield tool_schema_cache
+    tool_schema_cache.uninstall()
+    tool_schema_cache.clear()
+
+
+@pytest.mark.unit
+class TestToolSchemaCache:
+    """Test cases for the process wide tool schema cache."""
+
+    def test_instances_share_schema(self, schema_cache):
+        """Test that bound methods of different instances reuse one generated schema."""
+        first = FunctionTool(Toolkit().search)
+        second = FunctionTool(Toolkit().search)
+
+        assert first.get_openai_tool_schema() == second.get_openai_tool_schema()
+        assert first.get_openai_tool_schema() is not second.get_openai_tool_schema()
+        assert schema_cache.cache_stats() == {"size": 1, "hits": 1, "misses": 1}
+
+    def test_cached_schema_is_not_shared_mutably(self, schema_cache):
+        """Test that editing one tool's schema does not leak into the cache."""
+        first = FunctionTool(Toolkit().search)
+        first.get_openai_tool_schema()["function"]["description"] = "changed"
+
+        assert FunctionTool(Toolkit().search).get_openai_tool_schema()["function"]["description"] != "changed"
+
+    def test_signature_is_part_of_key(self, schema_cache):
+        """Test that functions with the same name but another signature get their own schema."""
+        schema = FunctionTool(Toolkit().search).get_openai_tool_schema()
+        other = FunctionTool(OtherToolkit().search).get_openai_tool_schema()
+
+        assert "limit" in schema["function"]["parameters"]["properties"]
+        assert "limit" not in other["function"]["parameters"]["properties"]
+        assert schema_cache.cache_stats()["size"] == 2
+
+    def test_explicit_schema_bypasses_cache(self, schema_cache):
+        """Test that tools built with an explicit schema do not touch the cache."""
+        schema = FunctionTool(Toolkit().search).get_openai_tool_schema()
+        FunctionTool(OtherToolkit().search, openai_tool_schema=schema)
+
+        assert schema_cache.cache_stats()["misses"] == 1
+        assert schema_cache.cache_stats()["hits"] == 0
+
+    def test_uninstall_restores_generation(self, schema_cache):
+        """Test that uninstalling goes back to generating every schema."""
+        schema_cache.uninstall()
+        FunctionTool(Toolkit().search)
+
+        assert schema_cache.cache_stats()["size"] == 0
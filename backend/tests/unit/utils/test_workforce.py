@@ -9,7 +9,7 @@ from camel.agents import ChatAgent
 
 from app.utils.workforce import Workforce
 from app.utils.agent import ListenChatAgent
-from app.service.task import ActionAssignTaskData, ActionTaskStateData, ActionEndData
+from app.service.task import ActionAssignTaskData, ActionTaskStateData, ActionEndData, TaskIndex
 from app.exception.exception import UserException
 
 
@@ -180,8 +180,9 @@ class TestWorkforce:
         ]
         mock_assign_result = TaskAssignResult(assignments=assignments)
         
+        mock_task_lock.task_index = TaskIndex()
+
         with patch('app.utils.workforce.get_task_lock', return_value=mock_task_lock), \
-             patch('app.utils.workforce.get_camel_task', side_effect=lambda task_id, task_list: next((t for t in task_list if t.id == task_id), None)), \
              patch.object(workforce.__class__.__bases__[0], '_find_assignee', return_value=mock_assign_result):
             
             result = await workforce._find_assignee(tasks)
@@ -189,6 +190,8 @@ class TestWorkforce:
             assert result is mock_assign_result
             # Should have queued assignment notifications for subtasks (not main task)
             assert mock_task_lock.put_queue.call_count >= 1
+            # Tasks missing from the index are added on first assignment
+            assert mock_task_lock.task_index.get("sub_1") is subtask1
 
     @pytest.mark.asyncio
     async def test_post_task_notification(self, mock_task_lock):
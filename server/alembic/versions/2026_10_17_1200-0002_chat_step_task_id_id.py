@@ -0,0 +1,27 @@
+"""chat_step (task_id, id) index for keyset playback
+
+Revision ID: 0002_chat_step_task_id_id
+Revises: 0001_init
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_chat_step_task_id_id"
+down_revision: Union[str, None] = "0001_init"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_chat_step_task_id_id", "chat_step", ["task_id", "id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_chat_step_task_id_id", table_name="chat_step")
@@ -0,0 +1,48 @@
+"""chat_step_archive
+
+Revision ID: 0003_chat_step_archive
+Revises: 0002_chat_step_task_id_id
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_chat_step_archive"
+down_revision: Union[str, None] = "0002_chat_step_task_id_id"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "chat_step_archive",
+        sa.Column("deleted_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=True),
+        sa.Column("updated_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=True),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("task_id", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("step_count", sa.Integer(), nullable=False),
+        sa.Column("first_step_id", sa.Integer(), server_default="0", nullable=True),
+        sa.Column("last_step_id", sa.Integer(), nullable=False),
+        sa.Column("raw_bytes", sa.Integer(), server_default="0", nullable=True),
+        sa.Column("compressed_bytes", sa.Integer(), server_default="0", nullable=True),
+        sa.Column("chunks", sa.JSON(), nullable=True),
+        sa.Column("blob", sa.LargeBinary(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_chat_step_archive_task_id"), "chat_step_archive", ["task_id"], unique=True)
+    op.create_index(op.f("ix_chat_step_archive_first_step_id"), "chat_step_archive", ["first_step_id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_chat_step_archive_first_step_id"), table_name="chat_step_archive")
+    op.drop_index(op.f("ix_chat_step_archive_task_id"), table_name="chat_step_archive")
+    op.drop_table("chat_step_archive")
@@ -0,0 +1,116 @@
+import asyncio
+from typing import Callable, Generic, TypeVar
+from loguru import logger
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlmodel import Session
+from app.component.database import session_make
+
+T = TypeVar("T")
+
+
+def is_transient(e: Exception) -> bool:
+    """Whether a write failed because the database is unreachable, rather than because of the rows"""
+    return isinstance(e, (OperationalError, InterfaceError, TimeoutError)) or getattr(e, "connection_invalidated", False)
+
+
+class WriteBehindBuffer(Generic[T]):
+    """
+    Collect rows in memory and write them in one batch when the buffer is full or the interval elapsed.
+    Rows still buffered when the process dies are lost, so only use it for data the client can resend.
+    At most max_rows are held while the database is unreachable, `add` refuses more so callers can
+    ask clients to retry. Rows the database refuses are dropped one by one, so they do not block the rest.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[T], Session], None],
+        max_size: int = 500,
+        interval: float = 0.5,
+        max_rows: int = 10_000,
+    ):
+        self.write = write
+        self.max_size = max_size
+        self.interval = interval
+        self.max_rows = max_rows
+        self.rows: list[T] = []
+        self.written = 0
+        self.dropped = 0
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._lock: asyncio.Lock | None = None
+
+    def add(self, rows: list[T]) -> bool:
+        """Buffer rows for the next flush, False when the buffer is full and the rows were not taken"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+        if len(self.rows) + len(rows) > self.max_rows:
+            return False
+        self.rows.extend(rows)
+        if len(self.rows) >= self.max_size:
+            self._wakeup.set()
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write behind flush failed, {len(self.rows)} rows kept for retry: {e}")
+
+    async def flush(self):
+        if self._lock is None:
+            return
+        async with self._lock:
+            if not self.rows:
+                return
+            rows = self.rows
+            self.rows = []
+            try:
+                await asyncio.to_thread(self._write, rows)
+                self.written += len(rows)
+                return
+            except Exception as e:
+                if is_transient(e):
+                    # Put the rows back in front so they keep their order
+                    self.rows[:0] = rows
+                    raise
+                logger.warning(f"Write behind batch of {len(rows)} rows refused, writing them one by one: {e}")
+            left = await asyncio.to_thread(self._write_each, rows)
+            if left:
+                self.rows[:0] = left
+                raise ConnectionError(f"database unreachable, {len(left)} rows kept for retry")
+
+    def _write(self, rows: list[T]):
+        with session_make() as s:
+            self.write(rows, s)
+
+    def _write_each(self, rows: list[T]) -> list[T]:
+        """Write rows one at a time and drop the ones refused, return the rest once the database is unreachable"""
+        for i, row in enumerate(rows):
+            try:
+                self._write([row])
+            except Exception as e:
+                if is_transient(e):
+                    return rows[i:]
+                self.dropped += 1
+                logger.error(f"Write behind dropped a row the database refused: {e}")
+            else:
+                self.written += 1
+        return []
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response
 from fastapi_pagination import Page
 from fastapi_pagination.ext.sqlmodel import paginate
-from app.model.chat.chat_history import ChatHistoryOut, ChatHistoryIn, ChatHistory, ChatHistoryUpdate
+from app.model.chat.chat_history import ChatHistoryOut, ChatHistoryIn, ChatHistory, ChatHistoryUpdate, ChatStatus
+from app.model.chat.chat_step_archive import compact_task_steps
 from fastapi_babel import _
 from sqlmodel import Session, select, desc
 from app.component.auth import Auth, auth_must
@@ -38,7 +39,11 @@ def delete_chat_history(history_id: str, session: Session = Depends(session)):
 
 @router.put("/history/{history_id}", name="update chat history", response_model=ChatHistoryOut)
 def update_chat_history(
-    history_id: int, data: ChatHistoryUpdate, session: Session = Depends(session), auth: Auth = Depends(auth_must)
+    history_id: int,
+    data: ChatHistoryUpdate,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(session),
+    auth: Auth = Depends(auth_must),
 ):
     history = session.exec(select(ChatHistory).where(ChatHistory.id == history_id)).first()
     if not history:
@@ -46,7 +51,10 @@ def update_chat_history(
     if history.user_id != auth.user.id:
         raise HTTPException(status_code=403, detail="You are not allowed to update this chat history")
     update_data = data.model_dump(exclude_unset=True)
+    finished = history.status != ChatStatus.done and update_data.get("status") == ChatStatus.done
     history.update_fields(update_data)
     history.save(session)
     session.refresh(history)
+    if finished:
+        background_tasks.add_task(compact_task_steps, history.task_id)
     return history
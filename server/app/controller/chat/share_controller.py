@@ -1,8 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlmodel import Session, asc, select
+from sqlmodel import Session, select
 from app.component.database import session
-import json
-import asyncio
 from itsdangerous import SignatureExpired, BadTimeSignature
 from starlette.responses import StreamingResponse
 from app.model.chat.chat_share import ChatHistoryShareOut, ChatShare, ChatShareIn
@@ -32,7 +30,7 @@ def get_share_info(token: str, session: Session = Depends(session)):
 
 
 @router.get("/share/playback/{token}", name="Playback shared chat via SSE")
-async def share_playback(token: str, session: Session = Depends(session), delay_time: float = 0):
+async def share_playback(token: str, delay_time: float = 0):
     """
     Playbacks the chat history via a sharing token (SSE).
     delay_time: control sse interval, max 5 seconds
@@ -46,27 +44,9 @@ async def share_playback(token: str, session: Session = Depends(session), delay_
     except BadTimeSignature:
         raise HTTPException(status_code=400, detail="Share link is invalid.")
 
-    async def event_generator():
-        stmt = select(ChatStep).where(ChatStep.task_id == task_id).order_by(asc(ChatStep.id))
-        steps = session.exec(stmt).all()
-
-        if not steps:
-            yield f"data: {json.dumps({'error': 'No steps found for this task.'})}\n\n"
-            return
-
-        for step in steps:
-            step_data = {
-                "id": step.id,
-                "task_id": step.task_id,
-                "step": step.step,
-                "data": step.data,
-                "created_at": step.created_at.isoformat() if step.created_at else None,
-            }
-            yield f"data: {json.dumps(step_data)}\n\n"
-            if delay_time > 0 and step.step != "create_agent":
-                await asyncio.sleep(delay_time)
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return StreamingResponse(
+        ChatStep.playback(task_id, delay_time, no_delay_steps=("create_agent",)), media_type="text/event-stream"
+    )
 
 
 @router.post("/share", name="Generate sharable link for a task(1 day expiration)")
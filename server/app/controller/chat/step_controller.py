@@ -1,16 +1,34 @@
-import asyncio
-import json
 from typing import List, Optional
 from fastapi import Depends, HTTPException, Query, Response, APIRouter
 from fastapi.responses import StreamingResponse
-from sqlmodel import Session, asc, select
+from sqlmodel import Session, select
 from app.component.database import session
+from app.component.environment import env
+from app.component.write_behind import WriteBehindBuffer
 from app.component.auth import Auth, auth_must
 from fastapi_babel import _
-from app.model.chat.chat_step import ChatStep, ChatStepOut, ChatStepIn
+from app.model.chat.chat_step import ChatStep, ChatStepOut, ChatStepIn, ChatStepBatchIn
+from app.model.chat.chat_step_archive import ChatStepArchive, ChatStepArchiveStats
 
 router = APIRouter(prefix="/chat", tags=["Chat Step Management"])
 
+# Optional write-behind buffer for batch ingest, steps are acknowledged before they are stored
+step_buffer: WriteBehindBuffer[ChatStepIn] | None = (
+    WriteBehindBuffer(
+        ChatStep.insert_many,
+        max_size=int(env("chat_step_buffer_size", "500")),
+        interval=float(env("chat_step_buffer_interval", "0.5")),
+        max_rows=int(env("chat_step_buffer_max_rows", "10000")),
+    )
+    if env("chat_step_write_behind") == "on"
+    else None
+)
+
+
+def raise_if_archived(step_id: int, session: Session):
+    if ChatStepArchive.find_step(step_id, session) is not None:
+        raise HTTPException(status_code=409, detail=_("Chat step is archived and can no longer be changed"))
+
 
 @router.get("/steps", name="list chat steps", response_model=List[ChatStepOut])
 async def list_chat_steps(
@@ -22,45 +40,35 @@ async def list_chat_steps(
     if step is not None:
         query = query.where(ChatStep.step == step)
     chat_steps = session.exec(query).all()
+    archive = session.exec(select(ChatStepArchive).where(ChatStepArchive.task_id == task_id)).one_or_none()
+    if archive is not None:
+        archived = [record for record in archive.records() if step is None or record["step"] == step]
+        chat_steps = archived + list(chat_steps)
     return chat_steps
 
 
 @router.get("/steps/playback/{task_id}", name="Playback Chat Step via SSE")
-async def share_playback(
-    task_id: str, delay_time: float = 0, session: Session = Depends(session), auth: Auth = Depends(auth_must)
-):
+async def share_playback(task_id: str, delay_time: float = 0, auth: Auth = Depends(auth_must)):
     """
     Playbacks the chat steps (SSE).
     """
     if delay_time > 5:
         delay_time = 5
 
-    async def event_generator():
-        stmt = select(ChatStep).where(ChatStep.task_id == task_id).order_by(asc(ChatStep.id))
-        steps = session.exec(stmt).all()
+    return StreamingResponse(ChatStep.playback(task_id, delay_time), media_type="text/event-stream")
 
-        if not steps:
-            yield f"data: {json.dumps({'error': 'No steps found for this task.'})}\n\n"
-            return
 
-        for step in steps:
-            step_data = {
-                "id": step.id,
-                "task_id": step.task_id,
-                "step": step.step,
-                "data": step.data,
-                "created_at": step.created_at.isoformat() if step.created_at else None,
-            }
-            yield f"data: {json.dumps(step_data)}\n\n"
-            if delay_time > 0:
-                await asyncio.sleep(delay_time)
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+@router.get("/steps/archive/stats", name="chat step archive stats", response_model=ChatStepArchiveStats)
+async def chat_step_archive_stats(session: Session = Depends(session), auth: Auth = Depends(auth_must)):
+    return ChatStepArchive.stats(session)
 
 
 @router.get("/steps/{step_id}", name="get chat step", response_model=ChatStepOut)
 async def get_chat_step(step_id: int, session: Session = Depends(session), auth: Auth = Depends(auth_must)):
     chat_step = session.get(ChatStep, step_id)
+    if not chat_step:
+        # Steps of compacted tasks only live in the archive
+        chat_step = ChatStepArchive.find_step(step_id, session)
     if not chat_step:
         raise HTTPException(status_code=404, detail=_("Chat step not found"))
     return chat_step
@@ -80,12 +88,26 @@ async def create_chat_step(step: ChatStepIn, session: Session = Depends(session)
     return {"code": 200, "msg": "success"}
 
 
+@router.post("/steps/batch", name="create chat steps in batch")
+# TODO Limit request sources
+async def create_chat_steps(batch: ChatStepBatchIn, session: Session = Depends(session)):
+    steps = batch.rows()
+    if step_buffer is not None:
+        if not step_buffer.add(steps):
+            # The database is behind, the client keeps the steps and retries
+            raise HTTPException(status_code=503, detail=_("Chat step buffer is full, retry later"))
+    else:
+        ChatStep.insert_many(steps, session)
+    return {"code": 200, "msg": "success", "count": len(steps)}
+
+
 @router.put("/steps/{step_id}", name="update chat step", response_model=ChatStepOut)
 async def update_chat_step(
     step_id: int, chat_step_update: ChatStep, session: Session = Depends(session), auth: Auth = Depends(auth_must)
 ):
     db_chat_step = session.get(ChatStep, step_id)
     if not db_chat_step:
+        raise_if_archived(step_id, session)
         raise HTTPException(status_code=404, detail=_("Chat step not found"))
     for key, value in chat_step_update.dict(exclude_unset=True).items():
         setattr(db_chat_step, key, value)
@@ -99,6 +121,7 @@ async def update_chat_step(
 async def delete_chat_step(step_id: int, session: Session = Depends(session), auth: Auth = Depends(auth_must)):
     db_chat_step = session.get(ChatStep, step_id)
     if not db_chat_step:
+        raise_if_archived(step_id, session)
         raise HTTPException(status_code=404, detail=_("Chat step not found"))
     session.delete(db_chat_step)
     session.commit()
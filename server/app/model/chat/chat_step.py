@@ -1,4 +1,8 @@
-from sqlmodel import SQLModel, Field, JSON
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator
+from sqlalchemy import Index, insert
+from sqlmodel import SQLModel, Field, JSON, Session, asc, select
 from app.model.abstract.model import AbstractModel, DefaultTimes
 from pydantic import BaseModel
 from typing import Any
@@ -7,6 +11,8 @@ import json
 
 
 class ChatStep(AbstractModel, DefaultTimes, table=True):
+    __table_args__ = (Index("ix_chat_step_task_id_id", "task_id", "id"),)
+
     id: int = Field(default=None, primary_key=True)
     task_id: str = Field(index=True)
     step: str
@@ -29,6 +35,75 @@ class ChatStep(AbstractModel, DefaultTimes, table=True):
                 return v
         return v
 
+    @classmethod
+    def insert_many(cls, steps: list["ChatStepIn"], s: Session):
+        """Insert steps in order with a single multi-row INSERT"""
+        if not steps:
+            return
+        now = datetime.now()
+        s.execute(
+            insert(cls),
+            [
+                {"task_id": step.task_id, "step": step.step, "data": step.data, "created_at": now, "updated_at": now}
+                for step in steps
+            ],
+        )
+        s.commit()
+
+    @classmethod
+    def page(cls, task_id: str, after_id: int = 0, limit: int = 100) -> list["ChatStep"]:
+        """Next page of steps after after_id, keyset on (task_id, id) with a short lived session"""
+        from app.component.database import session_make
+
+        with session_make() as s:
+            stmt = (
+                select(cls)
+                .where(cls.task_id == task_id, cls.id > after_id)
+                .order_by(asc(cls.id))
+                .limit(limit)
+            )
+            return list(s.exec(stmt).all())
+
+    @classmethod
+    async def playback(
+        cls, task_id: str, delay_time: float = 0, no_delay_steps: tuple[str, ...] = (), page_size: int = 100
+    ) -> AsyncIterator[str]:
+        """
+        Stream the steps of a task as SSE frames page by page,
+        only one page is held in memory and no connection is kept between pages.
+        """
+        from app.model.chat.chat_step_archive import ChatStepArchive
+
+        after_id = 0
+        # Finished tasks may be compacted into an archive, steps synced after that are still rows.
+        # Archived rows are deleted, so every live row is read, even one committed late with a lower id
+        archive = await asyncio.to_thread(ChatStepArchive.get, task_id)
+        if archive is not None:
+            for record in archive.records():
+                yield f"data: {json.dumps(record)}\n\n"
+                if delay_time > 0 and record["step"] not in no_delay_steps:
+                    await asyncio.sleep(delay_time)
+        while True:
+            steps = await asyncio.to_thread(cls.page, task_id, after_id, page_size)
+            if not steps:
+                if after_id == 0 and archive is None:
+                    yield f"data: {json.dumps({'error': 'No steps found for this task.'})}\n\n"
+                return
+            for step in steps:
+                step_data = {
+                    "id": step.id,
+                    "task_id": step.task_id,
+                    "step": step.step,
+                    "data": step.data,
+                    "created_at": step.created_at.isoformat() if step.created_at else None,
+                }
+                yield f"data: {json.dumps(step_data)}\n\n"
+                if delay_time > 0 and step.step not in no_delay_steps:
+                    await asyncio.sleep(delay_time)
+            if len(steps) < page_size:
+                return
+            after_id = steps[-1].id
+
 
 class ChatStepIn(BaseModel):
     task_id: str
@@ -36,6 +111,29 @@ class ChatStepIn(BaseModel):
     data: Any
 
 
+class ChatStepData(BaseModel):
+    step: str
+    data: Any
+
+
+class ChatStepTaskBatch(BaseModel):
+    task_id: str
+    steps: list[ChatStepData]
+
+
+class ChatStepBatchIn(BaseModel):
+    """Steps grouped by task, so the task id is sent once per task instead of in every step"""
+
+    tasks: list[ChatStepTaskBatch]
+
+    def rows(self) -> list[ChatStepIn]:
+        return [
+            ChatStepIn(task_id=task.task_id, step=step.step, data=step.data)
+            for task in self.tasks
+            for step in task.steps
+        ]
+
+
 class ChatStepOut(BaseModel):
     id: int
     task_id: str
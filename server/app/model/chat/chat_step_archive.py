@@ -0,0 +1,212 @@
+import bisect
+import heapq
+import json
+import struct
+import zlib
+from datetime import datetime, timedelta
+from typing import Iterator
+from loguru import logger
+from sqlalchemy import Integer, LargeBinary, delete
+from sqlmodel import Column, Field, JSON, Session, func, select
+from app.component.database import session_make
+from app.component.environment import env
+from app.model.abstract.model import AbstractModel, DefaultTimes
+from app.model.chat.chat_step import ChatStep
+from pydantic import BaseModel
+
+# Steps per compressed chunk, playback only inflates one chunk at a time
+CHUNK_STEPS = 256
+
+
+def batched(records: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ChatStepArchive(AbstractModel, DefaultTimes, table=True):
+    """
+    Steps of a finished or idle task packed into one blob.
+    The blob is a sequence of zlib compressed chunks, each chunk holds length-prefixed JSON step records
+    and `chunks` indexes them as [first_step_id, offset, length] in blob order.
+    """
+
+    id: int = Field(default=None, primary_key=True)
+    task_id: str = Field(index=True, unique=True)
+    step_count: int = Field(default=0)
+    first_step_id: int = Field(default=0, sa_column=Column(Integer, server_default="0", index=True))
+    last_step_id: int = Field(default=0)
+    raw_bytes: int = Field(default=0, sa_column=Column(Integer, server_default="0"))
+    compressed_bytes: int = Field(default=0, sa_column=Column(Integer, server_default="0"))
+    chunks: list = Field(default=[], sa_type=JSON)
+    blob: bytes = Field(sa_column=Column(LargeBinary))
+
+    @classmethod
+    def compact(cls, task_id: str, s: Session) -> "ChatStepArchive | None":
+        """
+        Pack the live steps of a task into its archive and delete the packed rows, in one transaction.
+        A task that already has an archive gets the new steps appended as further chunks. A step
+        committed late with an id below the archived ones makes the whole archive be repacked, so the
+        chunks stay in id order and do not overlap.
+        """
+        archive = s.exec(select(cls).where(cls.task_id == task_id)).one_or_none()
+        if not ChatStep.exists(ChatStep.task_id == task_id, s=s):
+            return None
+        late = archive is not None and ChatStep.exists(
+            ChatStep.task_id == task_id, ChatStep.id <= archive.last_step_id, s=s
+        )
+        if archive is None or late:
+            records = cls._live_records(task_id, s)
+            if late:
+                records = heapq.merge(archive.records(), records, key=lambda record: record["id"])
+            blob, chunks, raw_bytes, step_count = bytearray(), [], 0, 0
+        else:
+            records = cls._live_records(task_id, s)
+            blob, chunks = bytearray(archive.blob), list(archive.chunks)
+            raw_bytes, step_count = archive.raw_bytes, archive.step_count
+        for steps in batched(records, CHUNK_STEPS):
+            chunk = bytearray()
+            for step in steps:
+                record = json.dumps(
+                    {key: step[key] for key in ("id", "step", "data", "created_at")}, ensure_ascii=False
+                ).encode()
+                chunk += struct.pack(">I", len(record)) + record
+            compressed = zlib.compress(bytes(chunk), 6)
+            chunks.append([steps[0]["id"], len(blob), len(compressed)])
+            blob += compressed
+            raw_bytes += len(chunk)
+            step_count += len(steps)
+        if archive is None:
+            archive = cls(task_id=task_id)
+        archive.first_step_id = chunks[0][0]
+        archive.last_step_id = steps[-1]["id"]
+        archive.step_count = step_count
+        archive.raw_bytes = raw_bytes
+        archive.compressed_bytes = len(blob)
+        archive.chunks = chunks
+        archive.blob = bytes(blob)
+        s.add(archive)
+        s.commit()
+        s.refresh(archive)
+        return archive
+
+    @staticmethod
+    def _live_records(task_id: str, s: Session) -> Iterator[dict]:
+        """Live steps of a task in id order as archive records, each page is deleted once it is read"""
+        after_id = 0
+        while True:
+            steps = ChatStep.by(
+                ChatStep.task_id == task_id, ChatStep.id > after_id, order_by=ChatStep.id, limit=CHUNK_STEPS, s=s
+            ).all()
+            if not steps:
+                return
+            # Delete exactly the packed rows, steps still arriving for the task stay live
+            s.exec(delete(ChatStep).where(ChatStep.id.in_([step.id for step in steps])))
+            for step in steps:
+                yield {
+                    "id": step.id,
+                    "step": step.step,
+                    "data": step.data,
+                    "created_at": step.created_at.isoformat() if step.created_at else None,
+                }
+            after_id = steps[-1].id
+
+    @classmethod
+    def idle_task_ids(cls, idle: timedelta, s: Session) -> list[str]:
+        """Tasks with live steps and no new step for `idle`, whether or not they were marked done"""
+        cutoff = datetime.now() - idle
+        return list(
+            s.exec(select(ChatStep.task_id).group_by(ChatStep.task_id).having(func.max(ChatStep.created_at) < cutoff)).all()
+        )
+
+    @classmethod
+    def find_step(cls, step_id: int, s: Session) -> dict | None:
+        """An archived step by id, only the chunk that can hold it is inflated"""
+        archives = s.exec(select(cls).where(cls.first_step_id <= step_id, cls.last_step_id >= step_id)).all()
+        for archive in archives:
+            index = bisect.bisect_right([first_id for first_id, _, _ in archive.chunks], step_id) - 1
+            if index < 0:
+                continue
+            _, offset, length = archive.chunks[index]
+            for record in archive._chunk_records(offset, length):
+                if record["id"] == step_id:
+                    return record
+        return None
+
+    @classmethod
+    def get(cls, task_id: str) -> "ChatStepArchive | None":
+        with session_make() as s:
+            return s.exec(select(cls).where(cls.task_id == task_id)).one_or_none()
+
+    def records(self) -> Iterator[dict]:
+        """Decode the archived steps in id order, one chunk at a time"""
+        for _, offset, length in self.chunks:
+            yield from self._chunk_records(offset, length)
+
+    def _chunk_records(self, offset: int, length: int) -> Iterator[dict]:
+        chunk = zlib.decompress(self.blob[offset : offset + length])
+        pos = 0
+        while pos < len(chunk):
+            (size,) = struct.unpack_from(">I", chunk, pos)
+            pos += 4
+            record = json.loads(chunk[pos : pos + size])
+            pos += size
+            yield {"id": record["id"], "task_id": self.task_id, **record}
+
+    @classmethod
+    def stats(cls, s: Session) -> dict:
+        tasks, steps, raw_bytes, compressed_bytes = s.exec(
+            select(
+                func.count(cls.id),
+                func.coalesce(func.sum(cls.step_count), 0),
+                func.coalesce(func.sum(cls.raw_bytes), 0),
+                func.coalesce(func.sum(cls.compressed_bytes), 0),
+            )
+        ).one()
+        return {
+            "tasks": tasks,
+            "steps": steps,
+            "raw_bytes": raw_bytes,
+            "compressed_bytes": compressed_bytes,
+            "saved_bytes": raw_bytes - compressed_bytes,
+            "ratio": round(compressed_bytes / raw_bytes, 4) if raw_bytes else None,
+        }
+
+
+class ChatStepArchiveStats(BaseModel):
+    tasks: int
+    steps: int
+    raw_bytes: int
+    compressed_bytes: int
+    saved_bytes: int
+    ratio: float | None
+
+
+def compact_task_steps(task_id: str):
+    """Background job run when a chat history is done and for tasks left idle"""
+    with session_make() as s:
+        try:
+            archive = ChatStepArchive.compact(task_id, s)
+        except Exception as e:
+            s.rollback()
+            logger.error(f"Failed to compact steps of task {task_id}: {e}")
+            return
+        if archive is not None:
+            logger.info(
+                f"Compacted {archive.step_count} steps of task {task_id}: "
+                f"{archive.raw_bytes} -> {archive.compressed_bytes} bytes"
+            )
+
+
+def compact_idle_task_steps():
+    """Compact the steps of tasks that stopped receiving steps, most never get marked done"""
+    idle = timedelta(hours=float(env("chat_step_compact_idle_hours", "24")))
+    with session_make() as s:
+        task_ids = ChatStepArchive.idle_task_ids(idle, s)
+    for task_id in task_ids:
+        compact_task_steps(task_id)
@@ -38,6 +38,31 @@ if public_dir and os.path.isdir(public_dir):
 else:
     logger.warning("Skipping /public mount because public directory is unavailable")
 
+@api.on_event("startup")
+async def schedule_chat_step_compaction():
+    import asyncio
+    from app.model.chat.chat_step_archive import compact_idle_task_steps
+
+    async def compact_periodically():
+        while True:
+            await asyncio.sleep(float(env("chat_step_compact_interval", "3600")))
+            try:
+                await asyncio.to_thread(compact_idle_task_steps)
+            except Exception as e:
+                logger.error(f"Failed to compact idle task steps: {e}")
+
+    # Keep a reference so the task is not garbage collected
+    api.state.chat_step_compaction = asyncio.create_task(compact_periodically())
+
+
+@api.on_event("shutdown")
+async def flush_chat_steps():
+    from app.controller.chat.step_controller import step_buffer
+
+    if step_buffer is not None:
+        await step_buffer.close()
+
+
 logger.add(
     "runtime/log/app.log",
     rotation="10 MB",
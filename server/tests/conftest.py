@@ -0,0 +1,42 @@
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The engine is created from the environment when app.component.database is first imported
+os.environ["database_url"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'test.db'}"
+os.environ.setdefault("secret_key", "test")
+
+from sqlmodel import Session  # noqa: E402
+from app.component.database import engine  # noqa: E402
+from app.model.chat.chat_step import ChatStep  # noqa: E402
+from app.model.chat.chat_history import ChatHistory  # noqa: E402
+from app.model.chat.chat_step_archive import ChatStepArchive  # noqa: E402
+
+TABLES = [ChatStep.__table__, ChatStepArchive.__table__, ChatHistory.__table__]
+# Never reuse the ids of deleted steps, like the serial ids of the production database
+ChatStep.__table__.dialect_kwargs["sqlite_autoincrement"] = True
+
+
+@pytest.fixture
+def session():
+    """A session on empty chat step tables."""
+    for table in TABLES:
+        table.drop(engine, checkfirst=True)
+        table.create(engine)
+    with Session(engine) as s:
+        yield s
+
+
+@pytest.fixture
+def add_steps(session):
+    """Insert steps of a task, returning their ids."""
+
+    def add(task_id: str, count: int, start: int = 0) -> list[int]:
+        steps = [ChatStep(task_id=task_id, step="notice", data={"index": start + i}) for i in range(count)]
+        session.add_all(steps)
+        session.commit()
+        return [step.id for step in steps]
+
+    return add
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.component.write_behind import WriteBehindBuffer
+
+
+class Database:
+    """Records written rows, refusing the rows in `bad` and every write while `down`."""
+
+    def __init__(self, bad=()):
+        self.rows = []
+        self.bad = set(bad)
+        self.down = False
+
+    def write(self, rows, s):
+        if self.down:
+            raise OperationalError("INSERT", {}, Exception("connection refused"))
+        if self.bad & set(rows):
+            raise IntegrityError("INSERT", {}, Exception("constraint failed"))
+        self.rows.extend(rows)
+
+
+@pytest.mark.unit
+class TestWriteBehindBuffer:
+    """Test cases for the write-behind row buffer."""
+
+    def test_rows_are_written_in_order(self):
+        """Test that buffered rows are written in one batch on flush."""
+        db = Database()
+
+        async def run():
+            buffer = WriteBehindBuffer(db.write, interval=60)
+            assert buffer.add([1, 2])
+            assert buffer.add([3])
+            await buffer.close()
+            return buffer
+
+        buffer = asyncio.run(run())
+
+        assert db.rows == [1, 2, 3]
+        assert buffer.written == 3
+
+    def test_full_buffer_refuses_rows(self):
+        """Test that add refuses rows beyond max_rows instead of growing without bound."""
+        db = Database()
+        db.down = True
+
+        async def run():
+            buffer = WriteBehindBuffer(db.write, interval=60, max_rows=3)
+            assert buffer.add([1, 2])
+            assert not buffer.add([3, 4])
+            assert buffer.add([3])
+            buffer._task.cancel()
+            return buffer
+
+        assert asyncio.run(run()).rows == [1, 2, 3]
+
+    def test_rows_are_kept_while_the_database_is_down(self):
+        """Test that a failed flush keeps the rows in order for the next one."""
+        db = Database()
+        db.down = True
+
+        async def run():
+            buffer = WriteBehindBuffer(db.write, interval=60)
+            buffer.add([1, 2])
+            with pytest.raises(OperationalError):
+                await buffer.flush()
+            buffer.add([3])
+            db.down = False
+            await buffer.close()
+            return buffer
+
+        asyncio.run(run())
+
+        assert db.rows == [1, 2, 3]
+
+    def test_refused_rows_are_dropped(self):
+        """Test that a row the database refuses is dropped and does not block the others."""
+        db = Database(bad={2})
+
+        async def run():
+            buffer = WriteBehindBuffer(db.write, interval=60)
+            buffer.add([1, 2, 3])
+            await buffer.flush()
+            buffer.add([4])
+            await buffer.close()
+            return buffer
+
+        buffer = asyncio.run(run())
+
+        assert db.rows == [1, 3, 4]
+        assert buffer.dropped == 1
+        assert buffer.rows == []
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_babel import BabelMiddleware
+from sqlmodel import select
+
+from app.component.auth import auth_must
+from app.component.babel import babel_configs
+from app.component.database import session as session_dependency
+from app.component.write_behind import WriteBehindBuffer
+from app.controller.chat import history_controller, step_controller
+from app.model.chat.chat_history import ChatHistory, ChatStatus
+from app.model.chat.chat_step import ChatStep
+from app.model.chat.chat_step_archive import ChatStepArchive
+
+
+@pytest.fixture
+def client(session):
+    app = FastAPI()
+    app.add_middleware(BabelMiddleware, babel_configs=babel_configs)
+    app.include_router(step_controller.router)
+    app.include_router(history_controller.router)
+    app.dependency_overrides[session_dependency] = lambda: session
+    app.dependency_overrides[auth_must] = lambda: SimpleNamespace(user=SimpleNamespace(id=1))
+    return TestClient(app)
+
+
+@pytest.mark.unit
+class TestArchivedSteps:
+    """Test cases for chat step endpoints on compacted tasks."""
+
+    def test_get_falls_back_to_archive(self, client, session, add_steps):
+        """Test that an archived step is still served by id."""
+        ids = add_steps("task_1", 2)
+        ChatStepArchive.compact("task_1", session)
+
+        res = client.get(f"/chat/steps/{ids[1]}")
+
+        assert res.status_code == 200
+        assert res.json()["data"] == {"index": 1}
+        assert client.get("/chat/steps/999").status_code == 404
+
+    def test_archived_steps_cannot_be_changed(self, client, session, add_steps):
+        """Test that updating or deleting an archived step is a conflict, not a missing step."""
+        ids = add_steps("task_1", 1)
+        ChatStepArchive.compact("task_1", session)
+
+        update = {"task_id": "task_1", "step": "x", "data": 1}
+        assert client.put(f"/chat/steps/{ids[0]}", json=update).status_code == 409
+        assert client.delete(f"/chat/steps/{ids[0]}").status_code == 409
+        assert client.delete("/chat/steps/999").status_code == 404
+
+    def test_list_returns_archived_then_live_steps(self, client, session, add_steps):
+        """Test that listing a compacted task returns its archived and newer live steps."""
+        first = add_steps("task_1", 2)
+        ChatStepArchive.compact("task_1", session)
+        later = add_steps("task_1", 1, start=2)
+
+        res = client.get("/chat/steps", params={"task_id": "task_1"})
+
+        assert [step["id"] for step in res.json()] == first + later
+
+    def test_finishing_a_history_compacts_its_steps(self, client, session, add_steps):
+        """Test that marking a chat history done packs the steps of its task."""
+        add_steps("task_1", 3)
+        history = ChatHistory(
+            user_id=1,
+            task_id="task_1",
+            question="q",
+            language="en",
+            model_platform="openai",
+            model_type="gpt-4o",
+            api_key="",
+            api_url="",
+            installed_mcp="{}",
+        )
+        session.add(history)
+        session.commit()
+
+        res = client.put(f"/chat/history/{history.id}", json={"status": ChatStatus.done.value})
+
+        assert res.status_code == 200
+        session.expire_all()
+        assert session.exec(select(ChatStep)).all() == []
+        assert ChatStepArchive.get("task_1").step_count == 3
+
+
+@pytest.mark.unit
+class TestBatchSteps:
+    """Test cases for the batch step ingest endpoint."""
+
+    body = {"tasks": [{"task_id": "task_1", "steps": [{"step": "a", "data": 1}, {"step": "b", "data": {"x": 2}}]}]}
+
+    def test_batch_is_inserted(self, client, session):
+        """Test that a batch is stored right away without the write-behind buffer."""
+        res = client.post("/chat/steps/batch", json=self.body)
+
+        assert res.json()["count"] == 2
+        assert [(step.task_id, step.step, step.data) for step in session.exec(select(ChatStep)).all()] == [
+            ("task_1", "a", 1),
+            ("task_1", "b", {"x": 2}),
+        ]
+
+    def test_invalid_batch_is_refused(self, client):
+        """Test that a step without a name is a validation error, which the client drops instead of retrying."""
+        res = client.post("/chat/steps/batch", json={"tasks": [{"task_id": "task_1", "steps": [{}]}]})
+
+        assert res.status_code == 422
+
+    def test_full_buffer_is_unavailable(self, client, monkeypatch):
+        """Test that the endpoint asks the client to retry when the write-behind buffer is full."""
+        buffer = WriteBehindBuffer(ChatStep.insert_many, max_rows=1)
+        monkeypatch.setattr(step_controller, "step_buffer", buffer)
+
+        assert client.post("/chat/steps/batch", json=self.body).status_code == 503
+        assert buffer.rows == []
@@ -0,0 +1,37 @@
+import pytest
+from sqlmodel import select
+
+from app.model.chat.chat_step import ChatStep, ChatStepBatchIn, ChatStepIn
+
+
+@pytest.mark.unit
+class TestChatStepInsertMany:
+    """Test cases for the multi-row chat step insert."""
+
+    def test_steps_are_inserted_in_order(self, session):
+        """Test that every step is stored in order with its data decoded on read."""
+        ChatStep.insert_many(
+            [ChatStepIn(task_id="task_1", step="notice", data={"index": i}) for i in range(3)], session
+        )
+
+        steps = session.exec(select(ChatStep).order_by(ChatStep.id)).all()
+
+        assert [step.data for step in steps] == [{"index": i} for i in range(3)]
+        assert all(step.created_at is not None for step in steps)
+
+    def test_empty_batch(self, session):
+        """Test that an empty batch inserts nothing."""
+        ChatStep.insert_many([], session)
+
+        assert session.exec(select(ChatStep)).all() == []
+
+    def test_batch_rows_keep_their_task(self):
+        """Test that steps grouped by task become rows with the task id of their group."""
+        batch = ChatStepBatchIn(
+            tasks=[
+                {"task_id": "task_1", "steps": [{"step": "a", "data": 1}, {"step": "b", "data": 2}]},
+                {"task_id": "task_2", "steps": [{"step": "c", "data": 3}]},
+            ]
+        )
+
+        assert [(row.task_id, row.step) for row in batch.rows()] == [("task_1", "a"), ("task_1", "b"), ("task_2", "c")]
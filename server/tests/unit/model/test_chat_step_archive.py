@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import pytest
+from sqlmodel import select
+
+from app.model.chat import chat_step_archive
+from app.model.chat.chat_step import ChatStep
+from app.model.chat.chat_step_archive import ChatStepArchive
+
+
+def live_ids(session, task_id: str) -> list[int]:
+    return list(session.exec(select(ChatStep.id).where(ChatStep.task_id == task_id).order_by(ChatStep.id)).all())
+
+
+@pytest.mark.unit
+class TestChatStepArchive:
+    """Test cases for packing task steps into a compressed archive."""
+
+    def test_round_trip(self, session, add_steps, monkeypatch):
+        """Test that every packed step reads back in id order over several chunks."""
+        monkeypatch.setattr(chat_step_archive, "CHUNK_STEPS", 4)
+        ids = add_steps("task_1", 10)
+        add_steps("task_2", 2)
+
+        archive = ChatStepArchive.compact("task_1", session)
+
+        assert archive.step_count == 10
+        assert (archive.first_step_id, archive.last_step_id) == (ids[0], ids[-1])
+        assert len(archive.chunks) == 3
+        records = list(archive.records())
+        assert [record["id"] for record in records] == ids
+        assert [record["data"] for record in records] == [{"index": i} for i in range(10)]
+        assert {record["task_id"] for record in records} == {"task_1"}
+        assert live_ids(session, "task_1") == []
+        assert len(live_ids(session, "task_2")) == 2
+
+    def test_find_step_by_id(self, session, add_steps, monkeypatch):
+        """Test that an archived step is found by id and steps of other tasks are not."""
+        monkeypatch.setattr(chat_step_archive, "CHUNK_STEPS", 4)
+        ids = add_steps("task_1", 10)
+        other = add_steps("task_2", 1)
+        ChatStepArchive.compact("task_1", session)
+
+        assert ChatStepArchive.find_step(ids[5], session)["data"] == {"index": 5}
+        assert ChatStepArchive.find_step(ids[-1], session)["id"] == ids[-1]
+        assert ChatStepArchive.find_step(other[0], session) is None
+
+    def test_compact_is_idempotent(self, session, add_steps):
+        """Test that compacting a task with no new steps leaves its archive as it is."""
+        add_steps("task_1", 3)
+        archive = ChatStepArchive.compact("task_1", session)
+        blob, chunks = archive.blob, archive.chunks
+
+        assert ChatStepArchive.compact("task_1", session) is None
+        archive = ChatStepArchive.get("task_1")
+        assert (archive.blob, archive.chunks, archive.step_count) == (blob, chunks, 3)
+
+    def test_new_steps_are_appended(self, session, add_steps):
+        """Test that steps synced after a compaction are appended to the archive."""
+        first = add_steps("task_1", 3)
+        ChatStepArchive.compact("task_1", session)
+        later = add_steps("task_1", 2, start=3)
+
+        archive = ChatStepArchive.compact("task_1", session)
+
+        assert [record["id"] for record in archive.records()] == first + later
+        assert len(archive.chunks) == 2
+        assert archive.step_count == 5
+
+    def test_late_step_is_merged_in_order(self, session, add_steps):
+        """Test that a step committed after compaction with a lower id is archived in id order."""
+        ids = add_steps("task_1", 4)
+        late = session.get(ChatStep, ids[1])
+        session.delete(late)
+        session.commit()
+        ChatStepArchive.compact("task_1", session)
+        session.add(ChatStep(id=ids[1], task_id="task_1", step="notice", data={"index": 1}))
+        session.commit()
+
+        archive = ChatStepArchive.compact("task_1", session)
+
+        assert [record["id"] for record in archive.records()] == ids
+        assert archive.step_count == 4
+        assert ChatStepArchive.find_step(ids[1], session)["data"] == {"index": 1}
+
+    def test_playback_serves_archive_then_live_steps(self, session, add_steps):
+        """Test that playback streams archived steps followed by every live one."""
+        ids = add_steps("task_1", 3)
+        session.delete(session.get(ChatStep, ids[0]))
+        session.commit()
+        ChatStepArchive.compact("task_1", session)
+        session.add(ChatStep(id=ids[0], task_id="task_1", step="notice", data={"index": 0}))
+        later = add_steps("task_1", 1, start=3)
+
+        async def playback():
+            return [json.loads(frame[len("data: ") :]) async for frame in ChatStep.playback("task_1", page_size=1)]
+
+        frames = asyncio.run(playback())
+
+        assert [frame["id"] for frame in frames] == [*ids[1:], ids[0], *later]
+
+    def test_idle_tasks(self, session, add_steps):
+        """Test that only tasks without a recent step are idle."""
+        from datetime import datetime, timedelta
+
+        add_steps("task_1", 1)
+        add_steps("task_2", 1)
+        step = session.exec(select(ChatStep).where(ChatStep.task_id == "task_1")).one()
+        step.created_at = datetime.now() - timedelta(hours=25)
+        session.add(step)
+        session.commit()
+
+        assert ChatStepArchive.idle_task_ids(timedelta(hours=24), session) == ["task_1"]
+
+    def test_stats(self, session, add_steps):
+        """Test that stats add up the archives."""
+        add_steps("task_1", 5)
+        add_steps("task_2", 5)
+        ChatStepArchive.compact("task_1", session)
+        ChatStepArchive.compact("task_2", session)
+
+        stats = ChatStepArchive.stats(session)
+
+        assert stats["tasks"] == 2
+        assert stats["steps"] == 10
+        assert stats["saved_bytes"] == stats["raw_bytes"] - stats["compressed_bytes"]